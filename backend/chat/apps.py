@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class ChatConfig(AppConfig):
     name = 'chat'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
+
+        from core import metrics
+        from . import outbound
+        metrics.register_collector(outbound.collect)
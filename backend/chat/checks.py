@@ -0,0 +1,29 @@
+from django.core.checks import Tags, Warning, register
+
+from .search import missing_fts_triggers
+
+
+@register(Tags.database)
+def fts_triggers_check(app_configs, databases=None, **kwargs):
+    """
+    `manage.py check --database default` (and migrate): the FTS5 sync
+    triggers from migration 0012 must still exist.
+    """
+    errors = []
+    for alias in databases or ():
+        missing = missing_fts_triggers(alias)
+        if missing:
+            # A Warning, not an Error: an Error would block the migrate
+            # that puts them back
+            errors.append(Warning(
+                f"Message search index triggers missing: {', '.join(missing)}",
+                hint=(
+                    "A migration rebuilt chat_message and SQLite dropped its "
+                    "triggers. Add a migration running "
+                    "RunPython(create_fts, drop_fts) from "
+                    "chat/migrations/0012_message_fts.py (idempotent, and it "
+                    "rebuilds the index)."
+                ),
+                id="chat.W001",
+            ))
+    return errors
@@ -0,0 +1,80 @@
+import json
+
+import cbor2
+import msgpack
+
+
+class JSONCodec:
+    """
+    Default: text frames, what every existing client speaks.
+    """
+    subprotocol = "chat.json"
+    binary = False
+
+    def encode(self, payload):
+        return json.dumps(payload)
+
+    def decode(self, data):
+        return json.loads(data)
+
+
+class MsgpackCodec:
+    subprotocol = "chat.msgpack"
+    binary = True
+
+    def encode(self, payload):
+        return msgpack.packb(payload, use_bin_type=True)
+
+    def decode(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+
+class CBORCodec:
+    subprotocol = "chat.cbor"
+    binary = True
+
+    def encode(self, payload):
+        return cbor2.dumps(payload)
+
+    def decode(self, data):
+        return cbor2.loads(data)
+
+
+CODECS = {
+    codec.subprotocol: codec
+    for codec in (JSONCodec(), MsgpackCodec(), CBORCodec())
+}
+DEFAULT_CODEC = CODECS[JSONCodec.subprotocol]
+
+
+def negotiate(requested):
+    """
+    Pick the first subprotocol the client offered that we support.
+    Returns (codec, subprotocol to accept with). Clients offering
+    nothing we know get JSON and no subprotocol header.
+    """
+    for name in requested or ():
+        if name in CODECS:
+            return CODECS[name], name
+    return DEFAULT_CODEC, None
+
+
+def decode_frame(codec, text_data=None, bytes_data=None):
+    """
+    Decode an incoming frame; a text frame is always JSON so a binary
+    client can still fall back. Raises ValueError on garbage.
+    """
+    try:
+        if bytes_data is not None:
+            if not codec.binary:
+                raise ValueError("binary frame without a binary subprotocol")
+            payload = codec.decode(bytes_data)
+        else:
+            payload = DEFAULT_CODEC.decode(text_data)
+    except Exception as exc:
+        # msgpack / cbor2 raise their own exception types
+        raise ValueError(str(exc)) from exc
+
+    if not isinstance(payload, dict):
+        raise ValueError("frame must be an object")
+    return payload
@@ -1,14 +1,25 @@
+from channels.consumer import get_handler_name
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
-from django.contrib.auth import get_user_model
-from django.core.cache import cache
-from django.utils import timezone
+from django.conf import settings
+from django.db.models import Max
+import asyncio
 import json
+import time
+from urllib.parse import parse_qs
 
-from .models import Thread, Message
+from core import metrics
+from users import blocking, presence
+
+from . import codecs, membership, replay
+from .delivery import DeliveryAckBuffer
+from .groups import thread_group_name, user_group_name
+from .models import Message, ThreadWatermark
+from .outbound import OutboundQueue
 from .serializers import MessageSerializer
+from .typing import TypingDebouncer
+from .writer import message_writer
 
-User = get_user_model()
+PRESENCE_HEARTBEAT_INTERVAL = getattr(settings, "PRESENCE_HEARTBEAT_INTERVAL", 30)
 
 
 class EchoConsumer(AsyncWebsocketConsumer):
@@ -33,100 +44,137 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
 
-        self.thread_id = self.scope["url_route"]["kwargs"]["thread_id"]
+        self.thread_id = int(self.scope["url_route"]["kwargs"]["thread_id"])
 
         # 🔐 Thread membership check
-        allowed = await self.is_user_in_thread(self.user.id, self.thread_id)
-        if not allowed:
+        member_ids = await self.get_member_ids(self.thread_id)
+        if self.user.id not in member_ids:
             await self.close()
             return
 
-        self.room_group_name = f"chat_{self.thread_id}"
+        self.open_transport()
+        self.replayed_up_to = {}
+
+        self.room_group_name = thread_group_name(self.thread_id)
 
         # Join group
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
-        )
+        await self.join_group(self.room_group_name)
 
-        # Mark user online
-        await self.mark_messages_delivered(self.user.id, self.thread_id)
+        self.typing = TypingDebouncer(self.emit_typing)
 
+        # Delivery acks are buffered and flushed together
+        self.delivery_acks = DeliveryAckBuffer(self.flush_delivered)
 
-        await self.set_user_online(self.user.id)
+        # Everything already in the thread is now delivered to us
+        latest_id = await self.latest_incoming_message_id(
+            self.user.id, self.thread_id
+        )
+        if latest_id:
+            self.delivery_acks.ack(latest_id)
 
-        await self.accept()
+        # Mark user online (only the first socket flips presence)
+        went_online = await self.set_user_online(self.user.id)
+        if went_online:
+            presence.last_seen_buffer.mark(self.user.id, is_online=True)
+        self.heartbeat_task = asyncio.ensure_future(self.presence_heartbeat())
+
+        await self.accept(self.subprotocol)
 
         # 🔥 BROADCAST ONLINE STATUS
-        await self.channel_layer.group_send(
+        await self.group_send(
             self.room_group_name,
             {
                 "type": "presence_event",
+                "thread_id": self.thread_id,
                 "user_id": self.user.id,
                 "is_online": True,
             }
         )
 
-        await self.send(json.dumps({
+        await self.send_frame({
             "type": "system",
             "msg": f"Connected to chat room {self.thread_id}"
-        }))
+        })
+
+        # 🔁 Reconnect: send only what we missed while away
+        after_id = self.last_message_id()
+        if after_id is not None:
+            await self.replay_missed(self.thread_id, after_id)
 
     # =============================
     # DISCONNECT
     # =============================
     async def disconnect(self, close_code):
-    # Agar user authenticated hai tabhi offline mark karo
-        if getattr(self, "user", None) and self.user.is_authenticated:
-            await self.set_user_offline(self.user.id)
-
-        # 🔥 ONLINE → OFFLINE broadcast (safe)
-        if hasattr(self, "room_group_name"):
-            await self.channel_layer.group_send(
+        went_offline = False
+        self.uncount_socket()
+
+        if hasattr(self, "outbound"):
+            self.outbound.close()
+
+    # Sirf wahi socket offline mark kare jisne online kiya tha
+        if hasattr(self, "heartbeat_task"):
+            self.heartbeat_task.cancel()
+            went_offline = await self.set_user_offline(self.user.id)
+            if went_offline:
+                presence.last_seen_buffer.mark(self.user.id, is_online=False)
+
+        # 🔥 ONLINE → OFFLINE broadcast (last tab closed)
+        if went_offline and hasattr(self, "room_group_name"):
+            await self.group_send(
                 self.room_group_name,
                 {
                     "type": "presence_event",
+                    "thread_id": self.thread_id,
                     "user_id": self.user.id,
                     "is_online": False,
                 }
             )
 
+        # Pending delivery acks flush before we leave the group
+        if hasattr(self, "delivery_acks"):
+            await self.delivery_acks.close()
+
+        # Don't leave a typing indicator on for the others
+        if hasattr(self, "typing"):
+            await self.typing.close()
+
     # 🔐 Group se safely remove karo
         if hasattr(self, "room_group_name"):
-            await self.channel_layer.group_discard(
-                self.room_group_name,
-                self.channel_name
-            )
+            await self.leave_group(self.room_group_name)
 
     # =============================
     # RECEIVE
     # =============================
-    async def receive(self, text_data):
-        data = json.loads(text_data)
+    async def receive(self, text_data=None, bytes_data=None):
+        data = await self.decode_frame(text_data, bytes_data)
+        if data is None:
+            return
         event_type = data.get("type")
 
         # -----------------------------
         # TYPING INDICATOR
         # -----------------------------
         if event_type == "typing":
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "type": "typing_event",
-                    "user_id": self.user.id,
-                    "is_typing": data.get("is_typing", False),
-                }
+            # Debounced: only start/stop transitions are broadcast
+            await self.typing.update(
+                self.thread_id, bool(data.get("is_typing", False))
             )
             return
 
+        # 🚫 Block check (cached block lists, no DB on the hot path)
+        if await self.is_blocked():
+            await self.send_frame({
+                "type": "error",
+                "error": "User blocked"
+            })
+            return
+
         if event_type == "media":
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "type": "chat_message",
-                    "message": data
-                }
-            )
+            if not await self.broadcast_media(self.thread_id, data.get("id")):
+                await self.send_frame({
+                    "type": "error",
+                    "error": "Unknown media message"
+                })
             return
             
         # -----------------------------
@@ -137,42 +185,190 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return
 
         saved_message = await self.save_message(
-            sender_id=self.user.id,
+            sender=self.user,
             thread_id=self.thread_id,
             text=message_text
         )
 
-        await self.channel_layer.group_send(
+        await self.group_send(
             self.room_group_name,
             {
                 "type": "chat_message",
-                "message": saved_message
+                "thread_id": self.thread_id,
+                "message": saved_message,
+                "persisted": True
             }
         )
 
+    # =============================
+    # INSTRUMENTED PLUMBING (core.metrics)
+    # =============================
+    async def dispatch(self, message):
+        # Every handler: connect, receive, group events, disconnect
+        stats, token = metrics.start_query_stats()
+        started = time.perf_counter()
+        try:
+            await super().dispatch(message)
+        finally:
+            metrics.stop_query_stats(token)
+            labels = (type(self).__name__, get_handler_name(message))
+            metrics.ws_handler_seconds.observe(
+                time.perf_counter() - started, *labels
+            )
+            metrics.ws_handler_queries.observe(stats[0], *labels)
+
+    async def accept(self, subprotocol=None, headers=None):
+        await super().accept(subprotocol, headers)
+        self.socket_counted = True
+        metrics.ws_active_sockets.inc(type(self).__name__)
+
+    def uncount_socket(self):
+        if getattr(self, "socket_counted", False):
+            self.socket_counted = False
+            metrics.ws_active_sockets.dec(type(self).__name__)
+
+    async def join_group(self, group_name):
+        await self.channel_layer.group_add(group_name, self.channel_name)
+        metrics.ws_group_memberships.inc()
+
+    async def leave_group(self, group_name):
+        await self.channel_layer.group_discard(group_name, self.channel_name)
+        metrics.ws_group_memberships.dec()
+
+    async def group_send(self, group_name, event):
+        await metrics.timed_group_send(self.channel_layer, group_name, event)
+
+    # =============================
+    # OUTBOUND: codec + bounded queue (per socket)
+    # =============================
+    def open_transport(self):
+        # JSON unless the client offered a binary subprotocol
+        self.codec, self.subprotocol = codecs.negotiate(
+            self.scope.get("subprotocols")
+        )
+
+        # ?batch=1 → client understands {"type": "batch", "frames": [...]}
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        self.outbound = OutboundQueue(
+            self.write_frame,
+            self.close_slow_client,
+            batch=query.get("batch") == ["1"],
+            on_error=self.close_broken_client
+        )
+
+    async def send_frame(self, payload, merge_key=None):
+        # Never blocks on the client: the queue's writer task sends
+        self.outbound.put(payload, merge_key)
+
+    async def write_frame(self, payload):
+        if self.codec.binary:
+            await self.send(bytes_data=self.codec.encode(payload))
+        else:
+            await self.send(text_data=self.codec.encode(payload))
+
+    async def close_slow_client(self):
+        # Stayed over the outbound high-water mark
+        await self.close(code=4008)
+
+    async def close_broken_client(self):
+        # A frame couldn't be encoded or sent (logged by the queue)
+        await self.close(code=1011)
+
+    async def decode_frame(self, text_data, bytes_data):
+        try:
+            return codecs.decode_frame(self.codec, text_data, bytes_data)
+        except ValueError:
+            await self.send_frame({
+                "type": "error",
+                "error": "Invalid frame"
+            })
+            return None
+
+    # =============================
+    # RECONNECT: MISSED-MESSAGE REPLAY (chat.replay)
+    # =============================
+    def last_message_id(self):
+        # ?last_message_id=N → newest message the client already has
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        try:
+            return int(query["last_message_id"][0])
+        except (KeyError, ValueError):
+            return None
+
+    async def replay_missed(self, thread_id, after_id):
+        messages = await self.get_thread_backlog(thread_id, after_id)
+        await self.send_replay(messages, thread_id)
+
+    async def send_replay(self, messages, thread_id=None):
+        if messages is None:
+            # Too far behind: client refetches over REST instead
+            await self.send_frame({"type": "resync", "thread_id": thread_id})
+            return
+
+        for frame in replay.batches(messages):
+            await self.send_frame(frame)
+
+        # Live copies queued while we were replaying are skipped
+        for message in messages:
+            self.replayed_up_to[message["thread"]] = message["id"]
+
+    def already_replayed(self, thread_id, message):
+        up_to = self.replayed_up_to.get(thread_id)
+        return (
+            up_to is not None
+            and message.get("id") is not None
+            and message["id"] <= up_to
+        )
+
     # =============================
     # SEND MESSAGE TO CLIENT
     # =============================
     async def chat_message(self, event):
         message = event["message"]
+        if self.already_replayed(self.thread_id, message):
+            return
 
-    # ✅ Mark delivered
-        await self.mark_delivered(
-            message_id=message["id"],
-            user_id=self.user.id
-        )
-
-        await self.send(json.dumps({
+        await self.send_frame({
             "type": "message",
             **message
-        }))
+        })
+
+    # ✅ Mark delivered (buffered, flushed on a short timer)
+    # Only for rows the server itself saved: ids in anything else
+    # could be forged and would move our watermark arbitrarily
+        sender = message.get("sender") or {}
+        if event.get("persisted") and sender.get("id") != self.user.id:
+            self.delivery_acks.ack(message["id"])
+
+    async def flush_delivered(self, up_to_id):
+        await self.mark_delivered_up_to(self.user.id, self.thread_id, up_to_id)
 
-        await self.channel_layer.group_send(
+        # One aggregated "delivered up to id X" event per flush
+        await self.group_send(
             self.room_group_name,
             {
                 "type": "delivery_event",
-                "message_id": message["id"],
+                "thread_id": self.thread_id,
+                "up_to_id": up_to_id,
+                "user_id": self.user.id,
+            }
+        )
+
+    # Thumbnail / placeholder became ready for a media message
+    async def message_update(self, event):
+        await self.send_frame({
+            "type": "message_update",
+            **event["message"]
+        })
+
+    async def emit_typing(self, thread_id, is_typing):
+        await self.group_send(
+            thread_group_name(thread_id),
+            {
+                "type": "typing_event",
+                "thread_id": thread_id,
                 "user_id": self.user.id,
+                "is_typing": is_typing,
             }
         )
 
@@ -184,11 +380,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
         if event["user_id"] == self.user.id:
             return
 
-        await self.send(json.dumps({
+        await self.send_frame({
             "type": "typing",
             "user_id": event["user_id"],
             "is_typing": event["is_typing"]
-        }))
+        }, merge_key=("typing", event["thread_id"], event["user_id"]))
 
     # SEND ONLINE / OFFLINE EVENT
     async def presence_event(self, event):
@@ -196,77 +392,517 @@ class ChatConsumer(AsyncWebsocketConsumer):
         if event["user_id"] == self.user.id:
             return
 
-        await self.send(json.dumps({
+        await self.send_frame({
             "type": "presence",
             "user_id": event["user_id"],
             "is_online": event["is_online"]
-        }))    
+        }, merge_key=("presence", event["user_id"]))    
 
     async def delivery_event(self, event):
-        await self.send(json.dumps({
+        # apne hi acks wapas mat bhejo
+        if event["user_id"] == self.user.id:
+            return
+
+        await self.send_frame({
             "type": "delivered",
-            "message_id": event["message_id"],
+            "up_to_id": event["up_to_id"],
             "user_id": event["user_id"],
-        }))
+        })
 
     # =============================
-    # DB: SAVE MESSAGE
+    # MEDIA: announce an attachment uploaded over REST
     # =============================
-    @database_sync_to_async
-    def save_message(self, sender_id, thread_id, text):
-        sender = User.objects.get(id=sender_id)
-        thread = Thread.objects.get(id=thread_id)
+    # Rebuilt from the stored row; client JSON is never relayed as-is
+    async def broadcast_media(self, thread_id, message_id):
+        message = await self.get_media_message(thread_id, message_id)
+        if message is None:
+            return False
+
+        await self.group_send(
+            thread_group_name(thread_id),
+            {
+                "type": "chat_message",
+                "thread_id": thread_id,
+                "message": message,
+                "persisted": True
+            }
+        )
+        return True
+
+    @metrics.db_helper
+    def get_media_message(self, thread_id, message_id):
+        if not isinstance(message_id, int) or isinstance(message_id, bool):
+            return None
 
-        msg = Message.objects.create(
+        message = Message.objects.filter(
+            id=message_id,
+            thread_id=thread_id,
+            sender=self.user,
+            attachment__gt=""
+        ).select_related("sender").with_receipts().first()
+
+        return MessageSerializer(message).data if message else None
+
+    # =============================
+    # DB: SAVE MESSAGE
+    # =============================
+    # Group-committed with other consumers' messages (chat.writer)
+    async def save_message(self, sender, thread_id, text):
+        return await message_writer.submit(
             sender=sender,
-            thread=thread,
+            thread_id=int(thread_id),
             text=text
         )
 
-        return MessageSerializer(msg).data
-
     # =============================
     # SECURITY: THREAD CHECK
     # =============================
-    @database_sync_to_async
-    def is_user_in_thread(self, user_id, thread_id):
-        return Thread.objects.filter(
-            id=thread_id,
-            members__id=user_id
-        ).exists()
+    @metrics.db_helper
+    def get_member_ids(self, thread_id):
+        return membership.member_ids(thread_id)
+
+    @metrics.db_helper
+    def is_blocked(self):
+        # Current members, not the connect-time list: someone added
+        # since then must be checked too (member_ids is cached and
+        # invalidated on membership changes)
+        return blocking.any_blocked(
+            self.user.id, membership.member_ids(self.thread_id)
+        )
 
     # =============================
     # ONLINE / OFFLINE HELPERS
     # =============================
-    @database_sync_to_async
+    # Refcounted in the cache; last_seen is flushed to the DB in batches
+    @metrics.db_helper
     def set_user_online(self, user_id):
-        User.objects.filter(id=user_id).update(
-            is_online=True,
-            last_seen=timezone.now()
-        )
-        cache.set(f"user_online_{user_id}", True)
+        return presence.connect(user_id, self.channel_name)
 
-    @database_sync_to_async
+    @metrics.db_helper
     def set_user_offline(self, user_id):
-        User.objects.filter(id=user_id).update(
-            is_online=False,
-            last_seen=timezone.now()
-        )
-        cache.delete(f"user_online_{user_id}")
+        return presence.disconnect(user_id, self.channel_name)
 
-    @database_sync_to_async
-    def mark_messages_delivered(self, user_id, thread_id):
-        user = User.objects.get(id=user_id)
-        thread = Thread.objects.get(id=thread_id)
+    async def presence_heartbeat(self):
+        while True:
+            await asyncio.sleep(PRESENCE_HEARTBEAT_INTERVAL)
+            await metrics.db_helper(presence.heartbeat)(
+                self.user.id, self.channel_name
+            )
 
-        messages = Message.objects.filter(
-            thread=thread
-        ).exclude(
-            sender=user
+    # =============================
+    # DELIVERY RECEIPTS
+    # =============================
+    @metrics.db_helper
+    def latest_incoming_message_id(self, user_id, thread_id):
+        return Message.objects.filter(
+            thread_id=thread_id
         ).exclude(
-            delivered_to=user
+            sender_id=user_id
+        ).aggregate(latest=Max("id"))["latest"]
+
+    @metrics.db_helper
+    def mark_delivered_up_to(self, user_id, thread_id, message_id):
+        ThreadWatermark.objects.advance_delivered(thread_id, user_id, message_id)
+
+    @metrics.db_helper
+    def get_thread_backlog(self, thread_id, after_id):
+        return replay.thread_backlog(thread_id, self.user.id, after_id)
+
+
+class MultiplexChatConsumer(ChatConsumer):
+    """
+    One socket per user carrying all of their threads.
+
+    Joins every thread group the user belongs to plus the user's own
+    group (new threads arrive there). Client frames name their thread:
+      {"type": "subscribe" | "unsubscribe", "thread_id": 5}
+      {"type": "subscribe", "thread_id": 5, "last_message_id": 120}
+      {"type": "message", "thread_id": 5, "message": "hi"}
+      {"type": "typing", "thread_id": 5, "is_typing": true}
+      {"type": "media", "thread_id": 5, ...}
+    and every server frame carries "thread_id", except "replay": its
+    messages span threads and each names its own ("thread").
+    Reconnecting with ?last_message_id=N replays what every thread
+    missed after N (message ids are global); if that is too much, each
+    thread that missed something gets its own "resync" frame instead.
+    """
+
+    # =============================
+    # CONNECT
+    # =============================
+    async def connect(self):
+        self.user = self.scope.get("user")
+
+        # 🔐 Auth check
+        if not self.user or not self.user.is_authenticated:
+            await self.close()
+            return
+
+        self.open_transport()
+        self.replayed_up_to = {}
+
+        self.user_group_name = user_group_name(self.user.id)
+        await self.join_group(self.user_group_name)
+
+        # thread_id → DeliveryAckBuffer, one per subscribed thread
+        self.subscriptions = {}
+        self.typing = TypingDebouncer(self.emit_typing)
+        # Presence arrives once per shared thread, forward changes only
+        self.presence_seen = {}
+
+        thread_ids = await self.get_thread_ids(self.user.id)
+        await asyncio.gather(*(
+            self.subscribe(thread_id) for thread_id in thread_ids
+        ))
+
+        # Everything already sent to us is now delivered: one UPDATE for
+        # all threads rather than one flush per thread
+        await self.mark_delivered_everywhere()
+
+        # Mark user online (only the first socket flips presence)
+        went_online = await self.set_user_online(self.user.id)
+        if went_online:
+            presence.last_seen_buffer.mark(self.user.id, is_online=True)
+        self.heartbeat_task = asyncio.ensure_future(self.presence_heartbeat())
+
+        await self.accept(self.subprotocol)
+
+        # 🔥 BROADCAST ONLINE STATUS
+        await self.broadcast_presence(True)
+
+        await self.send_frame({
+            "type": "system",
+            "msg": "Connected",
+            "thread_ids": sorted(self.subscriptions),
+        })
+
+        # 🔁 Reconnect: one query for what every thread missed
+        after_id = self.last_message_id()
+        if after_id is not None:
+            messages = await self.get_user_backlog(
+                list(self.subscriptions), after_id
+            )
+            if messages is None:
+                for thread_id in await self.get_threads_behind(
+                    list(self.subscriptions), after_id
+                ):
+                    await self.send_replay(None, thread_id)
+            else:
+                await self.send_replay(messages)
+
+    # =============================
+    # DISCONNECT
+    # =============================
+    async def disconnect(self, close_code):
+        went_offline = False
+        self.uncount_socket()
+
+        if hasattr(self, "outbound"):
+            self.outbound.close()
+
+        if hasattr(self, "heartbeat_task"):
+            self.heartbeat_task.cancel()
+            went_offline = await self.set_user_offline(self.user.id)
+            if went_offline:
+                presence.last_seen_buffer.mark(self.user.id, is_online=False)
+
+        # 🔥 ONLINE → OFFLINE broadcast (last socket closed)
+        if went_offline:
+            await self.broadcast_presence(False)
+
+        for thread_id in list(getattr(self, "subscriptions", {})):
+            await self.unsubscribe(thread_id)
+
+        if hasattr(self, "user_group_name"):
+            await self.leave_group(self.user_group_name)
+
+    # =============================
+    # SUBSCRIPTIONS
+    # =============================
+    async def subscribe(self, thread_id, latest_id=None):
+        if thread_id in self.subscriptions:
+            return
+
+        self.subscriptions[thread_id] = DeliveryAckBuffer(
+            lambda up_to_id: self.flush_thread_delivered(thread_id, up_to_id)
         )
+        await self.join_group(thread_group_name(thread_id))
+
+        # Everything already in the thread is now delivered to us
+        if latest_id:
+            self.subscriptions[thread_id].ack(latest_id)
+
+    async def unsubscribe(self, thread_id):
+        delivery_acks = self.subscriptions.pop(thread_id, None)
+        if delivery_acks is None:
+            return
+
+        await delivery_acks.close()
+        await self.typing.stop(thread_id)
+        await self.leave_group(thread_group_name(thread_id))
+
+    async def mark_delivered_everywhere(self):
+        latest_ids = await self.latest_incoming_message_ids(self.user.id)
+        if not latest_ids:
+            return
+
+        await self.advance_delivered_everywhere(self.user.id)
+
+        for thread_id, up_to_id in latest_ids.items():
+            delivery_acks = self.subscriptions.get(thread_id)
+            if delivery_acks:
+                delivery_acks.mark_flushed(up_to_id)
+
+        await asyncio.gather(*(
+            self.group_send(
+                thread_group_name(thread_id),
+                {
+                    "type": "delivery_event",
+                    "thread_id": thread_id,
+                    "up_to_id": up_to_id,
+                    "user_id": self.user.id,
+                }
+            )
+            for thread_id, up_to_id in latest_ids.items()
+            if thread_id in self.subscriptions
+        ))
+
+    async def broadcast_presence(self, is_online):
+        await asyncio.gather(*(
+            self.group_send(
+                thread_group_name(thread_id),
+                {
+                    "type": "presence_event",
+                    "thread_id": thread_id,
+                    "user_id": self.user.id,
+                    "is_online": is_online,
+                }
+            )
+            for thread_id in self.subscriptions
+        ))
+
+    # =============================
+    # RECEIVE
+    # =============================
+    async def receive(self, text_data=None, bytes_data=None):
+        data = await self.decode_frame(text_data, bytes_data)
+        if data is None:
+            return
+        event_type = data.get("type")
 
-        for msg in messages:
-            msg.delivered_to.add(user)
-        
+        try:
+            thread_id = int(data.get("thread_id"))
+        except (TypeError, ValueError):
+            await self.send_error(None, "thread_id is required")
+            return
+
+        if event_type == "subscribe":
+            if not await self.is_member(thread_id):
+                await self.send_error(thread_id, "Not a member of this thread")
+                return
+
+            latest_id = await self.latest_incoming_message_id(
+                self.user.id, thread_id
+            )
+            await self.subscribe(thread_id, latest_id)
+            await self.send_frame({
+                "type": "subscribed",
+                "thread_id": thread_id
+            })
+
+            after_id = data.get("last_message_id")
+            if isinstance(after_id, int):
+                await self.replay_missed(thread_id, after_id)
+            return
+
+        if event_type == "unsubscribe":
+            await self.unsubscribe(thread_id)
+            await self.send_frame({
+                "type": "unsubscribed",
+                "thread_id": thread_id
+            })
+            return
+
+        if thread_id not in self.subscriptions:
+            await self.send_error(thread_id, "Not subscribed to this thread")
+            return
+
+        group_name = thread_group_name(thread_id)
+
+        # -----------------------------
+        # TYPING INDICATOR
+        # -----------------------------
+        if event_type == "typing":
+            await self.typing.update(
+                thread_id, bool(data.get("is_typing", False))
+            )
+            return
+
+        # 🚫 Block check (cached member set + block lists)
+        if await self.is_blocked_in(thread_id):
+            await self.send_error(thread_id, "User blocked")
+            return
+
+        if event_type == "media":
+            if not await self.broadcast_media(thread_id, data.get("id")):
+                await self.send_error(thread_id, "Unknown media message")
+            return
+
+        # -----------------------------
+        # NORMAL MESSAGE
+        # -----------------------------
+        message_text = data.get("message", "").strip()
+        if not message_text:
+            return
+
+        saved_message = await self.save_message(
+            sender=self.user,
+            thread_id=thread_id,
+            text=message_text
+        )
+
+        await self.group_send(
+            group_name,
+            {
+                "type": "chat_message",
+                "thread_id": thread_id,
+                "message": saved_message,
+                "persisted": True
+            }
+        )
+
+    async def send_error(self, thread_id, error):
+        await self.send_frame({
+            "type": "error",
+            "thread_id": thread_id,
+            "error": error
+        })
+
+    # =============================
+    # SEND EVENTS TO CLIENT (tagged with thread_id)
+    # =============================
+    async def chat_message(self, event):
+        thread_id = event["thread_id"]
+        message = event["message"]
+        if self.already_replayed(thread_id, message):
+            return
+
+        await self.send_frame({
+            "type": "message",
+            **message,
+            "thread_id": thread_id
+        })
+
+        # ✅ Mark delivered (buffered per thread, persisted rows only)
+        sender = message.get("sender") or {}
+        delivery_acks = self.subscriptions.get(thread_id)
+        if delivery_acks and event.get("persisted") and sender.get("id") != self.user.id:
+            delivery_acks.ack(message["id"])
+
+    async def flush_thread_delivered(self, thread_id, up_to_id):
+        await self.mark_delivered_up_to(self.user.id, thread_id, up_to_id)
+
+        await self.group_send(
+            thread_group_name(thread_id),
+            {
+                "type": "delivery_event",
+                "thread_id": thread_id,
+                "up_to_id": up_to_id,
+                "user_id": self.user.id,
+            }
+        )
+
+    async def message_update(self, event):
+        await self.send_frame({
+            "type": "message_update",
+            **event["message"],
+            "thread_id": event["thread_id"]
+        })
+
+    async def typing_event(self, event):
+        if event["user_id"] == self.user.id:
+            return
+
+        await self.send_frame({
+            "type": "typing",
+            "thread_id": event["thread_id"],
+            "user_id": event["user_id"],
+            "is_typing": event["is_typing"]
+        }, merge_key=("typing", event["thread_id"], event["user_id"]))
+
+    async def presence_event(self, event):
+        user_id = event["user_id"]
+        if user_id == self.user.id:
+            return
+
+        if self.presence_seen.get(user_id) == event["is_online"]:
+            return
+        self.presence_seen[user_id] = event["is_online"]
+
+        await self.send_frame({
+            "type": "presence",
+            "user_id": user_id,
+            "is_online": event["is_online"]
+        }, merge_key=("presence", user_id))
+
+    async def delivery_event(self, event):
+        if event["user_id"] == self.user.id:
+            return
+
+        await self.send_frame({
+            "type": "delivered",
+            "thread_id": event["thread_id"],
+            "up_to_id": event["up_to_id"],
+            "user_id": event["user_id"],
+        })
+
+    # New thread created with us in it (sent to the user group)
+    async def thread_added(self, event):
+        thread_id = event["thread_id"]
+        await self.subscribe(thread_id)
+        await self.send_frame({
+            "type": "thread_added",
+            "thread_id": thread_id
+        })
+
+    # =============================
+    # DB HELPERS
+    # =============================
+    @metrics.db_helper
+    def get_thread_ids(self, user_id):
+        return membership.thread_ids_for_user(user_id)
+
+    @metrics.db_helper
+    def is_member(self, thread_id):
+        return membership.is_member(thread_id, self.user.id)
+
+    @metrics.db_helper
+    def is_blocked_in(self, thread_id):
+        return blocking.any_blocked(
+            self.user.id, membership.member_ids(thread_id)
+        )
+
+    @metrics.db_helper
+    def get_user_backlog(self, thread_ids, after_id):
+        return replay.user_backlog(thread_ids, self.user.id, after_id)
+
+    @metrics.db_helper
+    def get_threads_behind(self, thread_ids, after_id):
+        return replay.threads_behind(thread_ids, self.user.id, after_id)
+
+    @metrics.db_helper
+    def advance_delivered_everywhere(self, user_id):
+        ThreadWatermark.objects.advance_delivered_everywhere(user_id)
+
+    @metrics.db_helper
+    def latest_incoming_message_ids(self, user_id):
+        # One grouped query for every thread at connect
+        return dict(
+            Message.objects.filter(
+                thread__members=user_id
+            ).exclude(
+                sender_id=user_id
+            ).values("thread_id").annotate(
+                latest=Max("id")
+            ).values_list("thread_id", "latest")
+        )
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryAckBuffer:
+    """
+    Coalesces delivery acknowledgements for one connection.
+
+    Every ack only raises a "delivered up to id X" pointer in memory.
+    A short timer then hands the highest id to `flush_callback` once,
+    so a burst of N messages costs one watermark UPDATE and one
+    delivery event instead of N of each.
+    """
+
+    def __init__(self, flush_callback, delay=None):
+        self.flush_callback = flush_callback
+        self.delay = (
+            delay if delay is not None
+            else getattr(settings, "CHAT_DELIVERY_FLUSH_DELAY", 0.2)
+        )
+        self.pending_id = 0
+        self.flushed_id = 0
+        self._timer = None
+
+    def ack(self, message_id):
+        if message_id <= self.pending_id:
+            return
+
+        self.pending_id = message_id
+
+        if self._timer is None:
+            self._timer = asyncio.ensure_future(self._flush_later())
+
+    def mark_flushed(self, up_to_id):
+        """
+        The watermark already reached `up_to_id` by other means (the
+        multiplexed socket's one-UPDATE connect): nothing up to it is
+        left to flush.
+        """
+        self.flushed_id = max(self.flushed_id, up_to_id)
+        self.pending_id = max(self.pending_id, up_to_id)
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.delay)
+        self._timer = None
+        try:
+            await self.flush()
+        except Exception:
+            # Still pending: the next ack (or close) retries it
+            logger.exception("Delivery ack flush failed")
+
+    async def flush(self):
+        if self.pending_id <= self.flushed_id:
+            return
+
+        up_to_id = self.pending_id
+        previous_id, self.flushed_id = self.flushed_id, up_to_id
+        try:
+            await self.flush_callback(up_to_id)
+        except Exception:
+            if self.flushed_id == up_to_id:
+                self.flushed_id = previous_id
+            raise
+
+    async def close(self):
+        """
+        Cancel the timer and flush whatever is still pending.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Delivery ack flush failed on close")
@@ -0,0 +1,11 @@
+# Channel-layer group names, shared by consumers and the REST views
+
+
+def thread_group_name(thread_id):
+    # Every socket watching the thread (legacy + multiplexed)
+    return f"chat_{thread_id}"
+
+
+def user_group_name(user_id):
+    # Per-user group: reaches every multiplexed socket of that user
+    return f"user_{user_id}"
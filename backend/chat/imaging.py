@@ -0,0 +1,49 @@
+"""
+Pillow-only helpers that run inside the preview worker processes.
+
+Nothing here may import Django: workers are spawned fresh and never
+call django.setup().
+"""
+import os
+
+from PIL import Image, ImageOps
+
+PLACEHOLDER_GRID = (4, 3)
+
+
+def placeholder_for(image):
+    """
+    Blurhash-style stand-in: a tiny grid of average colours the client
+    can paint as a blurred gradient before the thumbnail arrives.
+    Format: "<cols>x<rows>:<rrggbb>,<rrggbb>,..."
+    """
+    cols, rows = PLACEHOLDER_GRID
+    tiny = image.convert("RGB").resize((cols, rows), Image.Resampling.BOX)
+    colours = ",".join(
+        "%02x%02x%02x" % tiny.getpixel((x, y))
+        for y in range(rows)
+        for x in range(cols)
+    )
+    return f"{cols}x{rows}:{colours}"
+
+
+def render_preview(source_path, dest_path, max_size):
+    """
+    Write a JPEG thumbnail of source_path (longest side <= max_size)
+    to dest_path and return its metadata.
+    """
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        width, height = image.size
+
+        thumb = image.convert("RGB")
+        thumb.thumbnail((max_size, max_size))
+
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        thumb.save(dest_path, "JPEG", quality=80, optimize=True)
+
+        return {
+            "width": width,
+            "height": height,
+            "placeholder": placeholder_for(image),
+        }
@@ -0,0 +1,314 @@
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+# In-process only: no Redis, no network, throwaway test database
+BENCH_SETTINGS = {
+    "CHANNEL_LAYERS": {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+            "CONFIG": {"capacity": 10000},
+        },
+    },
+    "CACHES": {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "chatbench",
+        },
+    },
+}
+
+
+def percentiles(values):
+    if not values:
+        return None
+
+    ordered = sorted(values)
+
+    def pick(p):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+    return {
+        "count": len(ordered),
+        "mean": round(statistics.fmean(ordered), 3),
+        "p50": round(pick(0.50), 3),
+        "p95": round(pick(0.95), 3),
+        "p99": round(pick(0.99), 3),
+        "max": round(ordered[-1], 3),
+    }
+
+
+class QueryCounter:
+    """
+    connection.execute_wrapper hook. Consumers' DB helpers run in this
+    thread (async_to_sync + thread-sensitive sync_to_async), so every
+    query the benchmark causes passes through here.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+class Client:
+    """
+    One simulated user on a multiplexed socket (ws/chat/).
+    """
+
+    def __init__(self, bench, user, token, thread_ids):
+        self.bench = bench
+        self.user = user
+        self.token = token
+        self.thread_ids = thread_ids
+        self.communicator = None
+        self.reader = None
+        self.sent = 0
+
+    async def connect(self):
+        from channels.testing import WebsocketCommunicator
+        from core.asgi import application
+
+        started = time.perf_counter()
+        self.communicator = WebsocketCommunicator(
+            application, f"/ws/chat/?token={self.token}"
+        )
+        connected, _ = await self.communicator.connect()
+        if not connected:
+            raise RuntimeError(f"user {self.user.id} could not connect")
+
+        self.bench.connect_ms.append((time.perf_counter() - started) * 1000)
+        self.reader = asyncio.ensure_future(self.read())
+
+    async def disconnect(self):
+        self.reader.cancel()
+        await self.communicator.disconnect()
+
+    async def read(self):
+        # output_queue directly: receive_output() cancels the app on timeout
+        while True:
+            output = await self.communicator.output_queue.get()
+            if output.get("type") != "websocket.send":
+                continue
+
+            frame = json.loads(output["text"])
+            frames = frame["frames"] if frame.get("type") == "batch" else [frame]
+
+            for frame in frames:
+                if frame.get("type") == "message":
+                    self.bench.delivered(frame, self.user.id)
+
+    async def run(self, messages, typing_ratio, interval):
+        for _ in range(messages):
+            thread_id = random.choice(self.thread_ids)
+
+            if random.random() < typing_ratio:
+                await self.communicator.send_json_to({
+                    "type": "typing", "thread_id": thread_id, "is_typing": True
+                })
+
+            self.sent += 1
+            tag = f"bench:{self.user.id}:{self.sent}"
+            self.bench.sent_at[tag] = time.perf_counter()
+            await self.communicator.send_json_to({
+                "type": "message", "thread_id": thread_id, "message": tag
+            })
+
+            if interval:
+                await asyncio.sleep(interval)
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive core.asgi in-process with N simulated users across M threads "
+        "and report throughput, delivery latency and DB queries as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--threads", type=int, default=25)
+        parser.add_argument("--members", type=int, default=2,
+                            help="members per thread")
+        parser.add_argument("--messages", type=int, default=20,
+                            help="messages sent per user")
+        parser.add_argument("--rate", type=float, default=0,
+                            help="messages/sec per user (0 = as fast as possible)")
+        parser.add_argument("--typing-ratio", type=float, default=0.5,
+                            help="chance of a typing frame before each message")
+        parser.add_argument("--reconnect-ratio", type=float, default=0.1,
+                            help="share of users that drop and reconnect midway")
+        parser.add_argument("--timeout", type=float, default=30,
+                            help="seconds to wait for outstanding deliveries")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="write the JSON report here")
+
+    def handle(self, *args, **options):
+        if options["members"] > options["users"]:
+            options["members"] = options["users"]
+
+        random.seed(options["seed"])
+
+        old_name = connection.settings_dict["NAME"]
+        with override_settings(**BENCH_SETTINGS):
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                report = self.benchmark(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                fh.write(output + "\n")
+        self.stdout.write(output)
+
+    # -----------------------------
+    # Fixtures
+    # -----------------------------
+    def make_fixtures(self, options):
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        from chat.models import Thread
+        from chat.summary import init_thread
+        from users.models import User
+
+        users = User.objects.bulk_create([
+            User(username=f"bench_{n}", password="!")
+            for n in range(options["users"])
+        ])
+
+        memberships = {user.id: [] for user in users}
+        for n in range(options["threads"]):
+            thread = Thread.objects.create(name=f"bench {n}")
+            members = [
+                users[(n * options["members"] + step) % len(users)]
+                for step in range(options["members"])
+            ]
+            thread.members.add(*members)
+            init_thread(thread)
+            for member in members:
+                memberships[member.id].append(thread.id)
+
+        return [
+            Client(self, user, str(AccessToken.for_user(user)), memberships[user.id])
+            for user in users
+            if memberships[user.id]
+        ], options["members"] - 1
+
+    # -----------------------------
+    # Run
+    # -----------------------------
+    def benchmark(self, options):
+        self.connect_ms = []
+        self.latency_ms = []
+        self.sent_at = {}
+        self.deliveries = 0
+
+        clients, recipients_per_message = self.make_fixtures(options)
+
+        queries = QueryCounter()
+        with connection.execute_wrapper(queries):
+            timings = async_to_sync(self.drive)(clients, options)
+
+        sent = len(self.sent_at)
+        expected = sent * recipients_per_message
+        elapsed = timings["send_seconds"]
+
+        return {
+            "config": {
+                key: options[key]
+                for key in (
+                    "users", "threads", "members", "messages", "rate",
+                    "typing_ratio", "reconnect_ratio", "seed",
+                )
+            },
+            "connected_users": len(clients),
+            "reconnects": timings["reconnects"],
+            "connect_ms": percentiles(self.connect_ms),
+            "messages_sent": sent,
+            "deliveries": self.deliveries,
+            "deliveries_expected": expected,
+            "send_seconds": round(elapsed, 3),
+            "messages_per_second": round(sent / elapsed, 1) if elapsed else None,
+            "deliveries_per_second": (
+                round(self.deliveries / timings["total_seconds"], 1)
+                if timings["total_seconds"] else None
+            ),
+            "delivery_latency_ms": percentiles(self.latency_ms),
+            "db": {
+                "queries": queries.count,
+                "query_seconds": round(queries.seconds, 3),
+                "queries_per_message": round(queries.count / sent, 2) if sent else None,
+            },
+        }
+
+    def delivered(self, frame, user_id):
+        sender = frame.get("sender") or {}
+        sent_at = self.sent_at.get(frame.get("text"))
+        if sent_at is None or sender.get("id") == user_id:
+            return
+
+        self.deliveries += 1
+        self.latency_ms.append((time.perf_counter() - sent_at) * 1000)
+
+    async def wait_for_deliveries(self, options):
+        # Fan-out drains, or we give up at the timeout
+        expected = len(self.sent_at) * (options["members"] - 1)
+        deadline = time.perf_counter() + options["timeout"]
+        while self.deliveries < expected and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+
+    async def drive(self, clients, options):
+        interval = 1 / options["rate"] if options["rate"] else 0
+        half = options["messages"] // 2
+
+        await asyncio.gather(*(client.connect() for client in clients))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            client.run(half, options["typing_ratio"], interval)
+            for client in clients
+        ))
+
+        # Let the first half land before anyone drops off
+        await self.wait_for_deliveries(options)
+
+        # Midway churn: drop and reconnect a share of users
+        churn = random.sample(
+            clients, int(len(clients) * options["reconnect_ratio"])
+        )
+        for client in churn:
+            await client.disconnect()
+        await asyncio.gather(*(client.connect() for client in churn))
+
+        await asyncio.gather(*(
+            client.run(options["messages"] - half, options["typing_ratio"], interval)
+            for client in clients
+        ))
+        send_seconds = time.perf_counter() - started
+
+        await self.wait_for_deliveries(options)
+        total_seconds = time.perf_counter() - started
+
+        for client in clients:
+            await client.disconnect()
+
+        return {
+            "send_seconds": send_seconds,
+            "total_seconds": total_seconds,
+            "reconnects": len(churn),
+        }
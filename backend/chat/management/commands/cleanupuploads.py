@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from chat import uploads
+
+
+class Command(BaseCommand):
+    help = "Delete expired chunked upload sessions and their temp files (run from cron)"
+
+    def handle(self, *args, **options):
+        sessions, orphans = uploads.cleanup_expired()
+        self.stdout.write(
+            f"Removed {sessions} expired upload session(s), "
+            f"{orphans} orphaned temp file(s)"
+        )
@@ -0,0 +1,90 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from chat.codecs import CODECS
+
+# Shaped like the frames ChatConsumer actually sends
+SAMPLE_FRAMES = {
+    "message": {
+        "type": "message",
+        "id": 918273,
+        "thread": 4521,
+        "thread_id": 4521,
+        "sender": {
+            "id": 1042,
+            "username": "rahul_k",
+            "avatar": "/media/avatars/rahul_k.jpg",
+            "bio": "",
+            "is_online": True,
+            "last_seen": "2026-10-18T04:41:07.512034Z",
+            "last_seen_display": "Online",
+        },
+        "text": "Kal 5 baje milte hain, location bhej dena 👍",
+        "attachment": None,
+        "created_at": "2026-10-18T04:41:09.130772Z",
+        "delivered_count": 0,
+        "read_count": 0,
+        "is_media": False,
+        "file_name": None,
+        "file_size": None,
+        "file_type": None,
+        "preview": None,
+        "preview_placeholder": "",
+        "width": None,
+        "height": None,
+        "delivery_status": "sent",
+    },
+    "typing": {
+        "type": "typing",
+        "thread_id": 4521,
+        "user_id": 1042,
+        "is_typing": True,
+    },
+    "presence": {
+        "type": "presence",
+        "user_id": 1042,
+        "is_online": False,
+    },
+    "delivered": {
+        "type": "delivered",
+        "thread_id": 4521,
+        "up_to_id": 918273,
+        "user_id": 2210,
+    },
+}
+
+
+class Command(BaseCommand):
+    help = "Compare encode/decode cost and frame size of the chat socket codecs"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20000)
+
+    def handle(self, *args, **options):
+        iterations = options["iterations"]
+
+        self.stdout.write(
+            f"{'frame':<10} {'codec':<14} {'bytes':>6} "
+            f"{'encode µs':>10} {'decode µs':>10}"
+        )
+
+        for frame_name, payload in SAMPLE_FRAMES.items():
+            for name, codec in CODECS.items():
+                encoded = codec.encode(payload)
+                size = len(
+                    encoded.encode("utf-8") if isinstance(encoded, str) else encoded
+                )
+                encode_us = self.time_us(lambda: codec.encode(payload), iterations)
+                decode_us = self.time_us(lambda: codec.decode(encoded), iterations)
+
+                self.stdout.write(
+                    f"{frame_name:<10} {name:<14} {size:>6} "
+                    f"{encode_us:>10.2f} {decode_us:>10.2f}"
+                )
+
+    @staticmethod
+    def time_us(func, iterations):
+        # Best of 3 runs, per call
+        best = min(timeit.repeat(func, number=iterations, repeat=3))
+        return best / iterations * 1_000_000
@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from core import versioning
+
+from .models import Thread
+
+MEMBERSHIP_CACHE_TTL = getattr(settings, "THREAD_MEMBERS_CACHE_TTL", 60 * 60)
+
+
+def version_key(thread_id):
+    return f"thread_members_v_{thread_id}"
+
+
+def members_key(thread_id, version):
+    return f"thread_members_{thread_id}_{version}"
+
+
+def _version(thread_id):
+    return versioning.current(version_key(thread_id))
+
+
+def member_ids(thread_id):
+    """
+    frozenset of user ids in the thread (empty if it doesn't exist).
+
+    Cached under the thread's current version; invalidate() bumps the
+    version, so a reader that loaded the old member list while members
+    were changing can only write it under a key nobody reads anymore.
+    """
+    version = _version(thread_id)
+    key = members_key(thread_id, version)
+
+    ids = cache.get(key)
+    if ids is None:
+        ids = frozenset(
+            Thread.members.through.objects.filter(
+                thread_id=thread_id
+            ).values_list("user_id", flat=True)
+        )
+        cache.set(key, ids, MEMBERSHIP_CACHE_TTL)
+
+    return ids
+
+
+def is_member(thread_id, user_id):
+    return user_id in member_ids(thread_id)
+
+
+def invalidate(thread_id):
+    versioning.bump(version_key(thread_id))
+
+
+def thread_ids_for_user(user_id):
+    """
+    Ids of every thread the user belongs to (uncached, one query).
+    """
+    return list(
+        Thread.members.through.objects.filter(
+            user_id=user_id
+        ).values_list("thread_id", flat=True)
+    )
@@ -0,0 +1,62 @@
+# Generated by Django 6.0 on 2026-10-18 04:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def backfill_watermarks(apps, schema_editor):
+    """
+    Collapse existing read_by rows into one watermark per (thread, user):
+    the highest message id the user had read in that thread.
+    """
+    Message = apps.get_model("chat", "Message")
+    ThreadWatermark = apps.get_model("chat", "ThreadWatermark")
+    ReadBy = Message.read_by.through
+
+    rows = (
+        ReadBy.objects
+        .values("message__thread_id", "user_id")
+        .annotate(last_read_id=Max("message_id"))
+    )
+
+    ThreadWatermark.objects.bulk_create(
+        [
+            ThreadWatermark(
+                thread_id=row["message__thread_id"],
+                user_id=row["user_id"],
+                last_read_id=row["last_read_id"],
+            )
+            for row in rows
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_message_thread_created_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThreadWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_id', models.PositiveBigIntegerField(default=0)),
+                ('thread', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='watermarks', to='chat.thread')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='thread_watermarks', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('thread', 'user'), name='chat_watermark_thread_user_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_watermarks, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='message',
+            name='read_by',
+        ),
+    ]
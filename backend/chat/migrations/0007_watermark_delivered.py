@@ -0,0 +1,56 @@
+# Generated by Django 6.0 on 2026-10-18 04:40
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def backfill_delivered(apps, schema_editor):
+    """
+    Collapse existing delivered_to rows into last_delivered_id,
+    creating watermarks for members that never read anything.
+    """
+    Message = apps.get_model("chat", "Message")
+    ThreadWatermark = apps.get_model("chat", "ThreadWatermark")
+    DeliveredTo = Message.delivered_to.through
+
+    rows = (
+        DeliveredTo.objects
+        .values("message__thread_id", "user_id")
+        .annotate(last_delivered_id=Max("message_id"))
+    )
+
+    for row in rows:
+        watermark, _ = ThreadWatermark.objects.get_or_create(
+            thread_id=row["message__thread_id"],
+            user_id=row["user_id"],
+        )
+        watermark.last_delivered_id = max(
+            row["last_delivered_id"],
+            watermark.last_read_id,
+        )
+        watermark.save(update_fields=["last_delivered_id"])
+
+    # Anything read was delivered as well
+    ThreadWatermark.objects.filter(
+        last_delivered_id__lt=models.F("last_read_id")
+    ).update(last_delivered_id=models.F("last_read_id"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_thread_watermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='threadwatermark',
+            name='last_delivered_id',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_delivered, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='message',
+            name='delivered_to',
+        ),
+    ]
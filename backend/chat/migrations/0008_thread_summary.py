@@ -0,0 +1,81 @@
+# Generated by Django 6.0 on 2026-10-18 04:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_summaries(apps, schema_editor):
+    """
+    Build a summary per thread and seed a watermark with the right
+    unread counter for every (thread, member) pair.
+    """
+    Thread = apps.get_model("chat", "Thread")
+    Message = apps.get_model("chat", "Message")
+    ThreadSummary = apps.get_model("chat", "ThreadSummary")
+    ThreadWatermark = apps.get_model("chat", "ThreadWatermark")
+
+    for thread in Thread.objects.all().iterator():
+        last = (
+            Message.objects.filter(thread_id=thread.id)
+            .select_related("sender")
+            .order_by("-id")
+            .first()
+        )
+        if last:
+            ThreadSummary.objects.update_or_create(
+                thread_id=thread.id,
+                defaults={
+                    "last_message_id": last.id,
+                    "last_message": {
+                        "id": last.id,
+                        "text": last.text,
+                        "sender": {
+                            "id": last.sender_id,
+                            "username": last.sender.username,
+                        },
+                        "created_at": last.created_at.isoformat().replace("+00:00", "Z"),
+                        "is_media": bool(last.attachment),
+                        "file_name": (
+                            last.attachment.name.split("/")[-1]
+                            if last.attachment else None
+                        ),
+                    },
+                    "last_activity_at": last.created_at,
+                },
+            )
+
+        for member in thread.members.all():
+            watermark, _ = ThreadWatermark.objects.get_or_create(
+                thread_id=thread.id,
+                user_id=member.id,
+            )
+            watermark.unread_count = Message.objects.filter(
+                thread_id=thread.id,
+                id__gt=watermark.last_read_id,
+            ).exclude(sender_id=member.id).count()
+            watermark.save(update_fields=["unread_count"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_watermark_delivered'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThreadSummary',
+            fields=[
+                ('thread', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='chat.thread')),
+                ('last_message_id', models.PositiveBigIntegerField(default=0)),
+                ('last_message', models.JSONField(blank=True, null=True)),
+                ('last_activity_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='threadwatermark',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
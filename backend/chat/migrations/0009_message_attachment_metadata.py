@@ -0,0 +1,53 @@
+# Generated by Django 6.0 on 2026-10-18 04:45
+
+import mimetypes
+
+from django.db import migrations, models
+
+
+def backfill_attachment_metadata(apps, schema_editor):
+    """
+    One-off storage pass for attachments uploaded before the
+    metadata columns existed. Missing files keep a null size.
+    """
+    Message = apps.get_model("chat", "Message")
+
+    for message in Message.objects.exclude(attachment="").exclude(attachment=None).iterator():
+        name = message.attachment.name.split("/")[-1]
+        message.attachment_name = name[:255]
+        message.attachment_type = mimetypes.guess_type(name)[0] or ""
+
+        try:
+            message.attachment_size = message.attachment.size
+        except OSError:
+            message.attachment_size = None
+
+        message.save(update_fields=[
+            "attachment_name", "attachment_type", "attachment_size",
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_thread_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='attachment_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='attachment_size',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='attachment_type',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.RunPython(backfill_attachment_metadata, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-18 04:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0010_upload_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='attachment_height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='attachment_width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='preview',
+            field=models.FileField(blank=True, null=True, upload_to='chat_previews/'),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='preview_placeholder',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,116 @@
+# Generated by Django 6.0 on 2026-10-18 04:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def merge_direct_threads(apps, schema_editor):
+    """
+    Key every unnamed two-member thread by its (low, high) member ids.
+    Duplicates for the same pair are folded into the oldest thread:
+    messages and uploads move over, read/delivery pointers keep the
+    furthest position, and summary and unread counters are rebuilt.
+    """
+    Thread = apps.get_model("chat", "Thread")
+    Message = apps.get_model("chat", "Message")
+    ThreadSummary = apps.get_model("chat", "ThreadSummary")
+    ThreadWatermark = apps.get_model("chat", "ThreadWatermark")
+    UploadSession = apps.get_model("chat", "UploadSession")
+    Membership = Thread.members.through
+
+    direct_ids = (
+        Thread.objects.filter(name="")
+        .annotate(member_count=Count("members"))
+        .filter(member_count=2)
+        .values_list("id", flat=True)
+    )
+
+    pairs = {}
+    for thread_id, user_id in Membership.objects.filter(
+        thread_id__in=list(direct_ids)
+    ).values_list("thread_id", "user_id"):
+        pairs.setdefault(thread_id, []).append(user_id)
+
+    by_pair = {}
+    for thread_id, user_ids in sorted(pairs.items()):
+        by_pair.setdefault(tuple(sorted(user_ids)), []).append(thread_id)
+
+    for (low_id, high_id), thread_ids in by_pair.items():
+        keeper_id, duplicate_ids = thread_ids[0], thread_ids[1:]
+
+        if duplicate_ids:
+            Message.objects.filter(thread_id__in=duplicate_ids).update(
+                thread_id=keeper_id
+            )
+            UploadSession.objects.filter(thread_id__in=duplicate_ids).update(
+                thread_id=keeper_id
+            )
+
+            for user_id in (low_id, high_id):
+                pointers = ThreadWatermark.objects.filter(
+                    thread_id__in=thread_ids, user_id=user_id
+                ).aggregate(
+                    read=Max("last_read_id"),
+                    delivered=Max("last_delivered_id"),
+                )
+                ThreadWatermark.objects.update_or_create(
+                    thread_id=keeper_id,
+                    user_id=user_id,
+                    defaults={
+                        "last_read_id": pointers["read"] or 0,
+                        "last_delivered_id": pointers["delivered"] or 0,
+                    },
+                )
+
+            latest = (
+                ThreadSummary.objects.filter(thread_id__in=thread_ids)
+                .order_by("-last_message_id")
+                .first()
+            )
+            if latest and latest.thread_id != keeper_id:
+                ThreadSummary.objects.update_or_create(
+                    thread_id=keeper_id,
+                    defaults={
+                        "last_message_id": latest.last_message_id,
+                        "last_message": latest.last_message,
+                        "last_activity_at": latest.last_activity_at,
+                    },
+                )
+
+            # Cascades the duplicates' memberships, watermarks, summaries
+            Thread.objects.filter(id__in=duplicate_ids).delete()
+
+            for watermark in ThreadWatermark.objects.filter(thread_id=keeper_id):
+                watermark.unread_count = Message.objects.filter(
+                    thread_id=keeper_id,
+                    id__gt=watermark.last_read_id,
+                ).exclude(sender_id=watermark.user_id).count()
+                watermark.save(update_fields=["unread_count"])
+
+        Thread.objects.filter(id=keeper_id).update(
+            dm_low_id=low_id, dm_high_id=high_id
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0012_message_fts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thread',
+            name='dm_high',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='dm_low',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(merge_direct_threads, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 04:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Separate from 0013 so the index is built after the data migration commits
+    dependencies = [
+        ('chat', '0013_dm_pair_key'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='thread',
+            constraint=models.UniqueConstraint(fields=('dm_low', 'dm_high'), name='chat_thread_dm_pair_uniq'),
+        ),
+    ]
@@ -1,17 +1,106 @@
-from django.db import models
+import mimetypes
+import uuid
+
+from django.db import IntegrityError, models, transaction
 from django.conf import settings
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
 
 User = settings.AUTH_USER_MODEL
 
+class ThreadManager(models.Manager):
+    def get_or_create_direct(self, user, other):
+        """
+        The 1:1 thread between two users, found by its canonical
+        (low, high) pair key. The unique constraint settles concurrent
+        creates: the loser's insert fails and it reads the winner's row.
+        Returns (thread, created).
+        """
+        low_id, high_id = sorted((user.id, other.id))
+        lookup = {"dm_low_id": low_id, "dm_high_id": high_id}
+
+        thread = self.filter(**lookup).first()
+        if thread:
+            return thread, False
+
+        try:
+            with transaction.atomic():
+                thread = self.create(**lookup)
+                thread.members.add(low_id, high_id)
+        except IntegrityError:
+            return self.get(**lookup), False
+
+        return thread, True
+
+
 class Thread(models.Model):
     # If 1:1 chat: name is blank
     name = models.CharField(max_length=255, blank=True)
     members = models.ManyToManyField(User, related_name='threads')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # 1:1 threads only: member ids ordered low/high, unique together
+    dm_low = models.ForeignKey(
+        User,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="+"
+    )
+    dm_high = models.ForeignKey(
+        User,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="+"
+    )
+
+    objects = ThreadManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dm_low", "dm_high"],
+                name="chat_thread_dm_pair_uniq"
+            ),
+        ]
+
     def __str__(self):
         return self.name or f"Thread {self.id}"
 
+class MessageQuerySet(models.QuerySet):
+    def with_receipts(self):
+        """
+        Annotate delivered_count / read_count in SQL so serializing a
+        page of messages needs no per-message receipt queries.
+        """
+        return self.annotate(
+            delivered_count=self._receipt_count("last_delivered_id"),
+            read_count=self._receipt_count("last_read_id"),
+        )
+
+    @staticmethod
+    def _receipt_count(pointer):
+        # Members (other than the sender) whose watermark covers the message
+        watermarks = ThreadWatermark.objects.filter(
+            thread_id=OuterRef("thread_id"),
+            **{f"{pointer}__gte": OuterRef("id")}
+        ).exclude(
+            user_id=OuterRef("sender_id")
+        ).order_by().values("thread_id").annotate(
+            total=Count("id")
+        ).values("total")
+
+        return Coalesce(
+            Subquery(watermarks, output_field=models.IntegerField()),
+            0
+        )
+
+
+# SQLite: migration 0012's FTS5 triggers live on this table and are
+# dropped whenever a migration rebuilds it (most field changes). Any
+# schema change here needs a follow-up RunPython(create_fts) migration;
+# check --database and SearchIndexTriggerTests catch a forgotten one.
 class Message(models.Model):
     thread = models.ForeignKey(
         Thread,
@@ -31,18 +120,20 @@ class Message(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
-    # ✅ NEW
-    delivered_to = models.ManyToManyField(
-        User,
-        related_name="delivered_messages",
-        blank=True
-    )
+    # Captured once when the attachment is uploaded
+    attachment_name = models.CharField(max_length=255, blank=True)
+    attachment_type = models.CharField(max_length=100, blank=True)
+    attachment_size = models.PositiveBigIntegerField(null=True, blank=True)
 
-    read_by = models.ManyToManyField(
-        User,
-        related_name="read_messages",
+    # Filled in later by the preview workers (chat.previews)
+    preview = models.FileField(
+        upload_to="chat_previews/",
+        null=True,
         blank=True
     )
+    preview_placeholder = models.CharField(max_length=255, blank=True)
+    attachment_width = models.PositiveIntegerField(null=True, blank=True)
+    attachment_height = models.PositiveIntegerField(null=True, blank=True)
 
     deleted_by = models.ManyToManyField(
         User,
@@ -50,5 +141,216 @@ class Message(models.Model):
         blank=True
     )
 
+    class Meta:
+        indexes = [
+            # keyset pagination: WHERE thread = ? ORDER BY created_at, id
+            models.Index(
+                fields=["thread", "created_at", "id"],
+                name="chat_msg_thread_created_idx",
+            ),
+        ]
+
+    objects = MessageQuerySet.as_manager()
+
     def __str__(self):
-        return f"{self.sender}: {self.text[:20]}"
\ No newline at end of file
+        return f"{self.sender}: {self.text[:20]}"
+
+    def save(self, *args, **kwargs):
+        if self.attachment and not self.attachment_name:
+            self.capture_attachment_metadata()
+        super().save(*args, **kwargs)
+
+    def capture_attachment_metadata(self):
+        """
+        Record name/type/size while the upload is still in hand,
+        so serializers never have to touch storage.
+        """
+        upload = self.attachment.file
+        name = self.attachment.name.split("/")[-1]
+
+        self.attachment_name = name[:255]
+        self.attachment_type = (
+            getattr(upload, "content_type", None)
+            or mimetypes.guess_type(name)[0]
+            or ""
+        )
+        self.attachment_size = self.attachment.size
+
+    def prime_receipts(self):
+        """
+        A message that was just created has no receipts yet; set the
+        annotations with_receipts() would have added.
+        """
+        self.delivered_count = 0
+        self.read_count = 0
+        return self
+
+
+class ThreadWatermarkManager(models.Manager):
+    def advance_read(self, thread_id, user_id, message_id):
+        """
+        Move the user's read pointer forward to message_id.
+        Never moves it backwards; normally a single UPDATE.
+        Reading a message implies it was delivered too.
+        Callers pass the thread's latest message, so the unread
+        counter resets to zero.
+        """
+        updated = self.filter(
+            thread_id=thread_id,
+            user_id=user_id,
+            last_read_id__lt=message_id
+        ).update(
+            last_read_id=message_id,
+            last_delivered_id=Greatest("last_delivered_id", Value(message_id)),
+            unread_count=0
+        )
+
+        if not updated:
+            self.get_or_create(
+                thread_id=thread_id,
+                user_id=user_id,
+                defaults={
+                    "last_read_id": message_id,
+                    "last_delivered_id": message_id,
+                }
+            )
+
+    def ensure_members(self, thread):
+        """
+        Create missing watermark rows so unread counters exist for
+        every member before the first message arrives.
+        """
+        self.bulk_create(
+            [
+                self.model(thread_id=thread.id, user_id=user_id)
+                for user_id in thread.members.values_list("id", flat=True)
+            ],
+            ignore_conflicts=True
+        )
+
+    def advance_delivered_everywhere(self, user_id):
+        """
+        One UPDATE moving the user's delivery pointer in every thread
+        up to that thread's newest message from someone else.
+        """
+        latest_incoming = Message.objects.filter(
+            thread_id=OuterRef("thread_id")
+        ).exclude(
+            sender_id=user_id
+        ).order_by("-id").values("id")[:1]
+
+        return self.filter(user_id=user_id).update(
+            last_delivered_id=Greatest(
+                F("last_delivered_id"),
+                Coalesce(Subquery(latest_incoming), Value(0))
+            )
+        )
+
+    def advance_delivered(self, thread_id, user_id, message_id):
+        """
+        Move the user's delivery pointer forward to message_id.
+        """
+        updated = self.filter(
+            thread_id=thread_id,
+            user_id=user_id,
+            last_delivered_id__lt=message_id
+        ).update(last_delivered_id=message_id)
+
+        if not updated:
+            self.get_or_create(
+                thread_id=thread_id,
+                user_id=user_id,
+                defaults={"last_delivered_id": message_id}
+            )
+
+
+class ThreadWatermark(models.Model):
+    """
+    Per (thread, member) receipt pointers.
+    Every message with id <= last_read_id counts as read by this user,
+    every message with id <= last_delivered_id as delivered.
+    """
+    thread = models.ForeignKey(
+        Thread,
+        on_delete=models.CASCADE,
+        related_name="watermarks"
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="thread_watermarks"
+    )
+    last_read_id = models.PositiveBigIntegerField(default=0)
+    last_delivered_id = models.PositiveBigIntegerField(default=0)
+
+    # Maintained incrementally by chat.summary.record_message
+    unread_count = models.PositiveIntegerField(default=0)
+
+    objects = ThreadWatermarkManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["thread", "user"],
+                name="chat_watermark_thread_user_uniq",
+            ),
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.user} @ thread {self.thread_id}: "
+            f"delivered {self.last_delivered_id}, read {self.last_read_id}"
+        )
+
+
+
+class ThreadSummary(models.Model):
+    """
+    Denormalized inbox row for a thread, updated on every new message
+    so the thread list never has to look at the messages table.
+    """
+    thread = models.OneToOneField(
+        Thread,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="summary"
+    )
+    last_message_id = models.PositiveBigIntegerField(default=0)
+    last_message = models.JSONField(null=True, blank=True)
+    last_activity_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    def __str__(self):
+        return f"Summary of thread {self.thread_id}"
+
+
+
+class UploadSession(models.Model):
+    """
+    A resumable, chunked attachment upload. Chunks are appended to a
+    temp file; the Message is only created once the upload is complete
+    and its checksum verified.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="upload_sessions"
+    )
+    thread = models.ForeignKey(
+        Thread,
+        on_delete=models.CASCADE,
+        related_name="upload_sessions"
+    )
+    file_name = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    total_size = models.PositiveBigIntegerField()
+    received_bytes = models.PositiveBigIntegerField(default=0)
+    text = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Upload {self.id} ({self.received_bytes}/{self.total_size})"
+
+    @property
+    def is_complete(self):
+        return self.received_bytes >= self.total_size
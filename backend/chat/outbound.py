@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import time
+from collections import Counter, deque
+
+from django.conf import settings
+
+MAX_QUEUE = getattr(settings, "CHAT_OUTBOUND_MAX_QUEUE", 500)
+HIGH_WATER = getattr(settings, "CHAT_OUTBOUND_HIGH_WATER", 200)
+SLOW_TIMEOUT = getattr(settings, "CHAT_OUTBOUND_SLOW_TIMEOUT", 10)
+MAX_BATCH = getattr(settings, "CHAT_OUTBOUND_MAX_BATCH", 50)
+
+logger = logging.getLogger(__name__)
+
+# Process-wide totals for monitoring
+counters = Counter()
+
+
+def snapshot():
+    return dict(counters)
+
+
+def collect():
+    # core.metrics collector: exported as chat_outbound_<name>_total
+    return [
+        (f"chat_outbound_{name}_total", "counter",
+         f"Outbound queue {name.replace('_', ' ')} frames/events.", value)
+        for name, value in sorted(counters.items())
+    ]
+
+
+class OutboundQueue:
+    """
+    Bounded send queue for one socket.
+
+    Handlers enqueue frames and return immediately; one writer task
+    drains the queue to the client, so a slow client only slows its
+    own writer, never the consumer reading the channel layer.
+
+    - Frames with a merge_key (typing, presence) replace an older
+      pending frame with the same key, and are dropped outright while
+      the queue is above HIGH_WATER.
+    - With batching on, everything pending (up to MAX_BATCH) goes out
+      as one {"type": "batch", "frames": [...]} frame.
+    - A client above HIGH_WATER for SLOW_TIMEOUT seconds, or at
+      MAX_QUEUE, is handed to `on_overflow` (the consumer closes it).
+    - If `write` raises, the queue stops and `on_error` (default:
+      `on_overflow`) is called at once instead of letting frames pile up.
+
+    Backpressure is only as good as `write`: the queue grows only while
+    a write is blocked. Daphne's send() returns once Twisted has buffered
+    the frame, and ASGI exposes no transport buffer size, so under
+    Daphne a slow client's backlog sits in Twisted and the high-water
+    drops and 4008 close never trigger. There the queue only merges
+    and batches; slow-client protection needs a server whose send()
+    waits for the socket to drain.
+    """
+
+    def __init__(self, write, on_overflow, batch=False,
+                 max_size=MAX_QUEUE, high_water=HIGH_WATER,
+                 slow_timeout=SLOW_TIMEOUT, max_batch=MAX_BATCH,
+                 on_error=None):
+        self.write = write
+        self.on_overflow = on_overflow
+        self.on_error = on_error or on_overflow
+        self.batch = batch
+        self.max_size = max_size
+        self.high_water = high_water
+        self.slow_timeout = slow_timeout
+        self.max_batch = max_batch
+
+        # Entries are [merge_key, payload] so merges update in place
+        self._queue = deque()
+        self._mergeable = {}
+        self._ready = asyncio.Event()
+        self._over_since = None
+        self._stopped = False
+        self._task = asyncio.ensure_future(self._run())
+
+    def __len__(self):
+        return len(self._queue)
+
+    def put(self, payload, merge_key=None):
+        if self._stopped:
+            return
+
+        if merge_key is not None:
+            entry = self._mergeable.get(merge_key)
+            if entry is not None:
+                entry[1] = payload
+                counters["merged"] += 1
+                return
+
+            if len(self._queue) >= self.high_water:
+                counters["dropped"] += 1
+                return
+
+        entry = [merge_key, payload]
+        self._queue.append(entry)
+        if merge_key is not None:
+            self._mergeable[merge_key] = entry
+        counters["queued"] += 1
+
+        self._check_pressure()
+        self._ready.set()
+
+    def _check_pressure(self):
+        if len(self._queue) < self.high_water:
+            self._over_since = None
+            return
+
+        now = time.monotonic()
+        if self._over_since is None:
+            self._over_since = now
+
+        if (
+            len(self._queue) >= self.max_size
+            or now - self._over_since >= self.slow_timeout
+        ):
+            self._stopped = True
+            counters["slow_disconnects"] += 1
+            asyncio.ensure_future(self.on_overflow())
+
+    def _take(self):
+        count = self.max_batch if self.batch else 1
+        frames = []
+
+        while self._queue and len(frames) < count:
+            merge_key, payload = self._queue.popleft()
+            if merge_key is not None:
+                self._mergeable.pop(merge_key, None)
+            frames.append(payload)
+
+        if len(self._queue) < self.high_water:
+            self._over_since = None
+        return frames
+
+    async def _run(self):
+        while True:
+            await self._ready.wait()
+
+            while self._queue:
+                frames = self._take()
+                try:
+                    if len(frames) == 1:
+                        await self.write(frames[0])
+                    else:
+                        await self.write({"type": "batch", "frames": frames})
+                        counters["batches_sent"] += 1
+                except Exception:
+                    logger.exception("Outbound write failed, closing socket")
+                    counters["write_errors"] += 1
+                    self._discard()
+                    # Own task: the consumer's close may cancel this one
+                    asyncio.ensure_future(self.on_error())
+                    return
+                counters["frames_sent"] += len(frames)
+
+            self._ready.clear()
+
+    def _discard(self):
+        self._stopped = True
+        counters["discarded"] += len(self._queue)
+        self._queue.clear()
+        self._mergeable.clear()
+
+    def close(self):
+        """
+        Stop writing; whatever is still queued is discarded.
+        """
+        self._task.cancel()
+        self._discard()
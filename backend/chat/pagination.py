@@ -0,0 +1,110 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+class MessageCursorPagination(BasePagination):
+    """
+    Keyset pagination over (created_at, id).
+
+    Only kicks in when the client sends ?before=, ?after= or ?limit=,
+    so the old "whole thread as a list" response keeps working.
+
+    ?limit=N            -> newest N messages
+    ?before=<cursor>    -> N messages older than the cursor
+    ?after=<cursor>     -> N messages newer than the cursor
+
+    Results are always returned oldest → newest.
+    """
+
+    default_limit = 50
+    max_limit = 200
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if not any(key in params for key in ("before", "after", "limit")):
+            return None
+
+        self.limit = self.get_limit(request)
+        before = self.decode_cursor(params.get("before"))
+        after = self.decode_cursor(params.get("after"))
+
+        if after and not before:
+            # Walk forward from the cursor
+            rows = list(
+                queryset.filter(self.newer_than(after))
+                .order_by("created_at", "id")[:self.limit + 1]
+            )
+            self.has_newer = len(rows) > self.limit
+            self.has_older = True
+            rows = rows[:self.limit]
+        else:
+            # Newest page, or walk backward from the cursor
+            if before:
+                queryset = queryset.filter(self.older_than(before))
+            if after:
+                queryset = queryset.filter(self.newer_than(after))
+
+            rows = list(
+                queryset.order_by("-created_at", "-id")[:self.limit + 1]
+            )
+            self.has_older = len(rows) > self.limit
+            self.has_newer = before is not None
+            rows = rows[:self.limit]
+            rows.reverse()
+
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            "before": self.cursor_for(self.page[0]) if self.page and self.has_older else None,
+            "after": self.cursor_for(self.page[-1]) if self.page and self.has_newer else None,
+            "results": data,
+        })
+
+    # -------- CURSOR HELPERS --------
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params.get("limit", self.default_limit))
+        except (TypeError, ValueError):
+            return self.default_limit
+
+        if limit <= 0:
+            return self.default_limit
+        return min(limit, self.max_limit)
+
+    @staticmethod
+    def older_than(cursor):
+        created_at, pk = cursor
+        return Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+
+    @staticmethod
+    def newer_than(cursor):
+        created_at, pk = cursor
+        return Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+
+    @classmethod
+    def cursor_for(cls, message):
+        return cls.encode_cursor(message.created_at.isoformat(), message.id)
+
+    @staticmethod
+    def encode_cursor(created_at, pk):
+        raw = f"{created_at}|{pk}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, encoded):
+        if not encoded:
+            return None
+
+        try:
+            raw = base64.urlsafe_b64decode(encoded.encode()).decode()
+            created_at, pk = raw.rsplit("|", 1)
+            return datetime.fromisoformat(created_at), int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
@@ -0,0 +1,127 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from . import recent
+from .groups import thread_group_name
+from .imaging import render_preview
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_TYPES = {"image/jpeg", "image/png", "image/webp"}
+PREVIEW_MAX_SIZE = getattr(settings, "CHAT_PREVIEW_MAX_SIZE", 320)
+PREVIEW_WORKERS = getattr(settings, "CHAT_PREVIEW_WORKERS", 2)
+
+_render_pool = None
+_finish_pool = None
+# Requests commit (and so create the pools) from many threads at once
+_pool_lock = threading.Lock()
+
+
+def render_pool():
+    # Spawned (not forked) so workers don't inherit the server's threads
+    global _render_pool
+    if _render_pool is None:
+        with _pool_lock:
+            if _render_pool is None:
+                _render_pool = ProcessPoolExecutor(
+                    max_workers=PREVIEW_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+    return _render_pool
+
+
+def finish_pool():
+    # DB write + broadcast happen here, off the pool's result thread
+    global _finish_pool
+    if _finish_pool is None:
+        with _pool_lock:
+            if _finish_pool is None:
+                _finish_pool = ThreadPoolExecutor(max_workers=1)
+    return _finish_pool
+
+
+def schedule_preview(message):
+    """
+    Queue thumbnail generation for an image attachment once the
+    surrounding transaction commits. Never blocks the request.
+    """
+    if not message.attachment or message.attachment_type not in PREVIEW_TYPES:
+        return
+
+    transaction.on_commit(lambda: _submit(
+        message.id, message.thread_id, message.attachment.name
+    ))
+
+
+def _submit(message_id, thread_id, attachment_name):
+    storage = Message._meta.get_field("attachment").storage
+    preview_name = f"chat_previews/{message_id}.jpg"
+
+    try:
+        source_path = storage.path(attachment_name)
+        dest_path = storage.path(preview_name)
+    except NotImplementedError:
+        # Remote storage: workers can only read local files
+        return
+
+    future = render_pool().submit(
+        render_preview, source_path, dest_path, PREVIEW_MAX_SIZE
+    )
+    future.add_done_callback(
+        lambda done: finish_pool().submit(
+            _finish, message_id, thread_id, preview_name, done
+        )
+    )
+
+
+def _finish(message_id, thread_id, preview_name, future):
+    try:
+        result = future.result()
+    except Exception:
+        logger.exception("Preview generation failed for message %s", message_id)
+        return
+
+    close_old_connections()
+    try:
+        updated = Message.objects.filter(id=message_id).update(
+            preview=preview_name,
+            preview_placeholder=result["placeholder"],
+            attachment_width=result["width"],
+            attachment_height=result["height"]
+        )
+    finally:
+        close_old_connections()
+
+    if updated:
+        # Cached copies still have no preview
+        recent.invalidate(thread_id)
+
+        storage = Message._meta.get_field("preview").storage
+        broadcast_preview(thread_id, {
+            "id": message_id,
+            "thread": thread_id,
+            "preview": storage.url(preview_name),
+            "preview_placeholder": result["placeholder"],
+            "width": result["width"],
+            "height": result["height"],
+        })
+
+
+def broadcast_preview(thread_id, data):
+    # Same group as chat_message, consumers forward it as "message_update"
+    async_to_sync(get_channel_layer().group_send)(
+        thread_group_name(thread_id),
+        {
+            "type": "message_update",
+            "thread_id": thread_id,
+            "message": data
+        }
+    )
@@ -0,0 +1,272 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core import versioning
+from users.models import User
+from users.serializers import UserSerializer
+
+from .models import Message, ThreadWatermark
+from .serializers import MessageSerializer
+
+RECENT_MESSAGES_SIZE = getattr(settings, "CHAT_RECENT_MESSAGES_SIZE", 50)
+RECENT_MESSAGES_TTL = getattr(settings, "CHAT_RECENT_MESSAGES_TTL", 60 * 60)
+APPEND_LOCK_TIMEOUT = 5
+
+
+# -----------------------------
+# Keys (versioned via core.versioning)
+# -----------------------------
+def version_key(thread_id):
+    return f"thread_recent_v_{thread_id}"
+
+
+def buffer_key(thread_id, version):
+    return f"thread_recent_{thread_id}_{version}"
+
+
+def lock_key(thread_id):
+    return f"thread_recent_lock_{thread_id}"
+
+
+def _version(thread_id):
+    return versioning.current(version_key(thread_id))
+
+
+def invalidate(thread_id):
+    versioning.bump(version_key(thread_id))
+
+
+# -----------------------------
+# Buffer contents
+# -----------------------------
+# {"complete": bool, "entries": [entry, ...]} oldest → newest.
+# "complete" means the buffer holds the thread's entire history.
+def make_entry(message, data, deleted_by=()):
+    """
+    One ring-buffer slot: the request-independent serialized message
+    plus what the read path needs to filter and paginate it.
+    The sender's profile is not kept: render() reads it fresh.
+    """
+    return {
+        "id": message.id,
+        "created_at": message.created_at.isoformat(),
+        "sender_id": message.sender_id,
+        "deleted_by": list(deleted_by),
+        "data": {key: value for key, value in data.items() if key != "sender"},
+    }
+
+
+def load(thread_id):
+    """
+    The thread's newest RECENT_MESSAGES_SIZE messages, filled from the
+    DB on a miss (one query for the rows, one for their deletes).
+    """
+    version = _version(thread_id)
+    key = buffer_key(thread_id, version)
+
+    buffer = cache.get(key)
+    if buffer is not None:
+        return buffer
+
+    messages = list(
+        Message.objects.filter(
+            thread_id=thread_id
+        ).select_related(
+            "sender"
+        ).order_by("-created_at", "-id")[:RECENT_MESSAGES_SIZE + 1]
+    )
+    complete = len(messages) <= RECENT_MESSAGES_SIZE
+    messages = messages[:RECENT_MESSAGES_SIZE]
+    messages.reverse()
+
+    deleted = defaultdict(list)
+    for message_id, user_id in Message.deleted_by.through.objects.filter(
+        message_id__in=[message.id for message in messages]
+    ).values_list("message_id", "user_id"):
+        deleted[message_id].append(user_id)
+
+    data = MessageSerializer(
+        [message.prime_receipts() for message in messages], many=True
+    ).data
+    buffer = {
+        "complete": complete,
+        "entries": [
+            make_entry(message, item, deleted[message.id])
+            for message, item in zip(messages, data)
+        ],
+    }
+
+    # add(): an append that raced this fill may already have written
+    # a newer buffer; if it bumped the version instead, ours is orphaned
+    cache.add(key, buffer, RECENT_MESSAGES_TTL)
+    return buffer
+
+
+def append(thread_id, entries):
+    """
+    Push freshly committed messages onto the thread's buffer.
+
+    Call after the transaction commits. Appenders serialize on a short
+    cache lock; one that can't get it, or finds no buffer, bumps the
+    version instead, so a concurrent fill or append can never publish
+    a buffer that is missing this message.
+    """
+    lock = lock_key(thread_id)
+    if not cache.add(lock, 1, APPEND_LOCK_TIMEOUT):
+        invalidate(thread_id)
+        return
+
+    try:
+        key = buffer_key(thread_id, _version(thread_id))
+        buffer = cache.get(key)
+        if buffer is None:
+            invalidate(thread_id)
+            return
+
+        known = {entry["id"] for entry in buffer["entries"]}
+        merged = buffer["entries"] + [
+            entry for entry in entries if entry["id"] not in known
+        ]
+        merged.sort(key=lambda entry: entry["id"])
+
+        cache.set(key, {
+            "complete": buffer["complete"] and len(merged) <= RECENT_MESSAGES_SIZE,
+            "entries": merged[-RECENT_MESSAGES_SIZE:],
+        }, RECENT_MESSAGES_TTL)
+    finally:
+        cache.delete(lock)
+
+
+def record(message, data=None):
+    """
+    append() for one message; `data` is its serializer output without
+    a request (as broadcast), computed here if not given.
+    """
+    if data is None:
+        data = MessageSerializer(message.prime_receipts()).data
+    append(message.thread_id, [make_entry(message, data)])
+
+
+# -----------------------------
+# Read path
+# -----------------------------
+# A warm newest page never reads the messages table, but it is not
+# DB-free: receipt_pointers() and senders() are one small query each.
+# Both change too often (every read/delivery, every last_seen flush)
+# to be worth caching behind invalidation.
+def visible_page(buffer, user_id, limit=None):
+    """
+    (entries, has_older) for the user's newest page, with their own
+    deletes filtered out; None when the buffer can't answer exactly
+    and the caller must go to the DB.
+    limit=None asks for the whole thread.
+    """
+    visible = [
+        entry for entry in buffer["entries"]
+        if user_id not in entry["deleted_by"]
+    ]
+
+    if limit is not None and len(visible) > limit:
+        return visible[-limit:], True
+    if buffer["complete"]:
+        return visible, False
+    return None
+
+
+def receipt_pointers(thread_id):
+    """
+    ({user_id: [last_delivered_id, last_read_id]}, latest message id
+    from the thread summary), one small query. The latest id tells a
+    reader whether the buffer missed an append.
+    """
+    pointers = {}
+    latest_id = 0
+    for user_id, last_delivered_id, last_read_id, last_message_id in ThreadWatermark.objects.filter(
+        thread_id=thread_id
+    ).values_list(
+        "user_id", "last_delivered_id", "last_read_id",
+        "thread__summary__last_message_id"
+    ):
+        pointers[user_id] = [last_delivered_id, last_read_id]
+        latest_id = max(latest_id, last_message_id or 0)
+
+    return pointers, latest_id
+
+
+def newest_id(buffer):
+    return buffer["entries"][-1]["id"] if buffer["entries"] else 0
+
+
+def load_fresh(thread_id):
+    """
+    (buffer, receipt pointers): load(), refilled if the thread summary
+    shows a newer message than the buffer has, i.e. an append was
+    missed (crash between commit and cache write).
+    """
+    buffer = load(thread_id)
+    pointers, latest_id = receipt_pointers(thread_id)
+    if newest_id(buffer) < latest_id:
+        invalidate(thread_id)
+        buffer = load(thread_id)
+    return buffer, pointers
+
+
+def senders(sender_ids, context):
+    """
+    {user_id: UserSerializer output}: one query, so profile edits and
+    last_seen flushes show up without touching any buffer.
+    """
+    users = User.objects.filter(id__in=set(sender_ids))
+    return {
+        item["id"]: item
+        for item in UserSerializer(users, many=True, context=context).data
+    }
+
+
+def render(entries, pointers, context):
+    """
+    Cached rows → MessageSerializer output for this request.
+    Only the per-request / fast-changing parts are recomputed:
+    receipt counts (from receipt_pointers()), the sender (senders())
+    and absolute media URLs.
+    """
+    request = context.get("request")
+    user_id = request.user.id if request else None
+
+    profiles = senders([entry["sender_id"] for entry in entries], context)
+
+    results = []
+    for entry in entries:
+        data = dict(entry["data"])
+        message_id, sender_id = entry["id"], entry["sender_id"]
+
+        delivered = read = 0
+        for member_id, (last_delivered_id, last_read_id) in pointers.items():
+            if member_id == sender_id:
+                continue
+            delivered += last_delivered_id >= message_id
+            read += last_read_id >= message_id
+
+        data["delivered_count"] = delivered
+        data["read_count"] = read
+        if not request:
+            data["delivery_status"] = "sent"
+        elif sender_id != user_id:
+            data["delivery_status"] = None
+        else:
+            data["delivery_status"] = (
+                "read" if read else "delivered" if delivered else "sent"
+            )
+
+        data["sender"] = profiles.get(sender_id)
+
+        if request:
+            for field in ("attachment", "preview"):
+                if data.get(field):
+                    data[field] = request.build_absolute_uri(data[field])
+
+        results.append(data)
+
+    return results
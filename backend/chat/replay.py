@@ -0,0 +1,92 @@
+from django.conf import settings
+
+from . import recent
+from .models import Message
+from .serializers import MessageSerializer
+
+REPLAY_MAX_MESSAGES = getattr(settings, "CHAT_REPLAY_MAX_MESSAGES", 200)
+REPLAY_BATCH_SIZE = getattr(settings, "CHAT_REPLAY_BATCH_SIZE", 50)
+
+
+def thread_backlog(thread_id, user_id, after_id, limit=None):
+    """
+    Messages in the thread newer than `after_id` that the user can see,
+    oldest first and serialized like live broadcasts; None when there
+    are more than `limit` (the client should resync over REST).
+
+    Served from the recent-messages buffer when it reaches back to
+    `after_id`, so a short drop costs no message query at all.
+    """
+    limit = limit or REPLAY_MAX_MESSAGES
+    buffer, pointers = recent.load_fresh(thread_id)
+    entries = buffer["entries"]
+
+    if buffer["complete"] or (entries and entries[0]["id"] <= after_id):
+        missed = [
+            entry for entry in entries
+            if entry["id"] > after_id and user_id not in entry["deleted_by"]
+        ]
+        if len(missed) > limit:
+            return None
+        return recent.render(missed, pointers, {})
+
+    return _from_db(
+        Message.objects.filter(thread_id=thread_id), user_id, after_id, limit
+    )
+
+
+def user_backlog(thread_ids, user_id, after_id, limit=None):
+    """
+    thread_backlog() across several threads in one query (message ids
+    are global, so one "last seen" id covers all of them).
+    """
+    return _from_db(
+        Message.objects.filter(thread_id__in=thread_ids),
+        user_id, after_id, limit or REPLAY_MAX_MESSAGES
+    )
+
+
+def threads_behind(thread_ids, user_id, after_id):
+    """
+    Which of thread_ids have visible messages newer than `after_id`:
+    the threads to resync when user_backlog() overflowed.
+    """
+    return sorted(set(
+        Message.objects.filter(
+            thread_id__in=thread_ids,
+            id__gt=after_id
+        ).exclude(
+            deleted_by=user_id
+        ).values_list("thread_id", flat=True)
+    ))
+
+
+def _from_db(messages, user_id, after_id, limit):
+    rows = list(
+        messages.filter(
+            id__gt=after_id
+        ).exclude(
+            deleted_by=user_id
+        ).select_related(
+            "sender"
+        ).with_receipts().order_by("id")[:limit + 1]
+    )
+    if len(rows) > limit:
+        return None
+    return MessageSerializer(rows, many=True).data
+
+
+def batches(messages, size=None):
+    """
+    Replay frames: {"type": "replay", "messages": [...], "more": bool}.
+    Always at least one, so an empty replay still tells the client it
+    is caught up.
+    """
+    size = size or REPLAY_BATCH_SIZE
+    messages = list(messages)
+    for start in range(0, max(len(messages), 1), size):
+        yield {
+            "type": "replay",
+            "messages": messages[start:start + size],
+            "more": start + size < len(messages),
+        }
@@ -1,7 +1,9 @@
 from django.urls import re_path
-from .consumers import EchoConsumer, ChatConsumer
+from .consumers import EchoConsumer, ChatConsumer, MultiplexChatConsumer
 
 websocket_urlpatterns = [
     re_path(r"ws/echo/$", EchoConsumer.as_asgi()),
+    re_path(r"ws/chat/$", MultiplexChatConsumer.as_asgi()),
+    # Per-thread sockets, kept for older clients
     re_path(r"ws/chat/(?P<thread_id>\d+)/$", ChatConsumer.as_asgi()),
 ]
\ No newline at end of file
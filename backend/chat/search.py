@@ -0,0 +1,209 @@
+import re
+
+from django.conf import settings
+from django.db import connection, connections
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+
+from .models import Message, Thread
+
+SNIPPET_TOKENS = 12
+HIGHLIGHT_OPEN = "<mark>"
+HIGHLIGHT_CLOSE = "</mark>"
+
+# snippet() wraps matches in these; the text is HTML-escaped before they
+# become real <mark> tags, so message text can't smuggle markup through
+SNIPPET_OPEN = "\ue000"
+SNIPPET_CLOSE = "\ue001"
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Created by migration 0012. SQLite drops a table's triggers when a
+# migration rebuilds it (most AlterField/RemoveField on Message), and
+# the index then silently stops following new messages
+FTS_TRIGGERS = (
+    "chat_message_fts_insert",
+    "chat_message_fts_delete",
+    "chat_message_fts_update",
+)
+
+
+def missing_fts_triggers(using=None):
+    """
+    FTS_TRIGGERS absent from the database, or () when there is no FTS
+    index to keep in sync (not SQLite, or migration 0012 not applied).
+    """
+    conn = connection if using is None else connections[using]
+    if conn.vendor != "sqlite":
+        return ()
+
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT type, name FROM sqlite_master "
+            "WHERE name = 'chat_message_fts' OR type = 'trigger'"
+        )
+        found = {name for _, name in cursor.fetchall()}
+
+    if "chat_message_fts" not in found:
+        return ()
+    return tuple(name for name in FTS_TRIGGERS if name not in found)
+
+
+class SearchHit:
+    def __init__(self, message_id, rank, snippet):
+        self.message_id = message_id
+        self.rank = rank
+        self.snippet = snippet
+
+
+class BaseSearchBackend:
+    """
+    Search message text visible to `user`: threads they belong to,
+    minus messages they deleted for themselves.
+    Returns (hits, has_more), best match first.
+    """
+
+    def search(self, user, query, thread_id=None, limit=20, offset=0):
+        raise NotImplementedError
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """
+    Ranked search over the chat_message_fts FTS5 index
+    (created and kept in sync by migration 0012).
+    """
+
+    def search(self, user, query, thread_id=None, limit=20, offset=0):
+        match = self.build_match(query)
+        if not match:
+            return [], False
+
+        members_table = Thread.members.through._meta.db_table
+        deleted_table = Message.deleted_by.through._meta.db_table
+
+        sql = f"""
+            SELECT m.id,
+                   bm25(chat_message_fts) AS rank,
+                   snippet(chat_message_fts, 0, %s, %s, '…', %s)
+            FROM chat_message_fts
+            JOIN {Message._meta.db_table} m ON m.id = chat_message_fts.rowid
+            WHERE chat_message_fts MATCH %s
+              AND m.thread_id IN (
+                  SELECT thread_id FROM {members_table} WHERE user_id = %s
+              )
+              AND m.id NOT IN (
+                  SELECT message_id FROM {deleted_table} WHERE user_id = %s
+              )
+        """
+        params = [
+            SNIPPET_OPEN, SNIPPET_CLOSE, SNIPPET_TOKENS,
+            match, user.id, user.id,
+        ]
+
+        if thread_id is not None:
+            sql += " AND m.thread_id = %s"
+            params.append(thread_id)
+
+        sql += " ORDER BY rank, m.id DESC LIMIT %s OFFSET %s"
+        params += [limit + 1, offset]
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        hits = [
+            SearchHit(message_id, rank, mark_snippet(snippet))
+            for message_id, rank, snippet in rows[:limit]
+        ]
+        return hits, len(rows) > limit
+
+    @staticmethod
+    def build_match(query):
+        """
+        Turn free text into a safe FTS5 expression: every word quoted
+        (no operator injection), last word prefix-matched for
+        search-as-you-type.
+        """
+        words = WORD_RE.findall(query)
+        if not words:
+            return ""
+
+        terms = ['"%s"' % word.replace('"', '""') for word in words]
+        terms[-1] += "*"
+        return " ".join(terms)
+
+
+class BasicSearchBackend(BaseSearchBackend):
+    """
+    Portable fallback for databases without an FTS index configured:
+    every word must appear (case-insensitive), newest first.
+    """
+
+    def search(self, user, query, thread_id=None, limit=20, offset=0):
+        words = WORD_RE.findall(query)
+        if not words:
+            return [], False
+
+        messages = Message.objects.filter(
+            thread__members=user
+        ).exclude(deleted_by=user)
+
+        if thread_id is not None:
+            messages = messages.filter(thread_id=thread_id)
+
+        for word in words:
+            messages = messages.filter(text__icontains=word)
+
+        rows = list(
+            messages.order_by("-id").values_list("id", "text")[offset:offset + limit + 1]
+        )
+
+        hits = [
+            SearchHit(message_id, None, highlight(text, words))
+            for message_id, text in rows[:limit]
+        ]
+        return hits, len(rows) > limit
+
+
+def mark_snippet(snippet):
+    """
+    FTS snippet() output → safe HTML: escape, then sentinels → <mark>.
+    """
+    return escape(snippet or "").replace(
+        SNIPPET_OPEN, HIGHLIGHT_OPEN
+    ).replace(
+        SNIPPET_CLOSE, HIGHLIGHT_CLOSE
+    )
+
+
+def highlight(text, words):
+    """
+    Cheap snippet: a window around the first match with <mark> tags.
+    Text between the marks is HTML-escaped.
+    """
+    pattern = re.compile("|".join(re.escape(word) for word in words), re.IGNORECASE)
+    found = pattern.search(text)
+    start = max(found.start() - 40, 0) if found else 0
+    window = text[start:start + 160]
+
+    parts = []
+    end = 0
+    for match in pattern.finditer(window):
+        parts.append(escape(window[end:match.start()]))
+        parts.append(f"{HIGHLIGHT_OPEN}{escape(match.group(0))}{HIGHLIGHT_CLOSE}")
+        end = match.end()
+    parts.append(escape(window[end:]))
+
+    prefix = "…" if start else ""
+    suffix = "…" if start + 160 < len(text) else ""
+    return f"{prefix}{''.join(parts)}{suffix}"
+
+
+def get_backend():
+    path = getattr(settings, "CHAT_SEARCH_BACKEND", None)
+    if path:
+        return import_string(path)()
+
+    if connection.vendor == "sqlite":
+        return SQLiteFTSBackend()
+    return BasicSearchBackend()
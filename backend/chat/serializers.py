@@ -1,6 +1,14 @@
 from rest_framework import serializers
-from users.serializers import UserSerializer
-from .models import Thread, Message
+from django.db.models.manager import BaseManager
+from users.serializers import UserSerializer, prefetch_presence
+from .models import Thread, Message, ThreadSummary, ThreadWatermark
+
+
+class MessageListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        messages = list(data.all() if isinstance(data, BaseManager) else data)
+        prefetch_presence(self.context, [msg.sender_id for msg in messages])
+        return super().to_representation(messages)
 
 
 class MessageSerializer(serializers.ModelSerializer):
@@ -14,6 +22,8 @@ class MessageSerializer(serializers.ModelSerializer):
     file_name = serializers.SerializerMethodField()
     file_size = serializers.SerializerMethodField()
     file_type = serializers.SerializerMethodField()
+    width = serializers.IntegerField(source="attachment_width", read_only=True)
+    height = serializers.IntegerField(source="attachment_height", read_only=True)
 
     class Meta:
         model = Message
@@ -30,16 +40,34 @@ class MessageSerializer(serializers.ModelSerializer):
             "file_name",
             "file_size",
             "file_type",
+            "preview",
+            "preview_placeholder",
+            "width",
+            "height",
             "delivery_status",
             
         ]
-        read_only_fields = ['sender', 'created_at', 'thread']
+        read_only_fields = ['sender', 'created_at', 'thread', 'preview', 'preview_placeholder']
+        list_serializer_class = MessageListSerializer
 
+    # Counts come from Message.objects.with_receipts() / prime_receipts();
+    # the per-message queries are only a fallback.
     def get_delivered_count(self, obj):
-        return obj.delivered_to.count()
+        if hasattr(obj, "delivered_count"):
+            return obj.delivered_count
+        return self._receipts(obj, "last_delivered_id").count()
 
     def get_read_count(self, obj):
-        return obj.read_by.count()    
+        if hasattr(obj, "read_count"):
+            return obj.read_count
+        return self._receipts(obj, "last_read_id").count()
+
+    def _receipts(self, obj, pointer):
+        # Members (other than the sender) whose watermark covers this message
+        return ThreadWatermark.objects.filter(
+            thread_id=obj.thread_id,
+            **{f"{pointer}__gte": obj.id}
+        ).exclude(user_id=obj.sender_id)
 
     def get_delivery_status(self, obj):
         """
@@ -53,13 +81,13 @@ class MessageSerializer(serializers.ModelSerializer):
         user = request.user
 
         # only sender cares about status
-        if obj.sender != user:
+        if obj.sender_id != user.id:
             return None
 
-        if obj.read_by.exists():
+        if self.get_read_count(obj):
             return "read"
 
-        if obj.delivered_to.exists():
+        if self.get_delivered_count(obj):
             return "delivered"
 
         return "sent"
@@ -68,21 +96,35 @@ class MessageSerializer(serializers.ModelSerializer):
     def get_is_media(self, obj):
         return bool(obj.attachment)
 
+    # Stored at upload time → no storage calls here
     def get_file_name(self, obj):
         if obj.attachment:
-            return obj.attachment.name.split("/")[-1]
+            return obj.attachment_name or obj.attachment.name.split("/")[-1]
         return None
 
     def get_file_size(self, obj):
         if obj.attachment:
-            return obj.attachment.size
+            return obj.attachment_size
         return None
 
     def get_file_type(self, obj):
         if obj.attachment:
-            return obj.attachment.file.content_type
+            return obj.attachment_type or None
         return None
 
+class ThreadListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        threads = list(data.all() if isinstance(data, BaseManager) else data)
+
+        # One presence lookup for every member of every thread
+        prefetch_presence(self.context, [
+            member.id
+            for thread in threads
+            for member in thread.members.all()
+        ])
+        return super().to_representation(threads)
+
+
 class ThreadSerializer(serializers.ModelSerializer):
     members = UserSerializer(many=True, read_only=True)
     last_message = serializers.SerializerMethodField()
@@ -98,20 +140,26 @@ class ThreadSerializer(serializers.ModelSerializer):
             'last_message',
             'unread_count',
         ]
+        list_serializer_class = ThreadListSerializer
 
     def get_last_message(self, obj):
-        msg = obj.messages.order_by('-created_at').first()
-        if msg:
-            return MessageSerializer(msg).data
-        return None
+        # Served from the denormalized summary (select_related by the inbox)
+        try:
+            return obj.summary.last_message
+        except ThreadSummary.DoesNotExist:
+            return None
 
     def get_unread_count(self, obj):
         """
-        Count messages not read by current user
+        Messages not read by current user (maintained counter)
         """
         request = self.context.get("request")
         if not request or request.user.is_anonymous:
             return 0
 
-        user = request.user
-        return obj.messages.exclude(read_by=user).count()
\ No newline at end of file
+        # Annotated by ThreadListView, no extra query per thread
+        if hasattr(obj, "my_unread_count"):
+            return obj.my_unread_count or 0
+
+        watermark = obj.watermarks.filter(user=request.user).first()
+        return watermark.unread_count if watermark else 0
\ No newline at end of file
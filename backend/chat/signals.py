@@ -0,0 +1,50 @@
+from django.db.models.signals import m2m_changed, post_delete
+from django.dispatch import receiver
+
+from . import membership, recent
+from .models import Message, Thread
+
+
+# Member lists are cached per thread; any change bumps its version
+@receiver(m2m_changed, sender=Thread.members.through)
+def members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+
+    if not reverse:
+        membership.invalidate(instance.id)
+    elif action == "pre_clear":
+        for thread_id in instance.threads.values_list("id", flat=True):
+            membership.invalidate(thread_id)
+    else:
+        for thread_id in pk_set:
+            membership.invalidate(thread_id)
+
+
+@receiver(post_delete, sender=Thread)
+def thread_deleted(sender, instance, **kwargs):
+    membership.invalidate(instance.id)
+
+
+# Recent-message buffers carry each message's deleted_by; drop the
+# thread's buffer when a message is deleted (for anyone, or for good)
+@receiver(m2m_changed, sender=Message.deleted_by.through)
+def message_deletes_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+
+    if not reverse:
+        recent.invalidate(instance.thread_id)
+        return
+
+    if action == "pre_clear":
+        messages = instance.deleted_messages.all()
+    else:
+        messages = Message.objects.filter(id__in=pk_set)
+    for thread_id in set(messages.values_list("thread_id", flat=True)):
+        recent.invalidate(thread_id)
+
+
+@receiver(post_delete, sender=Message)
+def message_deleted(sender, instance, **kwargs):
+    recent.invalidate(instance.thread_id)
@@ -0,0 +1,108 @@
+from collections import defaultdict
+
+from django.db.models import Case, F, Value, When
+from rest_framework import serializers
+
+from .models import ThreadSummary, ThreadWatermark
+
+
+def snapshot_message(message):
+    """
+    Small, request-independent copy of a message for the inbox row.
+    """
+    return {
+        "id": message.id,
+        "text": message.text,
+        "sender": {
+            "id": message.sender_id,
+            "username": message.sender.username,
+        },
+        "created_at": serializers.DateTimeField().to_representation(
+            message.created_at
+        ),
+        "is_media": bool(message.attachment),
+        "file_name": message.attachment_name or None,
+    }
+
+
+def init_thread(thread):
+    """
+    Seed the summary and per-member watermarks for a new thread.
+    """
+    ThreadSummary.objects.get_or_create(thread=thread)
+    ThreadWatermark.objects.ensure_members(thread)
+
+
+def record_message(message):
+    """
+    Fold a freshly created message into its thread's summary:
+    last message snapshot, last activity time and the unread
+    counters of every other member.
+    """
+    record_messages([message])
+
+
+def record_messages(messages):
+    """
+    Batch form of record_message: one summary update per thread and
+    one counter update per (thread, sender), however many messages.
+    """
+    latest = {}
+    per_sender = defaultdict(list)
+
+    for message in messages:
+        current = latest.get(message.thread_id)
+        if current is None or message.id > current.id:
+            latest[message.thread_id] = message
+        per_sender[(message.thread_id, message.sender_id)].append(message.id)
+
+    for thread_id, message in latest.items():
+        _update_summary(message)
+
+    for (thread_id, sender_id), message_ids in per_sender.items():
+        ThreadWatermark.objects.filter(
+            thread_id=thread_id,
+            last_read_id__lt=max(message_ids)
+        ).exclude(
+            user_id=sender_id
+        ).update(unread_count=F("unread_count") + _unread_among(message_ids))
+
+
+def _unread_among(message_ids):
+    """
+    How many of message_ids lie past the member's read pointer. A
+    reader who already saw a message (advance_read committed first)
+    must not have it counted again, or the counter never gets back
+    to zero.
+    """
+    message_ids = sorted(message_ids)
+    return Case(
+        *[
+            When(last_read_id__lt=message_id, then=Value(len(message_ids) - n))
+            for n, message_id in enumerate(message_ids)
+        ],
+        default=Value(0)
+    )
+
+
+def _update_summary(message):
+    snapshot = snapshot_message(message)
+
+    updated = ThreadSummary.objects.filter(
+        thread_id=message.thread_id,
+        last_message_id__lt=message.id
+    ).update(
+        last_message_id=message.id,
+        last_message=snapshot,
+        last_activity_at=message.created_at
+    )
+
+    if not updated:
+        ThreadSummary.objects.get_or_create(
+            thread_id=message.thread_id,
+            defaults={
+                "last_message_id": message.id,
+                "last_message": snapshot,
+                "last_activity_at": message.created_at,
+            }
+        )
@@ -1,3 +1,1307 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core import metrics
+from core.asgi import application
+from users import presence
+from users.models import User
+
+from . import codecs, previews, recent, replay, search, uploads
+from .delivery import DeliveryAckBuffer
+from .models import Message, Thread, ThreadWatermark, UploadSession
+from .outbound import OutboundQueue
+from .pagination import MessageCursorPagination
+from .summary import init_thread, record_message, record_messages
+from .typing import TypingDebouncer
+from .writer import MessageWriter
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix="chat-tests-")
+
+# No Redis needed: local cache and in-memory channel layer
+TEST_SETTINGS = {
+    "CACHES": {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    },
+    "CHANNEL_LAYERS": {
+        "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"},
+    },
+    "MEDIA_ROOT": MEDIA_ROOT,
+}
+
+# Generous: catches accidental N+1 / full scans, not machine noise
+TIME_BUDGET = 1.0  # seconds per request on the large fixture
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+class ChatFixtures:
+    """
+    Realistic-ish data: group threads with several members, history
+    with attachments, per-user deletes and read/delivery pointers.
+    """
+
+    @classmethod
+    def make_user(cls, username):
+        return User.objects.create_user(username=username, password=None)
+
+    @classmethod
+    def make_thread(cls, owner, members, messages):
+        thread = Thread.objects.create(name="" if len(members) == 1 else "group")
+        thread.members.add(owner, *members)
+        init_thread(thread)
+
+        senders = [owner, *members]
+        last = None
+        for n in range(messages):
+            sender = senders[n % len(senders)]
+            if n % 5 == 0:
+                last = Message.objects.create(
+                    thread=thread,
+                    sender=sender,
+                    text=f"photo {n}",
+                    attachment=f"chat_attachments/photo_{n}.jpg",
+                    attachment_name=f"photo_{n}.jpg",
+                    attachment_type="image/jpeg",
+                    attachment_size=1024 * n,
+                )
+            else:
+                last = Message.objects.create(
+                    thread=thread, sender=sender, text=f"message {n}"
+                )
+            record_message(last)
+
+            if n % 7 == 0:
+                last.deleted_by.add(owner)
+
+        if last:
+            for member in members:
+                ThreadWatermark.objects.advance_read(thread.id, member.id, last.id)
+
+        return thread
+
+    @classmethod
+    def seed(cls, owner, threads, messages, group_size=3):
+        others = [
+            cls.make_user(f"{owner.username}_peer_{n}")
+            for n in range(group_size)
+        ]
+        return [
+            cls.make_thread(
+                owner, others[:1 + n % group_size], messages
+            )
+            for n in range(threads)
+        ]
+
+    def tearDown(self):
+        # Sockets leave last_seen marks behind; write them while the
+        # test DB still exists instead of leaking them into the next test
+        presence.last_seen_buffer.flush()
+        super().tearDown()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def measure(self, request):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = request()
+            elapsed = time.perf_counter() - started
+
+        self.assertLess(response.status_code, 300, response.content)
+        return len(queries), elapsed
+
+
+@override_settings(**TEST_SETTINGS)
+class RestQueryBudgetTests(ChatFixtures, TestCase):
+    """
+    Each endpoint runs against a small and a large fixture. The query
+    count must be identical (no scaling with data) and within budget.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.small_user = cls.make_user("small")
+        cls.large_user = cls.make_user("large")
+        cls.small_threads = cls.seed(cls.small_user, threads=2, messages=3)
+        cls.large_threads = cls.seed(cls.large_user, threads=25, messages=40)
+
+    def setUp(self):
+        cache.clear()
+
+    def assertBudget(self, request_for, budget):
+        small, _ = self.measure(request_for(self.small_user, self.small_threads))
+        large, elapsed = self.measure(request_for(self.large_user, self.large_threads))
+
+        self.assertEqual(small, large, "query count grows with data size")
+        self.assertLessEqual(large, budget)
+        self.assertLess(elapsed, TIME_BUDGET)
+
+    def test_thread_list(self):
+        self.assertBudget(
+            lambda user, threads: lambda: self.client_for(user).get("/api/chat/"),
+            budget=2,
+        )
+
+    # Cold cache: membership, recent-messages fill (rows + deletes),
+    # receipt pointers, senders, read UPDATE
+    def test_message_list(self):
+        self.assertBudget(
+            lambda user, threads: lambda: self.client_for(user).get(
+                f"/api/chat/{threads[0].id}/messages/"
+            ),
+            budget=6,
+        )
+
+    def test_message_list_page(self):
+        self.assertBudget(
+            lambda user, threads: lambda: self.client_for(user).get(
+                f"/api/chat/{threads[0].id}/messages/", {"limit": 20}
+            ),
+            budget=6,
+        )
+
+    def test_message_list_page_cached(self):
+        # Warm buffer, already read: no message query, only receipt
+        # pointers and senders
+        def request_for(user, threads):
+            path = f"/api/chat/{threads[0].id}/messages/"
+            self.client_for(user).get(path, {"limit": 20})
+            return lambda: self.client_for(user).get(path, {"limit": 20})
+
+        self.assertBudget(request_for, budget=2)
+
+    def test_message_list_older_page(self):
+        # Cursor pages always come from the DB
+        def request_for(user, threads):
+            path = f"/api/chat/{threads[0].id}/messages/"
+            before = self.client_for(user).get(path, {"limit": 1}).json()["before"]
+            return lambda: self.client_for(user).get(
+                path, {"limit": 1, "before": before}
+            )
+
+        self.assertBudget(request_for, budget=4)
+
+    def test_send_message(self):
+        self.assertBudget(
+            lambda user, threads: lambda: self.client_for(user).post(
+                f"/api/chat/{threads[-1].id}/send/", {"text": "hello"}
+            ),
+            budget=6,
+        )
+
+    def test_create_thread_existing(self):
+        def request_for(user, threads):
+            other = self.make_user(f"{user.username}_dm")
+            Thread.objects.get_or_create_direct(user, other)
+            return lambda: self.client_for(user).post(
+                "/api/chat/create/", {"username": other.username}
+            )
+
+        self.assertBudget(request_for, budget=6)
+
+    def test_create_thread_new(self):
+        def request_for(user, threads):
+            other = self.make_user(f"{user.username}_new")
+            return lambda: self.client_for(user).post(
+                "/api/chat/create/", {"username": other.username}
+            )
+
+        self.assertBudget(request_for, budget=16)
+
+
+@override_settings(**TEST_SETTINGS)
+class RecentMessagesTests(ChatFixtures, TestCase):
+    """
+    The newest page served from chat.recent must match what the DB
+    path returns for the same request.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = cls.make_user("owner")
+        cls.thread = cls.seed(cls.owner, threads=1, messages=30, group_size=2)[0]
+        cls.peer = cls.thread.members.exclude(id=cls.owner.id).first()
+
+    def setUp(self):
+        cache.clear()
+        self.path = f"/api/chat/{self.thread.id}/messages/"
+
+    def fetch(self, user, params=None, from_db=False):
+        if from_db:
+            with mock.patch.object(recent, "visible_page", return_value=None):
+                return self.client_for(user).get(self.path, params).json()
+        return self.client_for(user).get(self.path, params).json()
+
+    def test_matches_db(self):
+        for params in (None, {"limit": 10}):
+            for user in (self.owner, self.peer):
+                cached = self.fetch(user, params)
+                self.assertEqual(cached, self.fetch(user, params, from_db=True))
+
+    def test_deletes_filtered_per_user(self):
+        owner_ids = [message["id"] for message in self.fetch(self.owner)]
+        peer_ids = [message["id"] for message in self.fetch(self.peer)]
+
+        deleted = set(peer_ids) - set(owner_ids)
+        self.assertTrue(deleted)
+        self.assertEqual(len(peer_ids), 30)
+
+        # Deleting for someone drops the cached copy
+        Message.objects.get(id=peer_ids[-1]).deleted_by.add(self.peer)
+        self.assertNotIn(peer_ids[-1], [m["id"] for m in self.fetch(self.peer)])
+
+    def test_sent_message_appended(self):
+        self.fetch(self.owner, {"limit": 5})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sent = self.client_for(self.peer).post(
+                f"/api/chat/{self.thread.id}/send/", {"text": "fresh"}
+            ).json()
+
+        with CaptureQueriesContext(connection) as queries:
+            page = self.fetch(self.owner, {"limit": 5})
+
+        self.assertEqual(page["results"][-1]["id"], sent["id"])
+        self.assertEqual(page, self.fetch(self.owner, {"limit": 5}, from_db=True))
+        self.assertFalse(
+            [q for q in queries if Message._meta.db_table in q["sql"]],
+            "newest page read the messages table"
+        )
+
+    def test_sender_profile_not_frozen(self):
+        self.fetch(self.owner)
+
+        # No signals: like the last_seen flush
+        User.objects.filter(id=self.peer.id).update(
+            bio="naya bio", last_seen=timezone.now()
+        )
+
+        page = self.fetch(self.owner)
+        sent_by_peer = [m["sender"] for m in page if m["sender"]["id"] == self.peer.id]
+        self.assertTrue(sent_by_peer)
+        self.assertEqual({sender["bio"] for sender in sent_by_peer}, {"naya bio"})
+        self.assertEqual(page, self.fetch(self.owner, from_db=True))
+
+
+@override_settings(**TEST_SETTINGS)
+class WebSocketQueryBudgetTests(ChatFixtures, TransactionTestCase):
+    """
+    Consumer DB helpers run in sync_to_async worker threads, so queries
+    are counted with core.metrics' process-wide counter instead of
+    CaptureQueriesContext.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def connect_and_send(self, user, thread):
+        def executed():
+            return metrics.db_queries_total.value()
+
+        async def settle(communicator):
+            while not await communicator.receive_nothing(0.3):
+                await communicator.receive_output()
+
+        async def run():
+            communicator = WebsocketCommunicator(
+                application,
+                f"/ws/chat/?token={AccessToken.for_user(user)}"
+            )
+            before = executed()
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await settle(communicator)
+            connect_queries = executed() - before
+
+            before = executed()
+            await communicator.send_json_to({
+                "type": "message", "thread_id": thread.id, "message": "hi"
+            })
+            await settle(communicator)
+            send_queries = executed() - before
+
+            await communicator.disconnect()
+            return connect_queries, send_queries
+
+        return asyncio.run(run())
+
+    def test_connect_and_send(self):
+        small_user = self.make_user("small")
+        large_user = self.make_user("large")
+        small = self.seed(small_user, threads=2, messages=3)
+        large = self.seed(large_user, threads=25, messages=20)
+
+        small_connect, small_send = self.connect_and_send(small_user, small[0])
+        cache.clear()
+        large_connect, large_send = self.connect_and_send(large_user, large[0])
+
+        self.assertEqual(small_connect, large_connect)
+        self.assertEqual(small_send, large_send)
+        self.assertLessEqual(large_connect, 4)
+        self.assertLessEqual(large_send, 6)
+
+
+@override_settings(**TEST_SETTINGS)
+class ReplayTests(ChatFixtures, TransactionTestCase):
+    """
+    Reconnecting with ?last_message_id= replays only what was missed.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.me = self.make_user("me")
+        self.peer = self.make_user("peer")
+        self.thread = self.make_thread(self.peer, [self.me], messages=3)
+        self.seen_id = self.thread.messages.order_by("id").last().id
+
+        self.missed = [
+            Message.objects.create(thread=self.thread, sender=self.peer, text=f"missed {n}")
+            for n in range(5)
+        ]
+        for message in self.missed:
+            record_message(message)
+        self.missed[1].deleted_by.add(self.me)
+
+    def reconnect(self, path, last_message_id):
+        async def run():
+            communicator = WebsocketCommunicator(
+                application,
+                f"{path}?token={AccessToken.for_user(self.me)}"
+                f"&last_message_id={last_message_id}"
+            )
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+
+            frames = []
+            while not await communicator.receive_nothing(0.3):
+                frames.append(await communicator.receive_json_from())
+            await communicator.disconnect()
+            return [f for f in frames if f["type"] in ("replay", "resync")]
+
+        return asyncio.run(run())
+
+    def expected_ids(self):
+        return [m.id for m in self.missed if m is not self.missed[1]]
+
+    def test_thread_socket_replay(self):
+        for warm in (False, True):
+            if warm:
+                recent.load(self.thread.id)
+            frames = self.reconnect(f"/ws/chat/{self.thread.id}/", self.seen_id)
+
+            self.assertEqual(len(frames), 1)
+            self.assertFalse(frames[0]["more"])
+            self.assertEqual(
+                [m["id"] for m in frames[0]["messages"]], self.expected_ids()
+            )
+
+    def test_multiplexed_replay(self):
+        other = self.make_thread(self.peer, [self.me], messages=2)
+        frames = self.reconnect("/ws/chat/", self.seen_id)
+
+        messages = [m for frame in frames for m in frame["messages"]]
+        self.assertEqual(
+            [m["id"] for m in messages if m["thread"] == self.thread.id],
+            self.expected_ids()
+        )
+        self.assertEqual(
+            len([m for m in messages if m["thread"] == other.id]), 2
+        )
+
+    def test_batches_and_resync(self):
+        with mock.patch.object(replay, "REPLAY_BATCH_SIZE", 2):
+            frames = self.reconnect(f"/ws/chat/{self.thread.id}/", self.seen_id)
+        self.assertEqual([f["more"] for f in frames], [True, False])
+
+        with mock.patch.object(replay, "REPLAY_MAX_MESSAGES", 2):
+            frames = self.reconnect(f"/ws/chat/{self.thread.id}/", self.seen_id)
+        self.assertEqual(frames, [{"type": "resync", "thread_id": self.thread.id}])
+
+    def test_multiplexed_resync_per_thread(self):
+        other = self.make_thread(self.peer, [self.me], messages=2)
+        quiet = self.make_thread(self.peer, [self.me], messages=0)
+
+        with mock.patch.object(replay, "REPLAY_MAX_MESSAGES", 2):
+            frames = self.reconnect("/ws/chat/", self.seen_id)
+
+        self.assertEqual(
+            sorted(frames, key=lambda frame: frame["thread_id"]),
+            [{"type": "resync", "thread_id": thread.id} for thread in (self.thread, other)]
+        )
+        self.assertNotIn(quiet.id, [frame["thread_id"] for frame in frames])
+
+
+class DeliveryAckBufferTests(SimpleTestCase):
+    def test_mark_flushed_skips_covered_acks(self):
+        flushed = []
+
+        async def run():
+            async def flush(up_to_id):
+                flushed.append(up_to_id)
+
+            acks = DeliveryAckBuffer(flush, delay=0)
+            acks.mark_flushed(10)
+            acks.ack(7)
+            await acks.flush()
+            acks.ack(12)
+            await acks.close()
+
+        asyncio.run(run())
+        self.assertEqual(flushed, [12])
+
+    def test_burst_coalesces_into_one_flush(self):
+        flushed = []
+
+        async def run():
+            async def flush(up_to_id):
+                flushed.append(up_to_id)
+
+            acks = DeliveryAckBuffer(flush, delay=0.01)
+            for message_id in (3, 7, 5):
+                acks.ack(message_id)
+            await asyncio.sleep(0.05)
+            await acks.close()
+
+        asyncio.run(run())
+        self.assertEqual(flushed, [7])
+
+    def test_failed_flush_is_retried(self):
+        calls = []
+
+        async def run():
+            async def flush(up_to_id):
+                calls.append(up_to_id)
+                if len(calls) == 1:
+                    raise RuntimeError("db down")
+
+            acks = DeliveryAckBuffer(flush, delay=0.01)
+            acks.ack(4)
+            with self.assertLogs("chat.delivery", "ERROR"):
+                await asyncio.sleep(0.05)
+            self.assertEqual(acks.flushed_id, 0)
+
+            await acks.close()
+
+        asyncio.run(run())
+        self.assertEqual(calls, [4, 4])
+
+
+@override_settings(**TEST_SETTINGS)
+class ForgedReceiptTests(ChatFixtures, TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_media_frame_cannot_move_watermarks(self):
+        me, peer = self.make_user("me"), self.make_user("peer")
+        thread = self.make_thread(me, [peer], messages=2)
+        before = dict(
+            ThreadWatermark.objects.filter(thread=thread).values_list("user_id", "last_delivered_id")
+        )
+
+        async def run():
+            sockets = []
+            for user in (me, peer):
+                communicator = WebsocketCommunicator(
+                    application,
+                    f"/ws/chat/{thread.id}/?token={AccessToken.for_user(user)}"
+                )
+                connected, _ = await communicator.connect()
+                self.assertTrue(connected)
+                sockets.append(communicator)
+
+            await sockets[0].send_json_to({
+                "type": "media", "id": 999999999, "sender": {"id": 0}
+            })
+            frames = []
+            for communicator in sockets:
+                while not await communicator.receive_nothing(0.4):
+                    frames.append(await communicator.receive_json_from())
+                await communicator.disconnect()
+            return frames
+
+        frames = asyncio.run(run())
+
+        self.assertIn({"type": "error", "error": "Unknown media message"}, frames)
+        self.assertNotIn(999999999, [frame.get("id") for frame in frames])
+        after = dict(
+            ThreadWatermark.objects.filter(thread=thread).values_list("user_id", "last_delivered_id")
+        )
+        self.assertTrue(all(value < 999999999 for value in after.values()))
+        self.assertEqual(after.keys(), before.keys())
+
+    def test_media_frame_broadcasts_stored_message(self):
+        me, peer = self.make_user("me"), self.make_user("peer")
+        thread = self.make_thread(me, [peer], messages=0)
+        upload = Message.objects.create(
+            thread=thread, sender=me, text="look",
+            attachment="chat_media/cat.jpg", attachment_name="cat.jpg",
+            attachment_type="image/jpeg", attachment_size=10,
+        )
+
+        async def run():
+            communicator = WebsocketCommunicator(
+                application,
+                f"/ws/chat/{thread.id}/?token={AccessToken.for_user(me)}"
+            )
+            await communicator.connect()
+            await communicator.send_json_to({
+                "type": "media", "id": upload.id, "text": "forged caption"
+            })
+            frames = []
+            while not await communicator.receive_nothing(0.4):
+                frames.append(await communicator.receive_json_from())
+            await communicator.disconnect()
+            return [frame for frame in frames if frame["type"] == "message"]
+
+        [frame] = asyncio.run(run())
+        self.assertEqual((frame["id"], frame["text"]), (upload.id, "look"))
+        self.assertEqual(frame["file_name"], "cat.jpg")
+
+
+@override_settings(**TEST_SETTINGS)
+class CursorPaginationTests(ChatFixtures, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.me, cls.peer = cls.make_user("me"), cls.make_user("peer")
+        cls.thread = cls.make_thread(cls.me, [cls.peer], messages=0)
+        cls.messages = [
+            Message.objects.create(thread=cls.thread, sender=cls.peer, text=f"m{n}")
+            for n in range(9)
+        ]
+        # Ties on created_at must still page by id
+        Message.objects.filter(id__in=[m.id for m in cls.messages[3:6]]).update(
+            created_at=cls.messages[3].created_at
+        )
+        cls.ids = [m.id for m in cls.messages]
+
+    def setUp(self):
+        cache.clear()
+        self.path = f"/api/chat/{self.thread.id}/messages/"
+
+    def get(self, **params):
+        response = self.client_for(self.me).get(self.path, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_without_params_returns_whole_list(self):
+        self.assertEqual([m["id"] for m in self.get()], self.ids)
+
+    def test_walk_backward_then_forward(self):
+        page = self.get(limit=2)
+        self.assertEqual([m["id"] for m in page["results"]], self.ids[-2:])
+        self.assertIsNone(page["after"])
+
+        seen = [m["id"] for m in page["results"]]
+        while page["before"]:
+            page = self.get(limit=2, before=page["before"])
+            seen = [m["id"] for m in page["results"]] + seen
+        self.assertEqual(seen, self.ids)
+
+        seen = [m["id"] for m in page["results"]]
+        while page["after"]:
+            page = self.get(limit=2, after=page["after"])
+            seen += [m["id"] for m in page["results"]]
+        self.assertEqual(seen, self.ids)
+
+    def test_invalid_cursor(self):
+        response = self.client_for(self.me).get(self.path, {"before": "nope"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_limit_is_clamped(self):
+        self.assertEqual(len(self.get(limit=0)["results"]), 9)
+        with mock.patch.object(MessageCursorPagination, "max_limit", 3):
+            self.assertEqual(len(self.get(limit=1000)["results"]), 3)
+
+
+@override_settings(**TEST_SETTINGS)
+class WatermarkTests(ChatFixtures, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.me, cls.peer, cls.third = (
+            cls.make_user("me"), cls.make_user("peer"), cls.make_user("third")
+        )
+        cls.thread = cls.make_thread(cls.me, [cls.peer, cls.third], messages=0)
+        cls.first, cls.second = [
+            Message.objects.create(thread=cls.thread, sender=cls.me, text=text)
+            for text in ("one", "two")
+        ]
+
+    def pointers(self, user):
+        return ThreadWatermark.objects.filter(
+            thread=self.thread, user=user
+        ).values_list("last_delivered_id", "last_read_id").get()
+
+    def test_read_implies_delivered_and_never_goes_back(self):
+        ThreadWatermark.objects.advance_read(self.thread.id, self.peer.id, self.second.id)
+        ThreadWatermark.objects.advance_read(self.thread.id, self.peer.id, self.first.id)
+        self.assertEqual(self.pointers(self.peer), (self.second.id, self.second.id))
+
+        ThreadWatermark.objects.advance_delivered(self.thread.id, self.third.id, self.second.id)
+        ThreadWatermark.objects.advance_delivered(self.thread.id, self.third.id, self.first.id)
+        self.assertEqual(self.pointers(self.third), (self.second.id, 0))
+
+    def test_missing_row_is_created(self):
+        ThreadWatermark.objects.filter(user=self.peer).delete()
+        ThreadWatermark.objects.advance_read(self.thread.id, self.peer.id, self.first.id)
+        self.assertEqual(self.pointers(self.peer), (self.first.id, self.first.id))
+
+    def test_receipt_counts_exclude_sender(self):
+        ThreadWatermark.objects.advance_read(self.thread.id, self.me.id, self.second.id)
+        ThreadWatermark.objects.advance_read(self.thread.id, self.peer.id, self.first.id)
+        ThreadWatermark.objects.advance_delivered(self.thread.id, self.third.id, self.second.id)
+
+        counts = {
+            m.id: (m.delivered_count, m.read_count)
+            for m in Message.objects.filter(thread=self.thread).with_receipts()
+        }
+        self.assertEqual(counts, {self.first.id: (2, 1), self.second.id: (1, 0)})
+
+
+@override_settings(**TEST_SETTINGS)
+class ThreadSummaryTests(ChatFixtures, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.me, cls.peer = cls.make_user("me"), cls.make_user("peer")
+        cls.thread = cls.make_thread(cls.me, [cls.peer], messages=0)
+
+    def unread(self, user):
+        return ThreadWatermark.objects.get(thread=self.thread, user=user).unread_count
+
+    def send(self, sender, text="hi"):
+        return Message.objects.create(thread=self.thread, sender=sender, text=text)
+
+    def test_counts_and_last_message(self):
+        for n in range(3):
+            record_message(self.send(self.peer, f"m{n}"))
+
+        self.assertEqual((self.unread(self.me), self.unread(self.peer)), (3, 0))
+        self.thread.summary.refresh_from_db()
+        self.assertEqual(self.thread.summary.last_message["text"], "m2")
+
+    def test_batch_counts_per_sender(self):
+        record_messages([self.send(self.peer), self.send(self.me), self.send(self.peer)])
+        self.assertEqual((self.unread(self.me), self.unread(self.peer)), (2, 1))
+
+    def test_read_before_increment_stays_read(self):
+        # Reader saw the row before its counter increment committed
+        message = self.send(self.peer)
+        ThreadWatermark.objects.advance_read(self.thread.id, self.me.id, message.id)
+        record_message(message)
+        self.assertEqual(self.unread(self.me), 0)
+
+    def test_batch_counts_only_unread_part(self):
+        first, second, third = self.send(self.peer), self.send(self.peer), self.send(self.peer)
+        ThreadWatermark.objects.advance_read(self.thread.id, self.me.id, second.id)
+        record_messages([first, second, third])
+        self.assertEqual(self.unread(self.me), 1)
+
+    def test_older_message_does_not_replace_summary(self):
+        older, newer = self.send(self.peer, "older"), self.send(self.peer, "newer")
+        record_message(newer)
+        record_message(older)
+        self.thread.summary.refresh_from_db()
+        self.assertEqual(self.thread.summary.last_message_id, newer.id)
+
+
+@override_settings(
+    CHAT_UPLOAD_TEMP_DIR=os.path.join(MEDIA_ROOT, "chunks"), **TEST_SETTINGS
+)
+class ChunkedUploadTests(ChatFixtures, TestCase):
+    """Offset/resume protocol of the chunked upload views."""
+
+    DATA = b"0123456789" * 10
+
+    def setUp(self):
+        cache.clear()
+        self.user = self.make_user("uploader")
+        self.thread = self.make_thread(self.user, [self.make_user("viewer")], 0)
+        self.client = self.client_for(self.user)
+
+        response = self.client.post(
+            f"/api/chat/threads/{self.thread.id}/uploads/",
+            {"file_name": "clip.mp4", "content_type": "video/mp4", "size": len(self.DATA)},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        self.upload_id = response.data["upload_id"]
+
+    def put(self, offset, body):
+        return self.client.generic(
+            "PUT",
+            f"/api/chat/uploads/{self.upload_id}/?offset={offset}",
+            body,
+            content_type="application/octet-stream",
+        )
+
+    def test_resume_from_reported_offset(self):
+        self.assertEqual(self.put(0, self.DATA[:40]).data["offset"], 40)
+
+        # Dropped connection: ask where to resume, then finish
+        resume = self.client.get(f"/api/chat/uploads/{self.upload_id}/").data["offset"]
+        self.assertEqual(resume, 40)
+        self.assertEqual(self.put(resume, self.DATA[resume:]).data["offset"], len(self.DATA))
+
+        response = self.client.post(
+            f"/api/chat/uploads/{self.upload_id}/complete/",
+            {"checksum": hashlib.sha256(self.DATA).hexdigest()},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        message = Message.objects.get(id=response.data["id"])
+        with message.attachment.open("rb") as fh:
+            self.assertEqual(fh.read(), self.DATA)
+        self.assertFalse(UploadSession.objects.filter(id=self.upload_id).exists())
+
+    def test_stale_offset_conflicts(self):
+        self.put(0, self.DATA[:40])
+
+        # A retry of the first chunk must not rewrite the file
+        response = self.put(0, b"x" * 40)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["offset"], 40)
+
+        session = UploadSession.objects.get(id=self.upload_id)
+        with open(uploads.temp_path(session), "rb") as fh:
+            self.assertEqual(fh.read(), self.DATA[:40])
+
+    def test_offset_rechecked_under_lock(self):
+        # A stale in-memory session (the racing request's view of it)
+        stale = UploadSession.objects.get(id=self.upload_id)
+        self.put(0, self.DATA[:40])
+
+        with self.assertRaises(uploads.ChunkOffsetMismatch) as caught:
+            uploads.append_chunk(stale, 0, io.BytesIO(b"x" * 40))
+        self.assertEqual(caught.exception.offset, 40)
+
+        with open(uploads.temp_path(stale), "rb") as fh:
+            self.assertEqual(fh.read(), self.DATA[:40])
+
+    def test_completed_upload_gone_for_racing_complete(self):
+        # The losing complete looked the session up before the winner
+        # finalized; once it gets the lock the upload is gone
+        stale = UploadSession.objects.get(id=self.upload_id)
+        self.put(0, self.DATA)
+        response = self.client.post(
+            f"/api/chat/uploads/{self.upload_id}/complete/",
+            {"checksum": hashlib.sha256(self.DATA).hexdigest()},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+
+        with self.assertRaises(uploads.UploadGone):
+            with uploads.locked(stale):
+                pass
+        # ...without leaving a re-created temp file behind
+        self.assertFalse(uploads.temp_path(stale).exists())
+
+    def test_empty_body_rejected(self):
+        response = self.put(0, b"")
+        self.assertEqual(response.status_code, 400)
+
+    def test_expired_sessions_cleaned_up(self):
+        self.put(0, self.DATA[:40])
+        session = UploadSession.objects.get(id=self.upload_id)
+        path = uploads.temp_path(session)
+
+        UploadSession.objects.filter(id=session.id).update(
+            created_at=timezone.now() - timedelta(seconds=uploads.SESSION_TTL + 1)
+        )
+        self.assertEqual(self.put(40, self.DATA[40:]).status_code, 404)
+
+        call_command("cleanupuploads", stdout=io.StringIO())
+        self.assertFalse(UploadSession.objects.filter(id=session.id).exists())
+        self.assertFalse(path.exists())
+
+
+class SearchIndexTriggerTests(TestCase):
+    """
+    The test DB runs every migration: if a later one rebuilt
+    chat_message, SQLite dropped the FTS triggers and this fails.
+    """
+
+    def test_fts_triggers_survive_migrations(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("FTS5 index is SQLite-only")
+        self.assertEqual(search.missing_fts_triggers(), ())
+
+    def test_check_reports_dropped_trigger(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("FTS5 index is SQLite-only")
+
+        from .checks import fts_triggers_check
+
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER chat_message_fts_update")
+        [warning] = fts_triggers_check(None, databases=["default"])
+        self.assertEqual(warning.id, "chat.W001")
+
+
+@override_settings(**TEST_SETTINGS)
+class SearchSnippetTests(ChatFixtures, TestCase):
+    """Snippets are rendered as HTML: only our <mark> tags may survive."""
+
+    TEXT = '<img src=x onerror="alert(1)"> chalo party hai'
+
+    def setUp(self):
+        self.user = self.make_user("searcher")
+        self.thread = self.make_thread(self.user, [self.make_user("other")], 0)
+        Message.objects.create(thread=self.thread, sender=self.user, text=self.TEXT)
+
+    def assertSafe(self, snippet):
+        self.assertNotIn("<img", snippet)
+        self.assertIn("&lt;img", snippet)
+        self.assertIn("<mark>party</mark>", snippet)
+
+    def test_fts_snippet_escaped(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("FTS5 index is SQLite-only")
+
+        hits, _ = search.SQLiteFTSBackend().search(self.user, "party")
+        self.assertEqual(len(hits), 1)
+        self.assertSafe(hits[0].snippet)
+
+    def test_basic_snippet_escaped(self):
+        hits, _ = search.BasicSearchBackend().search(self.user, "party")
+        self.assertEqual(len(hits), 1)
+        self.assertSafe(hits[0].snippet)
+
+    def test_highlight_marks_escaped_match(self):
+        self.assertEqual(
+            search.highlight("a <b> & b", ["<b>"]),
+            "a <mark>&lt;b&gt;</mark> &amp; b",
+        )
+
+
+@override_settings(**TEST_SETTINGS)
+class DirectThreadTests(ChatFixtures, TestCase):
+    def setUp(self):
+        self.alice = self.make_user("dm_alice")
+        self.bob = self.make_user("dm_bob")
+
+    def test_one_thread_per_pair(self):
+        thread, created = Thread.objects.get_or_create_direct(self.alice, self.bob)
+        self.assertTrue(created)
+        self.assertEqual(set(thread.members.values_list("id", flat=True)), {self.alice.id, self.bob.id})
+
+        # Either side, same thread
+        again, created = Thread.objects.get_or_create_direct(self.bob, self.alice)
+        self.assertFalse(created)
+        self.assertEqual(again.id, thread.id)
+
+    def test_losing_the_create_race_reads_the_winner(self):
+        winner, _ = Thread.objects.get_or_create_direct(self.alice, self.bob)
+
+        # The lookup ran before the winner committed: it saw nothing
+        missed = mock.Mock()
+        missed.first.return_value = None
+        with mock.patch.object(Thread.objects, "filter", return_value=missed):
+            thread, created = Thread.objects.get_or_create_direct(self.bob, self.alice)
+
+        self.assertFalse(created)
+        self.assertEqual(thread.id, winner.id)
+        self.assertEqual(Thread.objects.filter(name="").count(), 1)
+
+
+class DirectThreadMergeMigrationTests(TransactionTestCase):
+    """0013 folds duplicate 1:1 threads into the oldest one."""
+
+    before = ("chat", "0012_message_fts")
+    after = ("chat", "0013_dm_pair_key")
+
+    def targets(self, executor, chat_node):
+        return [
+            node for node in executor.loader.graph.leaf_nodes()
+            if node[0] != "chat"
+        ] + [chat_node]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_duplicates_merged(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.targets(executor, self.before))
+        apps = executor.loader.project_state(self.targets(executor, self.before)).apps
+
+        User = apps.get_model("users", "User")
+        Thread = apps.get_model("chat", "Thread")
+        Message = apps.get_model("chat", "Message")
+        ThreadWatermark = apps.get_model("chat", "ThreadWatermark")
+
+        alice = User.objects.create(username="m_alice", username_lower="m_alice")
+        bob = User.objects.create(username="m_bob", username_lower="m_bob")
+
+        keeper, duplicate = Thread.objects.create(), Thread.objects.create()
+        for thread in (keeper, duplicate):
+            thread.members.add(alice, bob)
+
+        Message.objects.create(thread=keeper, sender=alice, text="first")
+        newest = Message.objects.create(thread=duplicate, sender=alice, text="second")
+        ThreadWatermark.objects.create(thread=keeper, user=bob, last_read_id=0)
+        ThreadWatermark.objects.create(thread=duplicate, user=bob, last_read_id=newest.id)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.targets(executor, self.after))
+        apps = executor.loader.project_state(self.targets(executor, self.after)).apps
+
+        Thread = apps.get_model("chat", "Thread")
+        Message = apps.get_model("chat", "Message")
+        ThreadWatermark = apps.get_model("chat", "ThreadWatermark")
+
+        merged = Thread.objects.get()
+        self.assertEqual(merged.id, keeper.id)
+        self.assertEqual(
+            (merged.dm_low_id, merged.dm_high_id), tuple(sorted((alice.id, bob.id)))
+        )
+        self.assertEqual(Message.objects.filter(thread=merged).count(), 2)
+
+        watermark = ThreadWatermark.objects.get(thread=merged, user_id=bob.id)
+        self.assertEqual(watermark.last_read_id, newest.id)
+        self.assertEqual(watermark.unread_count, 0)
+
+
+class CodecTests(SimpleTestCase):
+    FRAME = {"type": "message", "id": 7, "text": "namaste 🙏", "attachment": None}
+
+    def test_round_trip(self):
+        for name, codec in codecs.CODECS.items():
+            with self.subTest(codec=name):
+                encoded = codec.encode(self.FRAME)
+                self.assertIsInstance(encoded, bytes if codec.binary else str)
+                self.assertEqual(codec.decode(encoded), self.FRAME)
+
+    def test_negotiate(self):
+        self.assertEqual(
+            codecs.negotiate(["chat.v9", "chat.cbor", "chat.msgpack"]),
+            (codecs.CODECS["chat.cbor"], "chat.cbor"),
+        )
+        self.assertEqual(codecs.negotiate(None), (codecs.DEFAULT_CODEC, None))
+        self.assertEqual(codecs.negotiate(["chat.v9"]), (codecs.DEFAULT_CODEC, None))
+
+    def test_decode_frame(self):
+        msgpack = codecs.CODECS["chat.msgpack"]
+
+        # Text frames stay JSON even on a binary socket
+        self.assertEqual(codecs.decode_frame(msgpack, text_data='{"type": "typing"}'), {"type": "typing"})
+        self.assertEqual(codecs.decode_frame(msgpack, bytes_data=msgpack.encode(self.FRAME)), self.FRAME)
+
+        for codec, kwargs in [
+            (codecs.DEFAULT_CODEC, {"bytes_data": b"\x81"}),
+            (msgpack, {"bytes_data": b"\xc1"}),
+            (msgpack, {"bytes_data": msgpack.encode([1, 2])}),
+            (codecs.DEFAULT_CODEC, {"text_data": "{nope"}),
+        ]:
+            with self.assertRaises(ValueError):
+                codecs.decode_frame(codec, **kwargs)
+
+
+@override_settings(**TEST_SETTINGS)
+class BinarySocketTests(ChatFixtures, TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_msgpack_socket(self):
+        me, peer = self.make_user("packer"), self.make_user("unpacker")
+        thread = self.make_thread(me, [peer], messages=0)
+        msgpack = codecs.CODECS["chat.msgpack"]
+
+        async def run():
+            communicator = WebsocketCommunicator(
+                application,
+                f"/ws/chat/{thread.id}/?token={AccessToken.for_user(me)}",
+                subprotocols=["chat.msgpack"],
+            )
+            connected, subprotocol = await communicator.connect()
+            self.assertTrue(connected)
+            self.assertEqual(subprotocol, "chat.msgpack")
+
+            await communicator.send_to(bytes_data=msgpack.encode({"message": "binary hello"}))
+            frames = []
+            while not await communicator.receive_nothing(0.4):
+                frames.append(msgpack.decode(await communicator.receive_from()))
+            await communicator.disconnect()
+            return frames
+
+        frames = asyncio.run(run())
+        self.assertIn("binary hello", [frame.get("text") for frame in frames])
+
+
+class TypingDebouncerTests(SimpleTestCase):
+    TIMEOUT = 0.1
+
+    def run_debouncer(self, script):
+        emitted = []
+
+        async def emit(thread_id, is_typing):
+            emitted.append((thread_id, is_typing))
+
+        async def run():
+            debouncer = TypingDebouncer(emit, timeout=self.TIMEOUT)
+            await script(debouncer)
+            return debouncer
+
+        return asyncio.run(run()), emitted
+
+    def test_only_transitions_emitted(self):
+        async def script(debouncer):
+            for _ in range(5):
+                await debouncer.update(1, True)
+            await debouncer.update(1, False)
+            await debouncer.update(1, False)
+
+        debouncer, emitted = self.run_debouncer(script)
+        self.assertEqual(emitted, [(1, True), (1, False)])
+        self.assertEqual((debouncer.emitted, debouncer.dropped), (2, 5))
+
+    def test_silence_stops_typing(self):
+        async def script(debouncer):
+            await debouncer.update(1, True)
+            await asyncio.sleep(self.TIMEOUT * 3)
+            self.assertFalse(debouncer.is_typing(1))
+
+        _, emitted = self.run_debouncer(script)
+        self.assertEqual(emitted, [(1, True), (1, False)])
+
+    def test_keystrokes_extend_the_timeout(self):
+        async def script(debouncer):
+            await debouncer.update(1, True)
+            for _ in range(4):
+                await asyncio.sleep(self.TIMEOUT / 4)
+                await debouncer.update(1, True)
+            self.assertTrue(debouncer.is_typing(1))
+            await debouncer.close()
+
+        _, emitted = self.run_debouncer(script)
+        self.assertEqual(emitted, [(1, True), (1, False)])
+
+    def test_close_stops_every_thread(self):
+        async def script(debouncer):
+            await debouncer.update(1, True)
+            await debouncer.update(2, True)
+            await debouncer.close()
+            await asyncio.sleep(self.TIMEOUT * 2)
+
+        _, emitted = self.run_debouncer(script)
+        self.assertEqual(sorted(emitted), [(1, False), (1, True), (2, False), (2, True)])
+
+
+class OutboundQueueTests(SimpleTestCase):
+    def run_queue(self, script, write=None, **options):
+        written, closed = [], []
+
+        async def default_write(payload):
+            written.append(payload)
+
+        async def on_overflow():
+            closed.append("overflow")
+
+        async def on_error():
+            closed.append("error")
+
+        async def run():
+            gate = asyncio.Event()
+
+            async def blocked_write(payload):
+                # Writer stalls until the script opens the gate
+                await gate.wait()
+                await default_write(payload)
+
+            queue = OutboundQueue(
+                write or blocked_write, on_overflow, on_error=on_error, **options
+            )
+            await script(queue, gate)
+            await asyncio.sleep(0.01)
+            queue.close()
+
+        asyncio.run(run())
+        return written, closed
+
+    def test_merge_keeps_latest_in_place(self):
+        async def script(queue, gate):
+            queue.put({"n": 1})
+            queue.put({"typing": True}, merge_key="typing:1")
+            queue.put({"n": 2})
+            queue.put({"typing": False}, merge_key="typing:1")
+            gate.set()
+
+        written, closed = self.run_queue(script, batch=True)
+        self.assertEqual(written, [{"type": "batch", "frames": [
+            {"n": 1}, {"typing": False}, {"n": 2},
+        ]}])
+        self.assertEqual(closed, [])
+
+    def test_mergeable_dropped_above_high_water(self):
+        async def script(queue, gate):
+            for n in range(3):
+                queue.put({"n": n})
+            queue.put({"typing": True}, merge_key="typing:1")
+            self.assertEqual(len(queue), 3)
+            gate.set()
+
+        written, closed = self.run_queue(script, high_water=3, max_size=10)
+        self.assertNotIn({"typing": True}, written)
+        self.assertEqual(closed, [])
+
+    def test_overflow_at_max_size(self):
+        async def script(queue, gate):
+            for n in range(5):
+                queue.put({"n": n})
+            queue.put({"n": "late"})  # stopped: ignored
+
+        written, closed = self.run_queue(script, high_water=2, max_size=4)
+        self.assertEqual(closed, ["overflow"])
+        self.assertEqual(written, [])
+
+    def test_overflow_after_slow_timeout(self):
+        async def script(queue, gate):
+            # The stalled writer already holds the first frame
+            for n in range(3):
+                queue.put({"n": n})
+                await asyncio.sleep(0)
+            await asyncio.sleep(0.06)
+            queue.put({"n": 3})
+
+        _, closed = self.run_queue(script, high_water=2, max_size=100, slow_timeout=0.05)
+        self.assertEqual(closed, ["overflow"])
+
+    def test_write_error_closes_at_once(self):
+        async def broken_write(payload):
+            raise TypeError("not serializable")
+
+        async def script(queue, gate):
+            queue.put({"n": 0})
+            await asyncio.sleep(0.01)
+            queue.put({"n": 1})
+            self.assertEqual(len(queue), 0)
+
+        with self.assertLogs("chat.outbound", "ERROR"):
+            written, closed = self.run_queue(script, write=broken_write)
+        self.assertEqual(closed, ["error"])
+
+
+@override_settings(**TEST_SETTINGS)
+class MessageWriterTests(ChatFixtures, TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.me, self.peer = self.make_user("writer"), self.make_user("reader")
+        self.thread = self.make_thread(self.me, [self.peer], messages=0)
+
+    def submit_all(self, texts):
+        writer = MessageWriter(batch_delay=0.05)
+
+        async def run():
+            return await asyncio.gather(*(
+                writer.submit(self.me, self.thread.id, text) for text in texts
+            ))
+
+        return asyncio.run(run())
+
+    def test_cache_failure_after_commit_not_retried(self):
+        with mock.patch.object(recent, "append", side_effect=ConnectionError):
+            with self.assertLogs("chat.writer", "ERROR"):
+                [data] = self.submit_all(["saved once"])
+
+        self.assertEqual(
+            list(Message.objects.filter(thread=self.thread).values_list("id", "text")),
+            [(data["id"], "saved once")]
+        )
+
+    def test_rolled_back_batch_retried_with_fresh_ids(self):
+        real = record_messages
+        calls = []
+
+        def flaky(messages):
+            calls.append(len(messages))
+            if len(calls) == 1:
+                raise RuntimeError("summary update failed")
+            return real(messages)
+
+        with mock.patch("chat.writer.record_messages", side_effect=flaky):
+            results = self.submit_all(["one", "two"])
+
+        self.assertEqual(calls, [2, 1, 1])
+        stored = dict(Message.objects.filter(thread=self.thread).values_list("id", "text"))
+        self.assertEqual(stored, {data["id"]: data["text"] for data in results})
+        self.assertEqual(sorted(stored.values()), ["one", "two"])
+
+
+@override_settings(**TEST_SETTINGS)
+class BlockOnSendTests(ChatFixtures, TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_member_added_after_connect_is_checked(self):
+        me, peer = self.make_user("sender"), self.make_user("peer")
+        thread = self.make_thread(me, [peer, self.make_user("third")], messages=0)
+        latecomer = self.make_user("latecomer")
+        latecomer.blocked_users.add(me)
+
+        async def run():
+            communicator = WebsocketCommunicator(
+                application,
+                f"/ws/chat/{thread.id}/?token={AccessToken.for_user(me)}"
+            )
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+
+            await database_sync_to_async(thread.members.add)(latecomer)
+            await communicator.send_json_to({"message": "hello all"})
+
+            frames = []
+            while not await communicator.receive_nothing(0.4):
+                frames.append(await communicator.receive_json_from())
+            await communicator.disconnect()
+            return frames
+
+        frames = asyncio.run(run())
+        self.assertIn({"type": "error", "error": "User blocked"}, frames)
+        self.assertFalse(Message.objects.filter(thread=thread).exists())
+
+
+class PreviewPoolTests(SimpleTestCase):
+    def test_concurrent_first_calls_share_one_pool(self):
+        created = []
+
+        def slow_pool(**kwargs):
+            time.sleep(0.05)  # widen the check-then-create window
+            created.append(mock.Mock())
+            return created[-1]
+
+        with mock.patch.object(previews, "_render_pool", None), \
+                mock.patch.object(previews, "ProcessPoolExecutor", side_effect=slow_pool):
+            results = []
+            threads = [
+                threading.Thread(target=lambda: results.append(previews.render_pool()))
+                for _ in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(created), 1)
+        self.assertEqual({id(pool) for pool in results}, {id(created[0])})
@@ -0,0 +1,64 @@
+import asyncio
+
+from django.conf import settings
+
+
+class TypingDebouncer:
+    """
+    Per-connection typing state, one entry per thread.
+
+    Clients send a typing frame on every keystroke; only transitions
+    (idle → typing, typing → idle) reach `emit_callback`, everything
+    else is dropped before the channel layer. A typing user who goes
+    quiet for `timeout` seconds is stopped automatically, so a lost
+    "stopped" frame can't leave the indicator on.
+    """
+
+    def __init__(self, emit_callback, timeout=None):
+        self.emit_callback = emit_callback
+        self.timeout = (
+            timeout if timeout is not None
+            else getattr(settings, "CHAT_TYPING_TIMEOUT", 5)
+        )
+        # thread_id → auto-stop timer, present while typing
+        self._timers = {}
+        self.emitted = 0
+        self.dropped = 0
+
+    def is_typing(self, thread_id):
+        return thread_id in self._timers
+
+    async def update(self, thread_id, is_typing):
+        timer = self._timers.pop(thread_id, None)
+        if timer is not None:
+            timer.cancel()
+
+        if is_typing:
+            self._timers[thread_id] = asyncio.ensure_future(
+                self._stop_later(thread_id)
+            )
+
+        if (timer is not None) == is_typing:
+            # No state change: keystroke while typing, or stop while idle
+            self.dropped += 1
+            return
+
+        self.emitted += 1
+        await self.emit_callback(thread_id, is_typing)
+
+    async def _stop_later(self, thread_id):
+        await asyncio.sleep(self.timeout)
+        self._timers.pop(thread_id, None)
+        self.emitted += 1
+        await self.emit_callback(thread_id, False)
+
+    async def stop(self, thread_id):
+        if self.is_typing(thread_id):
+            await self.update(thread_id, False)
+
+    async def close(self):
+        """
+        Stop every active indicator (socket closing).
+        """
+        for thread_id in list(self._timers):
+            await self.stop(thread_id)
@@ -0,0 +1,216 @@
+import hashlib
+import os
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows: no per-session file lock
+    fcntl = None
+
+from .models import Message, UploadSession
+
+ALLOWED_MEDIA_TYPES = [
+    "image/jpeg",
+    "image/png",
+    "image/webp",
+    "video/mp4",
+    "application/pdf",
+]
+
+# Single-request uploads are buffered by Django, keep them small
+MAX_DIRECT_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB
+
+# Chunked uploads stream to disk, so they can be much larger
+MAX_CHUNKED_UPLOAD_SIZE = getattr(
+    settings, "CHAT_MAX_CHUNKED_UPLOAD_SIZE", 512 * 1024 * 1024
+)
+CHUNK_SIZE = getattr(settings, "CHAT_UPLOAD_CHUNK_SIZE", 4 * 1024 * 1024)
+READ_BLOCK_SIZE = 64 * 1024
+
+# Unfinished sessions older than this are refused and cleaned up
+SESSION_TTL = getattr(settings, "CHAT_UPLOAD_SESSION_TTL", 24 * 60 * 60)
+
+
+class ChunkOffsetMismatch(Exception):
+    """The chunk doesn't start where the upload currently ends."""
+
+    def __init__(self, offset):
+        super().__init__(offset)
+        self.offset = offset  # where it does end (None: session gone)
+
+
+class UploadGone(Exception):
+    """Finished or discarded while we waited for the upload's lock."""
+
+
+def expiry_cutoff():
+    return timezone.now() - timedelta(seconds=SESSION_TTL)
+
+
+def active_sessions():
+    return UploadSession.objects.filter(created_at__gte=expiry_cutoff())
+
+
+def temp_dir():
+    path = Path(getattr(
+        settings,
+        "CHAT_UPLOAD_TEMP_DIR",
+        Path(settings.BASE_DIR) / "tmp" / "chat_uploads"
+    ))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def temp_path(session):
+    return temp_dir() / f"{session.id}.part"
+
+
+def _received_bytes(session_id):
+    # Fresh from the DB; None once the session is discarded
+    return UploadSession.objects.filter(
+        id=session_id
+    ).values_list("received_bytes", flat=True).first()
+
+
+@contextmanager
+def locked(session):
+    """
+    Hold the upload's exclusive lock (flock on its temp file) and yield
+    the open file. Every step that reads or changes the upload runs
+    under it: chunk writes, complete/finalize, cleanup.
+
+    session.received_bytes is refreshed from the DB once the lock is
+    held; raises UploadGone if the session no longer exists.
+    """
+    path = temp_path(session)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+
+    with os.fdopen(fd, "r+b") as fh:
+        if fcntl is not None:
+            # Released when the file is closed
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+
+        received = _received_bytes(session.id)
+        if received is None:
+            # Our O_CREAT may have re-created a finalized upload's file
+            path.unlink(missing_ok=True)
+            raise UploadGone()
+
+        session.received_bytes = received
+        yield fh
+
+
+def append_chunk(session, offset, stream):
+    """
+    Stream a chunk from `stream` into the session's temp file at
+    `offset`, never holding more than READ_BLOCK_SIZE in memory.
+    Returns the new received_bytes.
+
+    Runs under locked(), which re-reads the offset from the DB, so two
+    PUTs for the same offset (a client retry racing the original) can't
+    both truncate and write.
+    """
+    with locked(session) as fh:
+        if offset != session.received_bytes:
+            raise ChunkOffsetMismatch(session.received_bytes)
+
+        remaining = session.total_size - offset
+        written = 0
+
+        fh.seek(offset)
+        fh.truncate()
+
+        while remaining > 0:
+            block = stream.read(min(READ_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            fh.write(block)
+            written += len(block)
+            remaining -= len(block)
+        fh.flush()
+
+        # Only advance if nobody else moved the offset meanwhile
+        updated = UploadSession.objects.filter(
+            id=session.id,
+            received_bytes=offset
+        ).update(received_bytes=offset + written)
+
+    if not updated:
+        raise ChunkOffsetMismatch(_received_bytes(session.id))
+
+    session.received_bytes = offset + written
+    return session.received_bytes
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(READ_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def finalize(session):
+    """
+    Move the assembled file into media storage and create its Message.
+    """
+    path = temp_path(session)
+
+    message = Message(
+        thread_id=session.thread_id,
+        sender_id=session.user_id,
+        text=session.text,
+        attachment_name=session.file_name[:255],
+        attachment_type=session.content_type,
+        attachment_size=session.total_size,
+    )
+
+    with open(path, "rb") as fh:
+        message.attachment.save(session.file_name, File(fh), save=False)
+    message.save()
+
+    discard(session)
+    return message
+
+
+def discard(session):
+    try:
+        os.remove(temp_path(session))
+    except FileNotFoundError:
+        pass
+    session.delete()
+
+
+def cleanup_expired():
+    """
+    Delete expired sessions with their temp files, plus temp files no
+    session owns anymore. Returns (sessions, files) removed.
+    """
+    expired = 0
+    for session in UploadSession.objects.filter(created_at__lt=expiry_cutoff()):
+        try:
+            # Waits out a chunk write that was already in flight
+            with locked(session):
+                discard(session)
+        except UploadGone:
+            continue
+        expired += 1
+
+    known = {
+        str(session_id)
+        for session_id in UploadSession.objects.values_list("id", flat=True)
+    }
+    cutoff = expiry_cutoff().timestamp()
+    orphans = 0
+    for path in temp_dir().glob("*.part"):
+        if path.stem not in known and path.stat().st_mtime < cutoff:
+            path.unlink(missing_ok=True)
+            orphans += 1
+
+    return expired, orphans
@@ -2,13 +2,19 @@ from django.urls import path
 from .views import (
     ThreadListView, CreateThreadView,
     MessageListView, SendMessageView,
-    MediaMessageUploadView
+    MediaMessageUploadView, ChunkedUploadInitView,
+    ChunkedUploadView, ChunkedUploadCompleteView,
+    MessageSearchView
 )
 
 urlpatterns = [
     path("", ThreadListView.as_view()),
     path("create/", CreateThreadView.as_view()),
+    path("search/", MessageSearchView.as_view(), name="message-search"),
     path("<int:thread_id>/messages/", MessageListView.as_view()),
     path("<int:thread_id>/send/", SendMessageView.as_view()),
     path("threads/<int:thread_id>/media/", MediaMessageUploadView.as_view(), name="media-message-upload"),
+    path("threads/<int:thread_id>/uploads/", ChunkedUploadInitView.as_view(), name="chunked-upload-init"),
+    path("uploads/<uuid:upload_id>/", ChunkedUploadView.as_view(), name="chunked-upload"),
+    path("uploads/<uuid:upload_id>/complete/", ChunkedUploadCompleteView.as_view(), name="chunked-upload-complete"),
 ]
\ No newline at end of file
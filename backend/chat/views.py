@@ -1,8 +1,17 @@
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
-from rest_framework.exceptions import PermissionDenied
-from .models import Thread, Message
+from rest_framework.exceptions import NotFound, PermissionDenied
+from django.db import transaction
+from django.db.models import F, Max, OuterRef, Subquery
+from .models import Thread, Message, ThreadWatermark, UploadSession
 from .serializers import ThreadSerializer, MessageSerializer
+from . import membership, recent, search, uploads
+from .groups import thread_group_name, user_group_name
+from .pagination import MessageCursorPagination
+from .previews import schedule_preview
+from .summary import init_thread, record_message
+from core import metrics
+from users import blocking
 from users.models import User
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser
@@ -19,7 +28,26 @@ class ThreadListView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Thread.objects.filter(members=self.request.user)
+        user = self.request.user
+
+        my_unread = ThreadWatermark.objects.filter(
+            thread=OuterRef("pk"),
+            user=user
+        ).values("unread_count")[:1]
+
+        # Constant number of queries: threads (+summary) and members
+        return Thread.objects.filter(
+            members=user
+        ).select_related(
+            "summary"
+        ).prefetch_related(
+            "members"
+        ).annotate(
+            my_unread_count=Subquery(my_unread)
+        ).order_by(
+            F("summary__last_activity_at").desc(nulls_last=True),
+            "-created_at"
+        )
 
     def get_serializer_context(self):
         return {"request": self.request}
@@ -55,21 +83,16 @@ class CreateThreadView(generics.CreateAPIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        if (
-            other_user in request.user.blocked_users.all()
-            or request.user in other_user.blocked_users.all()
-        ):
+        if blocking.is_blocked(request.user.id, other_user.id):
             return Response({"error": "User blocked"}, status=403)    
 
-        thread = Thread.objects.filter(
-            members=request.user
-        ).filter(
-            members=other_user
-        ).distinct().first()
-
-        if not thread:
-            thread = Thread.objects.create()
-            thread.members.add(request.user, other_user)
+        # One indexed lookup on the canonical pair key
+        thread, created = Thread.objects.get_or_create_direct(
+            request.user, other_user
+        )
+        if created:
+            init_thread(thread)
+            announce_thread(thread.id, [request.user.id, other_user.id])
 
         return Response(
             ThreadSerializer(thread, context={"request": request}).data,
@@ -83,38 +106,85 @@ class CreateThreadView(generics.CreateAPIView):
 class MessageListView(generics.ListAPIView):
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = MessageCursorPagination
 
     def get_queryset(self):
         thread_id = self.kwargs.get("thread_id")
         user = self.request.user
 
-        # Security check: user must be thread member
-        thread = Thread.objects.filter(
-            id=thread_id,
-            members=user
-        ).first()
-
-        if not thread:
+        # Security check: user must be thread member (cached member set)
+        if not membership.is_member(thread_id, user.id):
             return Message.objects.none()
 
         messages = Message.objects.filter(
-            thread=thread
+            thread_id=thread_id
         ).exclude(
             deleted_by=user
-        ).order_by("created_at")
+        ).select_related(
+            "sender"
+        ).with_receipts().order_by("created_at")
 
-        # 🔥 MARK AS READ (PER USER)
-        unread_messages = messages.exclude(
-            sender=user
-        ).exclude(
-            read_by=user
-        )
-
-        for msg in unread_messages:
-            msg.read_by.add(user)
+        # 🔥 MARK AS READ (PER USER) → one watermark UPDATE
+        latest_id = Message.objects.filter(
+            thread_id=thread_id
+        ).aggregate(latest=Max("id"))["latest"]
+        if latest_id:
+            ThreadWatermark.objects.advance_read(thread_id, user.id, latest_id)
 
         return messages
 
+    def list(self, request, *args, **kwargs):
+        response = self.list_recent(request)
+        if response is not None:
+            return response
+        return super().list(request, *args, **kwargs)
+
+    def list_recent(self, request):
+        """
+        Newest page straight from the thread's recent-messages buffer
+        (chat.recent): no message query, just receipt pointers and
+        senders (2 queries warm). None → not answerable from the buffer
+        (older pages, or too many of them deleted for this user): use
+        the DB.
+        """
+        params = request.query_params
+        if "before" in params or "after" in params:
+            return None
+
+        thread_id = self.kwargs.get("thread_id")
+        user = request.user
+        if not membership.is_member(thread_id, user.id):
+            return None
+
+        paginated = "limit" in params
+        limit = self.paginator.get_limit(request) if paginated else None
+
+        buffer, pointers = recent.load_fresh(thread_id)
+        page = recent.visible_page(buffer, user.id, limit)
+        if page is None:
+            return None
+        entries, has_older = page
+
+        # 🔥 MARK AS READ → newest message is the buffer's last one;
+        # skipped when my pointer is already there
+        latest_id = recent.newest_id(buffer)
+        if latest_id:
+            mine = pointers.setdefault(user.id, [0, 0])
+            if mine[1] < latest_id:
+                ThreadWatermark.objects.advance_read(thread_id, user.id, latest_id)
+                mine[:] = [max(mine[0], latest_id), latest_id]
+
+        data = recent.render(entries, pointers, self.get_serializer_context())
+        if not paginated:
+            return Response(data)
+
+        before = None
+        if entries and has_older:
+            before = self.paginator.encode_cursor(
+                entries[0]["created_at"], entries[0]["id"]
+            )
+        return Response({"before": before, "after": None, "results": data})
+
 
 # -----------------------------
 # Send message in a thread
@@ -127,30 +197,24 @@ class SendMessageView(generics.CreateAPIView):
         thread_id = self.kwargs.get("thread_id")
         user = self.request.user
 
-        thread = Thread.objects.filter(
-            id=thread_id,
-            members=self.request.user
-        ).first()
+        member_ids = membership.member_ids(thread_id)
 
-        if not thread:
+        if user.id not in member_ids:
             raise PermissionDenied("You are not allowed in this thread")
 
-        other_user = thread.members.exclude(id=user.id).first()
-
-        if other_user:
-            if (
-                other_user in user.blocked_users.all()
-                or user in other_user.blocked_users.all()
-            ):
-                raise PermissionDenied("User blocked")   
+        if blocking.any_blocked(user.id, member_ids):
+            raise PermissionDenied("User blocked")   
 
         message = serializer.save(
             sender=self.request.user,
-            thread=thread
+            thread_id=thread_id
         )
+        message.prime_receipts()
+        record_message(message)
+        transaction.on_commit(lambda: recent.record(message))
 
         # sender ne khud ka message read kiya hua hota hai
-        message.read_by.add(self.request.user)
+        ThreadWatermark.objects.advance_read(thread_id, user.id, message.id)
 
 
 class MediaMessageUploadView(APIView):
@@ -169,45 +233,35 @@ class MediaMessageUploadView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # 2️⃣ FILE SIZE VALIDATION (10 MB)
-        MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
-        if file.size > MAX_FILE_SIZE:
+        # 2️⃣ FILE SIZE VALIDATION (10 MB, larger files use chunked upload)
+        if file.size > uploads.MAX_DIRECT_UPLOAD_SIZE:
             return Response(
                 {"error": "File too large (max 10MB)"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
         # 3️⃣ FILE TYPE VALIDATION
-        ALLOWED_TYPES = [
-            "image/jpeg",
-            "image/png",
-            "image/webp",
-            "video/mp4",
-            "application/pdf",
-        ]
-
-        if file.content_type not in ALLOWED_TYPES:
+        if file.content_type not in uploads.ALLOWED_MEDIA_TYPES:
             return Response(
                 {"error": "Unsupported file type"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
         # 4️⃣ THREAD CHECK
-        thread = Thread.objects.filter(
-            id=thread_id,
-            members=user
-        ).first()
-
-        if not thread:
+        if not membership.is_member(thread_id, user.id):
             raise PermissionDenied("You are not allowed in this thread")
 
         # 5️⃣ CREATE MESSAGE
         message = Message.objects.create(
-            thread=thread,
+            thread_id=thread_id,
             sender=user,
             text=text,
             attachment=file
         )
+        message.prime_receipts()
+        record_message(message)
+        transaction.on_commit(lambda: recent.record(message))
+        schedule_preview(message)
 
         serializer = MessageSerializer(
             message,
@@ -215,15 +269,260 @@ class MediaMessageUploadView(APIView):
         )
 
         # 6️⃣ WEBSOCKET BROADCAST
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"chat_{thread.id}",
+        broadcast_message(thread_id, serializer.data)
+
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+# -----------------------------
+# Search messages across my threads
+# -----------------------------
+class MessageSearchView(APIView):
+    permission_classes = [IsAuthenticated]
+    DEFAULT_LIMIT = 20
+    MAX_LIMIT = 50
+
+    def get(self, request):
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            return Response(
+                {"error": "q is required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            thread_id = request.query_params.get("thread")
+            thread_id = int(thread_id) if thread_id else None
+            limit = int(request.query_params.get("limit", self.DEFAULT_LIMIT))
+            offset = int(request.query_params.get("offset", 0))
+        except ValueError:
+            return Response(
+                {"error": "thread, limit and offset must be integers"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        limit = min(max(limit, 1), self.MAX_LIMIT)
+        offset = max(offset, 0)
+
+        hits, has_more = search.get_backend().search(
+            request.user, query,
+            thread_id=thread_id, limit=limit, offset=offset
+        )
+
+        messages = Message.objects.filter(
+            id__in=[hit.message_id for hit in hits]
+        ).select_related("sender").with_receipts().in_bulk()
+
+        found = [hit for hit in hits if hit.message_id in messages]
+        data = MessageSerializer(
+            [messages[hit.message_id] for hit in found],
+            many=True,
+            context={"request": request}
+        ).data
+
+        return Response({
+            "results": [
+                {"message": message, "snippet": hit.snippet, "rank": hit.rank}
+                for hit, message in zip(found, data)
+            ],
+            "next_offset": offset + limit if has_more else None,
+        })
+
+
+def broadcast_message(thread_id, data):
+    async_to_sync(metrics.timed_group_send)(
+        get_channel_layer(),
+        thread_group_name(thread_id),
+        {
+            "type": "chat_message",
+            "thread_id": thread_id,
+            "message": data,
+            "persisted": True
+        }
+    )
+
+
+def announce_thread(thread_id, user_ids):
+    # Multiplexed sockets of each member subscribe to the new thread
+    channel_layer = get_channel_layer()
+    for user_id in user_ids:
+        async_to_sync(metrics.timed_group_send)(
+            channel_layer,
+            user_group_name(user_id),
             {
-                "type": "chat_message",
-                "message": serializer.data
+                "type": "thread_added",
+                "thread_id": thread_id
             }
         )
 
+
+# -----------------------------
+# Resumable chunked uploads
+# init → PUT chunks at offsets → complete
+# -----------------------------
+class ChunkedUploadInitView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, thread_id):
+        file_name = request.data.get("file_name", "")
+        content_type = request.data.get("content_type", "")
+
+        try:
+            size = int(request.data.get("size"))
+        except (TypeError, ValueError):
+            size = 0
+
+        if not file_name or size <= 0:
+            return Response(
+                {"error": "file_name and size are required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if size > uploads.MAX_CHUNKED_UPLOAD_SIZE:
+            return Response(
+                {"error": "File too large"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if content_type not in uploads.ALLOWED_MEDIA_TYPES:
+            return Response(
+                {"error": "Unsupported file type"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if not membership.is_member(thread_id, request.user.id):
+            raise PermissionDenied("You are not allowed in this thread")
+
+        session = UploadSession.objects.create(
+            user=request.user,
+            thread_id=thread_id,
+            file_name=file_name.split("/")[-1],
+            content_type=content_type,
+            total_size=size,
+            text=request.data.get("text", "")
+        )
+
+        return Response(
+            {
+                "upload_id": session.id,
+                "offset": 0,
+                "size": size,
+                "chunk_size": uploads.CHUNK_SIZE,
+            },
+            status=status.HTTP_201_CREATED
+        )
+
+
+class ChunkedUploadView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get_session(self, request, upload_id):
+        # Expired sessions are as good as gone (cleanupuploads reaps them)
+        session = uploads.active_sessions().filter(
+            id=upload_id,
+            user=request.user
+        ).first()
+
+        if not session:
+            raise NotFound("Upload not found")
+        return session
+
+    def get(self, request, upload_id):
+        # Resume point after a dropped connection
+        session = self.get_session(request, upload_id)
+        return Response({
+            "upload_id": session.id,
+            "offset": session.received_bytes,
+            "size": session.total_size,
+        })
+
+    def put(self, request, upload_id):
+        session = self.get_session(request, upload_id)
+
+        try:
+            offset = int(request.query_params.get("offset", ""))
+        except ValueError:
+            return Response(
+                {"error": "offset is required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # DRF gives no stream at all for an empty body
+        if request.stream is None:
+            return Response(
+                {"error": "Empty chunk"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Raw body is streamed to disk, never parsed into memory
+        try:
+            received = uploads.append_chunk(session, offset, request.stream)
+        except uploads.UploadGone:
+            raise NotFound("Upload not found")
+        except uploads.ChunkOffsetMismatch as exc:
+            if exc.offset is None:
+                raise NotFound("Upload not found")
+            return Response(
+                {"error": "Offset mismatch", "offset": exc.offset},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        return Response({
+            "upload_id": session.id,
+            "offset": received,
+            "size": session.total_size,
+        })
+
+
+class ChunkedUploadCompleteView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, upload_id):
+        session = uploads.active_sessions().filter(
+            id=upload_id,
+            user=request.user
+        ).first()
+
+        if not session:
+            raise NotFound("Upload not found")
+
+        # Locked through finalize: a second, concurrent complete waits,
+        # then finds the session gone instead of a missing temp file
+        try:
+            with uploads.locked(session):
+                if not session.is_complete:
+                    return Response(
+                        {"error": "Upload incomplete", "offset": session.received_bytes},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+
+                checksum = (request.data.get("checksum") or "").lower()
+                if checksum != uploads.file_checksum(uploads.temp_path(session)):
+                    # Corrupt upload: throw it away, client must start over
+                    uploads.discard(session)
+                    return Response(
+                        {"error": "Checksum mismatch"},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+
+                message = uploads.finalize(session)
+        except uploads.UploadGone:
+            return Response(
+                {"error": "Upload already completed"},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        message.prime_receipts()
+        record_message(message)
+        transaction.on_commit(lambda: recent.record(message))
+        schedule_preview(message)
+
+        serializer = MessageSerializer(
+            message,
+            context={"request": request}
+        )
+        broadcast_message(message.thread_id, serializer.data)
+
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         
\ No newline at end of file
@@ -0,0 +1,143 @@
+import asyncio
+import contextvars
+import logging
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import recent
+from .models import Message
+from .serializers import MessageSerializer
+from .summary import record_messages
+
+WRITE_BATCH_SIZE = getattr(settings, "CHAT_WRITE_BATCH_SIZE", 100)
+WRITE_BATCH_DELAY = getattr(settings, "CHAT_WRITE_BATCH_DELAY", 0.005)
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWriter:
+    """
+    Write-behind queue shared by every consumer in this process.
+
+    Consumers submit messages and await the result; a single writer
+    task group-commits whatever is queued (up to WRITE_BATCH_SIZE, or
+    after WRITE_BATCH_DELAY seconds) with one bulk_create inside one
+    transaction, then resolves each submitter with its serialized
+    message, id included.
+    """
+
+    def __init__(self, batch_size=WRITE_BATCH_SIZE, batch_delay=WRITE_BATCH_DELAY):
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self._queue = None
+        self._task = None
+        self._loop = None
+
+    async def submit(self, sender, thread_id, text):
+        self._ensure_running()
+
+        future = self._loop.create_future()
+        message = Message(sender=sender, thread_id=thread_id, text=text)
+        await self._queue.put((message, future))
+        return await future
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            # Fresh context: the writer serves every consumer, so it must
+            # not inherit (and report into) the first submitter's scope
+            self._task = loop.create_task(
+                self._run(), context=contextvars.Context()
+            )
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+
+            try:
+                results = await database_sync_to_async(self.commit)(
+                    [message for message, _ in batch]
+                )
+            except Exception:
+                # One bad row shouldn't fail its neighbours: retry alone
+                await self._commit_each(batch)
+                continue
+
+            for (_, future), data in zip(batch, results):
+                if not future.done():
+                    future.set_result(data)
+
+    async def _commit_each(self, batch):
+        for message, future in batch:
+            # The failed batch was rolled back, but bulk_create already
+            # handed out ids: insert afresh, not as the ghost rows
+            message.pk = None
+            message._state.adding = True
+            try:
+                data = await database_sync_to_async(self.commit)([message])
+            except Exception as exc:
+                if not future.done():
+                    future.set_exception(exc)
+            else:
+                if not future.done():
+                    future.set_result(data[0])
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.batch_delay
+
+        while len(batch) < self.batch_size:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(
+                    await asyncio.wait_for(self._queue.get(), timeout)
+                )
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    @staticmethod
+    def commit(messages):
+        with transaction.atomic():
+            if connection.features.can_return_rows_from_bulk_insert:
+                messages = Message.objects.bulk_create(messages)
+            else:
+                for message in messages:
+                    message.save()
+
+            record_messages(messages)
+
+        results = [
+            MessageSerializer(message.prime_receipts()).data
+            for message in messages
+        ]
+
+        # Committed → safe to publish to the recent-messages buffers.
+        # Must not raise past here: _run would retry rows already saved
+        per_thread = {}
+        for message, data in zip(messages, results):
+            per_thread.setdefault(message.thread_id, []).append(
+                recent.make_entry(message, data)
+            )
+        for thread_id, entries in per_thread.items():
+            try:
+                recent.append(thread_id, entries)
+            except Exception:
+                logger.exception("Recent-messages append failed for thread %s", thread_id)
+                try:
+                    recent.invalidate(thread_id)
+                except Exception:
+                    # Readers still catch up via the summary's last id
+                    logger.exception("Recent-messages invalidate failed for thread %s", thread_id)
+
+        return results
+
+
+message_writer = MessageWriter()
@@ -0,0 +1,338 @@
+import contextvars
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+# Seconds; covers sub-millisecond cache hits up to slow uploads
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+REGISTRY = []
+COLLECTORS = []
+
+
+# -----------------------------
+# Metric types (Prometheus text format)
+# -----------------------------
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in sorted(items):
+            lines.extend(self.render_value(label_values, value))
+        return lines
+
+    def render_value(self, label_values, value):
+        return [f"{self.name}{format_labels(self.labels, label_values)} {format_number(value)}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram(Metric):
+    """
+    Fixed buckets; observe() is one bisect and three additions.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                # [per-bucket counts (+Inf last), sum, count]
+                state = self._values[label_values] = [
+                    [0] * (len(self.buckets) + 1), 0.0, 0
+                ]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render_value(self, label_values, state):
+        with self._lock:
+            counts, total, count = list(state[0]), state[1], state[2]
+
+        lines = []
+        cumulative = 0
+        bounds = [format_number(bound) for bound in self.buckets] + ["+Inf"]
+        for bound, bucket_count in zip(bounds, counts):
+            cumulative += bucket_count
+            labels = format_labels(
+                self.labels + ("le",), label_values + (bound,)
+            )
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+
+        labels = format_labels(self.labels, label_values)
+        lines.append(f"{self.name}_sum{labels} {format_number(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(
+        '%s="%s"' % (
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def format_number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def register_collector(collect):
+    """
+    `collect()` runs at scrape time and returns
+    [(name, kind, documentation, value)] for values owned elsewhere.
+    """
+    COLLECTORS.append(collect)
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+
+    for collect in COLLECTORS:
+        for name, kind, documentation, value in collect():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {format_number(value)}")
+
+    return "\n".join(lines) + "\n"
+
+
+# -----------------------------
+# Metrics
+# -----------------------------
+http_request_seconds = Histogram(
+    "http_request_duration_seconds",
+    "Time spent in Django views.",
+    labels=("view", "method", "status"),
+)
+http_request_queries = Histogram(
+    "http_request_db_queries",
+    "DB queries per HTTP request.",
+    labels=("view",),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+ws_handler_seconds = Histogram(
+    "ws_handler_duration_seconds",
+    "Time spent in consumer handlers (connect, receive, group events).",
+    labels=("consumer", "handler"),
+)
+ws_handler_queries = Histogram(
+    "ws_handler_db_queries",
+    "DB queries per consumer handler call.",
+    labels=("consumer", "handler"),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+db_helper_seconds = Histogram(
+    "db_helper_duration_seconds",
+    "Time spent in database_sync_to_async helpers, thread hop included.",
+    labels=("helper",),
+)
+db_queries_total = Counter(
+    "db_queries_total",
+    "DB queries executed.",
+)
+db_query_seconds_total = Counter(
+    "db_query_seconds_total",
+    "Time spent executing DB queries.",
+)
+ws_active_sockets = Gauge(
+    "ws_active_sockets",
+    "Open WebSocket connections in this process.",
+    labels=("consumer",),
+)
+ws_group_memberships = Gauge(
+    "ws_group_memberships",
+    "Channel-layer group memberships held by this process's sockets.",
+)
+channel_layer_send_seconds = Histogram(
+    "channel_layer_send_duration_seconds",
+    "Latency of channel-layer group_send calls.",
+)
+
+
+# -----------------------------
+# DB query accounting
+# -----------------------------
+# Per request / per consumer event: [queries, seconds]. Context vars
+# follow sync_to_async into its worker thread, so helper queries count
+# toward the event that awaited them.
+_query_stats = contextvars.ContextVar("query_stats", default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        db_queries_total.inc()
+        db_query_seconds_total.inc(amount=elapsed)
+
+        stats = _query_stats.get()
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += elapsed
+
+
+def install_query_counter(sender=None, connection=None, **kwargs):
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+connection_created.connect(install_query_counter)
+for _connection in connections.all(initialized_only=True):
+    install_query_counter(connection=_connection)
+
+
+def start_query_stats():
+    stats = [0, 0.0]
+    return stats, _query_stats.set(stats)
+
+
+def stop_query_stats(token):
+    _query_stats.reset(token)
+
+
+# -----------------------------
+# Instrumentation helpers
+# -----------------------------
+def db_helper(func):
+    """
+    database_sync_to_async, plus a timing histogram per helper.
+    """
+    helper = database_sync_to_async(func)
+    name = func.__qualname__
+
+    @wraps(func)
+    async def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await helper(*args, **kwargs)
+        finally:
+            db_helper_seconds.observe(time.perf_counter() - started, name)
+
+    return timed
+
+
+async def timed_group_send(channel_layer, group, message):
+    started = time.perf_counter()
+    try:
+        await channel_layer.group_send(group, message)
+    finally:
+        channel_layer_send_seconds.observe(time.perf_counter() - started)
+
+
+class MetricsMiddleware:
+    """
+    Per-view latency and DB query count for every HTTP request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats, token = start_query_stats()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_query_stats(token)
+
+        view = view_label(request)
+        http_request_seconds.observe(
+            time.perf_counter() - started,
+            view, request.method, response.status_code
+        )
+        http_request_queries.observe(stats[0], view)
+        return response
+
+
+def view_label(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    func = getattr(match.func, "view_class", match.func)
+    return getattr(func, "__name__", "unknown")
+
+
+def metrics_view(request):
+    # Shared secret: METRICS_TOKEN="..." → "Authorization: Bearer ...".
+    # Without a token, scrapes are only open in DEBUG.
+    token = getattr(settings, "METRICS_TOKEN", None)
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponseForbidden()
+    elif not hmac.compare_digest(
+        request.headers.get("Authorization", "").encode(),
+        f"Bearer {token}".encode()
+    ):
+        return HttpResponseForbidden()
+
+    return HttpResponse(
+        render(),
+        content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
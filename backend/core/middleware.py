@@ -1,10 +1,17 @@
 import jwt
-from django.conf import settings
-from django.contrib.auth import get_user_model
+import logging
 from urllib.parse import parse_qs
-from channels.db import database_sync_to_async
 
-User = get_user_model()
+from . import metrics, usercache
+
+logger = logging.getLogger(__name__)
+
+
+ws_auth_failures = metrics.Counter(
+    "ws_auth_failures_total",
+    "WebSocket handshakes left anonymous, by reason.",
+    labels=("reason",),
+)
 
 
 class JWTAuthMiddleware:
@@ -42,41 +49,41 @@ class JWTAuthMiddleware:
         # ------------------------------------
         if token:
             try:
-                # Match SimpleJWT: "user_id" field
-                payload = jwt.decode(
-                    token,
-                    settings.SECRET_KEY,
-                    algorithms=["HS256"]
-                )
-                user_id = payload.get("user_id")
+                # Match SimpleJWT: "user_id" field (claims cached until exp)
+                user_id = usercache.verify_token(token)
 
                 if user_id:
-                    user = await self.get_user(user_id)
+                    # Hot path: process-local cache, no thread hop, no DB
+                    user = usercache.get_cached_user(user_id)
+                    if user is None:
+                        user = await self.get_user(user_id)
 
                     # IMPORTANT: must be a Django User object
                     if user:
                         scope["user"] = user
                     else:
-                        print("JWT MIDDLEWARE: user not found")
+                        logger.debug("WS auth: user %s not found", user_id)
+                        ws_auth_failures.inc("user_not_found")
                 else:
-                    print("JWT MIDDLEWARE: user_id missing")
+                    logger.debug("WS auth: token has no user_id")
+                    ws_auth_failures.inc("user_id_missing")
 
             except jwt.ExpiredSignatureError:
-                print("JWT MIDDLEWARE: token expired")
+                logger.debug("WS auth: token expired")
+                ws_auth_failures.inc("expired")
             except jwt.InvalidTokenError:
-                print("JWT MIDDLEWARE: invalid token")
+                logger.debug("WS auth: invalid token")
+                ws_auth_failures.inc("invalid")
 
         else:
-            print("JWT MIDDLEWARE: No token in request")
+            logger.debug("WS auth: no token in request")
+            ws_auth_failures.inc("no_token")
 
         return await self.inner(scope, receive, send)
 
     # ------------------------------------
-    # DB fetch must be sync → wrapped async
+    # Shared cache / DB fetch must be sync → wrapped async
     # ------------------------------------
-    @database_sync_to_async
+    @metrics.db_helper
     def get_user(self, user_id):
-        try:
-            return User.objects.get(id=user_id)
-        except User.DoesNotExist:
-            return None
\ No newline at end of file
+        return usercache.get_user(user_id)
@@ -49,6 +49,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -88,6 +89,14 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Shared cache (presence refcounts, online flags, block lists, thread members)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": "redis://127.0.0.1:6379/1",
+    },
+}
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
     "http://127.0.0.1:5173",
@@ -182,3 +191,80 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = 'static/'
+
+
+# Chat tuning
+
+# Seconds a connection buffers delivery acks before flushing them as one update
+CHAT_DELIVERY_FLUSH_DELAY = 0.2
+
+# Seconds without a typing frame before "stopped typing" is sent for the user
+CHAT_TYPING_TIMEOUT = 5
+
+# Per-socket outbound queue: frames are batched for clients that connect with
+# ?batch=1, typing/presence are merged or dropped under pressure, and a client
+# stuck above the high-water mark for the timeout is disconnected (code 4008).
+# That last part needs a server whose send() blocks on a full socket; Daphne
+# buffers every frame in Twisted, so under Daphne it never fires.
+CHAT_OUTBOUND_MAX_QUEUE = 500
+CHAT_OUTBOUND_HIGH_WATER = 200
+CHAT_OUTBOUND_SLOW_TIMEOUT = 10  # seconds
+CHAT_OUTBOUND_MAX_BATCH = 50
+
+# Reconnect with ?last_message_id=N replays up to this many missed messages
+# in batches; further behind, the client gets {"type": "resync"} instead
+CHAT_REPLAY_MAX_MESSAGES = 200
+CHAT_REPLAY_BATCH_SIZE = 50
+
+# WebSocket messages are group-committed: up to N rows or every few ms
+CHAT_WRITE_BATCH_SIZE = 100
+CHAT_WRITE_BATCH_DELAY = 0.005  # seconds
+
+# Resumable chunked uploads (large media such as video)
+CHAT_MAX_CHUNKED_UPLOAD_SIZE = 512 * 1024 * 1024  # 512MB
+CHAT_UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024  # suggested chunk size
+CHAT_UPLOAD_TEMP_DIR = BASE_DIR / "tmp" / "chat_uploads"
+CHAT_UPLOAD_SESSION_TTL = 24 * 60 * 60  # unfinished uploads expire (cleanupuploads)
+
+# Image thumbnails are rendered off-request by a process pool
+CHAT_PREVIEW_WORKERS = 2
+CHAT_PREVIEW_MAX_SIZE = 320  # px, longest side
+
+# Message search: defaults to the SQLite FTS5 index on sqlite and a
+# portable icontains backend elsewhere. Point at any chat.search backend.
+# CHAT_SEARCH_BACKEND = "chat.search.BasicSearchBackend"
+
+
+# Presence
+
+# Seconds a socket's presence entry lives without a heartbeat
+PRESENCE_TTL = 90
+# Seconds between server-side heartbeats per open socket
+PRESENCE_HEARTBEAT_INTERVAL = 30
+# Seconds between bulk last_seen/is_online writes
+PRESENCE_FLUSH_INTERVAL = 15
+
+# Seconds a user's cached blocked-id set lives (invalidated when blocks change)
+BLOCK_CACHE_TTL = 60 * 60
+
+# Seconds a thread's cached member set lives (versioned, bumped on change)
+THREAD_MEMBERS_CACHE_TTL = 60 * 60
+
+# Newest messages per thread kept in the shared cache (chat.recent) to serve
+# the first page of a chat without the DB; versioned, bumped on delete
+CHAT_RECENT_MESSAGES_SIZE = 50
+CHAT_RECENT_MESSAGES_TTL = 60 * 60
+
+
+# WebSocket handshake auth cache (core.usercache)
+
+WS_USER_CACHE_LOCAL_TTL = 30  # seconds, per process
+WS_USER_CACHE_SHARED_TTL = 300  # seconds, shared cache
+WS_USER_CACHE_SIZE = 10000
+WS_TOKEN_CACHE_SIZE = 10000
+
+
+# Metrics (core.metrics): Prometheus text at /metrics.
+# Scrapes need "Authorization: Bearer <token>"; with no token set,
+# /metrics is only served while DEBUG is on.
+METRICS_TOKEN = None
@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.urls import path, include
+from core.metrics import metrics_view
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
@@ -14,4 +15,7 @@ urlpatterns = [
     # Users app URLs
     path('api/auth/', include('users.urls')),
     path("api/chat/", include("chat.urls")),
+
+    # Prometheus scrape target (bearer METRICS_TOKEN; open only in DEBUG without one)
+    path("metrics", metrics_view, name="metrics"),
 ]
\ No newline at end of file
@@ -0,0 +1,168 @@
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+User = get_user_model()
+
+# Process-local tier: short TTL, since other workers can't invalidate it
+LOCAL_TTL = getattr(settings, "WS_USER_CACHE_LOCAL_TTL", 30)
+LOCAL_SIZE = getattr(settings, "WS_USER_CACHE_SIZE", 10000)
+# Shared tier (CACHES["default"]): deleted on profile update / deactivation
+SHARED_TTL = getattr(settings, "WS_USER_CACHE_SHARED_TTL", 300)
+TOKEN_CACHE_SIZE = getattr(settings, "WS_TOKEN_CACHE_SIZE", 10000)
+
+# Everything but the password hash, which has no business in a shared cache
+CACHED_FIELDS = [
+    field.attname for field in User._meta.concrete_fields
+    if field.attname != "password"
+]
+
+
+class TTLCache:
+    """
+    Small thread-safe LRU with a per-entry expiry.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local_users = TTLCache(LOCAL_SIZE, LOCAL_TTL)
+_verified_tokens = TTLCache(TOKEN_CACHE_SIZE, LOCAL_TTL)
+
+
+def shared_key(user_id):
+    return f"ws_user_{user_id}"
+
+
+# -----------------------------
+# Token claims
+# -----------------------------
+def verify_token(token):
+    """
+    Return the user_id of a valid token. Decoded claims are reused
+    until the token expires, so reconnects skip the signature check.
+    Raises jwt.InvalidTokenError (incl. ExpiredSignatureError).
+    """
+    user_id = _verified_tokens.get(token)
+    if user_id is not None:
+        return user_id
+
+    payload = jwt.decode(
+        token,
+        settings.SECRET_KEY,
+        algorithms=["HS256"]
+    )
+    user_id = payload.get("user_id")
+    if not user_id:
+        return None
+
+    # SimpleJWT may encode the id as a string; cache keys use ints
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        raise jwt.InvalidTokenError("user_id is not an integer")
+
+    exp = payload.get("exp")
+    if exp:
+        _verified_tokens.set(token, user_id, ttl=exp - time.time())
+
+    return user_id
+
+
+# -----------------------------
+# Users
+# -----------------------------
+def _to_user(fields):
+    # Built like a queryset row with `password` deferred: reading it hits
+    # the DB, and save() only writes the loaded fields, never a blank hash
+    return User.from_db(
+        "default", CACHED_FIELDS, [fields[name] for name in CACHED_FIELDS]
+    )
+
+
+def get_cached_user(user_id):
+    """
+    Process-local lookup only; safe to call from async code.
+    """
+    fields = _local_users.get(user_id)
+    return _to_user(fields) if fields is not None else None
+
+
+def get_user(user_id):
+    """
+    Local tier → shared cache → database. Blocking: call through
+    database_sync_to_async from async code.
+    """
+    fields = _local_users.get(user_id)
+
+    if fields is None:
+        fields = cache.get(shared_key(user_id))
+
+        if fields is None:
+            fields = User.objects.filter(
+                id=user_id, is_active=True
+            ).values(*CACHED_FIELDS).first()
+            if fields is None:
+                return None
+            cache.set(shared_key(user_id), fields, SHARED_TTL)
+
+        _local_users.set(user_id, fields)
+
+    return _to_user(fields)
+
+
+def invalidate_user(user_id):
+    invalidate_users([user_id])
+
+
+def invalidate_users(user_ids):
+    """
+    Drop cached users. post_save/post_delete handle single saves;
+    queryset update()/bulk_update() fire no signals, so callers of
+    those must invalidate explicitly.
+    """
+    for user_id in user_ids:
+        _local_users.pop(user_id)
+    cache.delete_many([shared_key(user_id) for user_id in user_ids])
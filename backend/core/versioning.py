@@ -0,0 +1,26 @@
+import time
+
+from django.core.cache import cache
+
+
+# -----------------------------
+# Versioned cache keys
+# -----------------------------
+# Data is cached under "<name>_<version>"; bumping the version orphans
+# every copy at once, including one a slow reader is about to write
+# back from stale rows (chat.membership, chat.recent).
+def current(version_key):
+    version = cache.get(version_key)
+    if version is None:
+        # Clock-seeded so an evicted counter never reuses an old version
+        cache.add(version_key, time.time_ns(), None)
+        version = cache.get(version_key)
+    return version
+
+
+def bump(version_key):
+    try:
+        cache.incr(version_key)
+    except ValueError:
+        # No version yet → nothing cached under one either
+        pass
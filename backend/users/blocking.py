@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import User
+
+BLOCK_CACHE_TTL = getattr(settings, "BLOCK_CACHE_TTL", 60 * 60)
+
+
+def cache_key(user_id):
+    return f"blocked_ids_{user_id}"
+
+
+def blocked_map(user_ids):
+    """
+    {user_id: frozenset(ids that user has blocked)} for every id given,
+    from one cache get_many; only misses go to the database.
+    """
+    user_ids = set(user_ids)
+    found = cache.get_many([cache_key(user_id) for user_id in user_ids])
+    result = {
+        user_id: found[cache_key(user_id)]
+        for user_id in user_ids
+        if cache_key(user_id) in found
+    }
+
+    missing = user_ids - result.keys()
+    if missing:
+        loaded = {user_id: set() for user_id in missing}
+        rows = User.blocked_users.through.objects.filter(
+            from_user_id__in=missing
+        ).values_list("from_user_id", "to_user_id")
+
+        for blocker_id, blocked_id in rows:
+            loaded[blocker_id].add(blocked_id)
+
+        loaded = {user_id: frozenset(ids) for user_id, ids in loaded.items()}
+        cache.set_many(
+            {cache_key(user_id): ids for user_id, ids in loaded.items()},
+            BLOCK_CACHE_TTL
+        )
+        result.update(loaded)
+
+    return result
+
+
+def is_blocked(user_id, other_id):
+    """
+    True if either user has blocked the other.
+    """
+    return any_blocked(user_id, [other_id])
+
+
+def any_blocked(user_id, other_ids):
+    """
+    True if a block exists in either direction between user_id and
+    any of other_ids.
+    """
+    other_ids = set(other_ids) - {user_id}
+    if not other_ids:
+        return False
+
+    blocks = blocked_map(other_ids | {user_id})
+
+    if blocks[user_id] & other_ids:
+        return True
+    return any(user_id in blocks[other_id] for other_id in other_ids)
+
+
+def invalidate(user_id):
+    cache.delete(cache_key(user_id))
@@ -0,0 +1,25 @@
+# Generated by Django 6.0 on 2026-10-18 04:52
+
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+
+def backfill_username_lower(apps, schema_editor):
+    User = apps.get_model("users", "User")
+    User.objects.update(username_lower=Lower("username"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_blocked_users'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='username_lower',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=150),
+        ),
+        migrations.RunPython(backfill_username_lower, migrations.RunPython.noop),
+    ]
@@ -19,6 +19,8 @@ class UserManager(BaseUserManager):
 
 class User(AbstractBaseUser, PermissionsMixin):
     username = models.CharField(max_length=150, unique=True)
+    # Lowercased copy for indexed prefix search (users.search)
+    username_lower = models.CharField(max_length=150, db_index=True, editable=False, default="")
     avatar = models.ImageField(upload_to="avatars/", blank=True, null=True)
     bio = models.TextField(blank=True)
     following = models.ManyToManyField("self", symmetrical=False, related_name="followers", blank=True)
@@ -41,4 +43,11 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = "username"
 
     def __str__(self):
-        return self.username
\ No newline at end of file
+        return self.username
+
+    def save(self, *args, **kwargs):
+        self.username_lower = self.username.lower()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "username" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "username_lower"}
+        super().save(*args, **kwargs)
@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from core import usercache
+
+from .models import User
+
+PRESENCE_TTL = getattr(settings, "PRESENCE_TTL", 90)
+PRESENCE_FLUSH_INTERVAL = getattr(settings, "PRESENCE_FLUSH_INTERVAL", 15)
+PRESENCE_LOCK_TIMEOUT = 5
+
+logger = logging.getLogger(__name__)
+
+
+def online_key(user_id):
+    return f"user_online_{user_id}"
+
+
+def connections_key(user_id):
+    return f"user_connections_{user_id}"
+
+
+def lock_key(user_id):
+    return f"user_connections_lock_{user_id}"
+
+
+# -----------------------------
+# Open connections (shared cache)
+# -----------------------------
+# One key per user: {connection_id: expires_at}. Every socket refreshes
+# its own deadline, so a connection whose worker died expires on its
+# own even while the user's other tabs keep heartbeating.
+@contextmanager
+def _locked(user_id):
+    lock = lock_key(user_id)
+    deadline = time.monotonic() + 1
+    acquired = cache.add(lock, 1, PRESENCE_LOCK_TIMEOUT)
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(0.005)
+        acquired = cache.add(lock, 1, PRESENCE_LOCK_TIMEOUT)
+
+    # Not acquired after a second: the holder most likely died, go ahead
+    try:
+        yield
+    finally:
+        if acquired:
+            cache.delete(lock)
+
+
+def _live_connections(user_id):
+    now = time.time()
+    connections = cache.get(connections_key(user_id)) or {}
+    return {
+        connection_id: expires_at
+        for connection_id, expires_at in connections.items()
+        if expires_at > now
+    }
+
+
+def _store(user_id, connections):
+    if connections:
+        cache.set(connections_key(user_id), connections, PRESENCE_TTL)
+        cache.set(online_key(user_id), True, PRESENCE_TTL)
+    else:
+        cache.delete_many([connections_key(user_id), online_key(user_id)])
+
+
+def connect(user_id, connection_id):
+    """
+    Register an open socket (connection_id: its channel name).
+    Returns True only on the offline → online edge.
+    """
+    with _locked(user_id):
+        connections = _live_connections(user_id)
+        was_online = bool(connections)
+        connections[connection_id] = time.time() + PRESENCE_TTL
+        _store(user_id, connections)
+    return not was_online
+
+
+def disconnect(user_id, connection_id):
+    """
+    Drop one open socket.
+    Returns True only on the online → offline edge.
+    """
+    with _locked(user_id):
+        connections = _live_connections(user_id)
+        connections.pop(connection_id, None)
+        _store(user_id, connections)
+    return not connections
+
+
+def heartbeat(user_id, connection_id):
+    """
+    Keep this socket's entry alive while it is open. If a worker dies
+    without disconnecting, its entries expire after PRESENCE_TTL.
+    """
+    with _locked(user_id):
+        connections = _live_connections(user_id)
+        connections[connection_id] = time.time() + PRESENCE_TTL
+        _store(user_id, connections)
+
+
+def is_online(user_id):
+    return bool(cache.get(online_key(user_id)))
+
+
+def online_map(user_ids):
+    """
+    Presence for many users in one cache round-trip: {user_id: bool}.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return {}
+
+    found = cache.get_many([online_key(user_id) for user_id in user_ids])
+    return {
+        user_id: bool(found.get(online_key(user_id)))
+        for user_id in user_ids
+    }
+
+
+# -----------------------------
+# Batched last_seen persistence
+# -----------------------------
+class LastSeenBuffer:
+    """
+    Collects online/offline transitions in memory and writes them to
+    the users table in one bulk UPDATE every PRESENCE_FLUSH_INTERVAL
+    seconds, instead of one UPDATE per socket event.
+
+    A failed write is re-queued for the next interval. Marks still
+    pending when the worker stops are lost (last_seen is best-effort,
+    presence itself lives in the cache).
+    """
+
+    def __init__(self, interval=PRESENCE_FLUSH_INTERVAL):
+        self.interval = interval
+        self.pending = {}
+        self._task = None
+
+    def mark(self, user_id, is_online):
+        self.pending[user_id] = (timezone.now(), is_online)
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._flush_periodically())
+
+    async def _flush_periodically(self):
+        while self.pending:
+            await asyncio.sleep(self.interval)
+            try:
+                await database_sync_to_async(self.flush)()
+            except Exception:
+                logger.exception("last_seen flush failed, retrying")
+
+    def flush(self):
+        pending, self.pending = self.pending, {}
+        if not pending:
+            return 0
+
+        users = [
+            User(id=user_id, last_seen=seen_at, is_online=online)
+            for user_id, (seen_at, online) in pending.items()
+        ]
+        try:
+            User.objects.bulk_update(users, ["last_seen", "is_online"])
+        except Exception:
+            # Back in the queue; marks made meanwhile are newer and win
+            for user_id, mark in pending.items():
+                self.pending.setdefault(user_id, mark)
+            raise
+
+        # bulk_update skips post_save, so the socket user cache must be told
+        usercache.invalidate_users(pending)
+        return len(users)
+
+
+last_seen_buffer = LastSeenBuffer()
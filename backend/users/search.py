@@ -0,0 +1,75 @@
+from django.db import connection
+from django.db.models import Q
+from django.db.models.functions import Length
+
+from .models import User
+
+MAX_RESULTS = 20
+
+# Sorts after every real character: [q, q + PREFIX_END) is "starts with q".
+# Only true under codepoint (binary) ordering, i.e. SQLite's default;
+# ICU/glibc collations on Postgres/MySQL can sort rows outside the range
+PREFIX_END = "\U0010ffff"
+
+
+def encode_after(user):
+    return f"{user.username_lower}:{user.id}"
+
+
+def decode_after(after):
+    """
+    "<username_lower>:<id>" → (username_lower, id); ValueError if malformed.
+    """
+    username_lower, _, user_id = after.rpartition(":")
+    return username_lower, int(user_id)
+
+
+def prefix_filter(prefix):
+    if connection.vendor == "sqlite":
+        # Index range scan, exact under SQLite's binary collation
+        return Q(username_lower__gte=prefix, username_lower__lt=prefix + PREFIX_END)
+    # LIKE 'q%': correct under any collation (indexed on Postgres with a
+    # varchar_pattern_ops / "C" index on username_lower)
+    return Q(username_lower__startswith=prefix)
+
+
+def search_users(query, exclude_id=None, limit=MAX_RESULTS, after=None):
+    """
+    Prefix search on the indexed username_lower column.
+
+    Ranked: the exact match first, then shorter completions before
+    longer ones, alphabetical within a length, id breaking ties between
+    names that only differ in case. `after` is the previous page's
+    cursor from encode_after(); the length part of the sort key is
+    derived from the name, so the cursor doesn't carry it.
+
+    Returns (users, next_after). Raises ValueError for a bad cursor.
+    """
+    prefix = query.strip().lower()
+    if not prefix:
+        return [], None
+
+    limit = max(1, min(limit, MAX_RESULTS))
+
+    users = User.objects.filter(
+        prefix_filter(prefix),
+        is_active=True
+    ).annotate(
+        name_length=Length("username_lower")
+    )
+
+    if after:
+        after_name, after_id = decode_after(after)
+        after_length = len(after_name)
+        users = users.filter(
+            Q(name_length__gt=after_length)
+            | Q(name_length=after_length, username_lower__gt=after_name)
+            | Q(name_length=after_length, username_lower=after_name, id__gt=after_id)
+        )
+
+    if exclude_id is not None:
+        users = users.exclude(id=exclude_id)
+
+    rows = list(users.order_by("name_length", "username_lower", "id")[:limit + 1])
+    next_after = encode_after(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_after
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from .models import User
-from django.core.cache import cache
+from . import presence
+from django.db.models.manager import BaseManager
 from django.utils import timezone
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -18,6 +19,24 @@ class RegisterSerializer(serializers.ModelSerializer):
         return user
 
 
+def prefetch_presence(context, user_ids):
+    """
+    Load presence for user_ids into the shared serializer context with
+    a single get_many, skipping users already looked up.
+    """
+    known = context.setdefault("presence", {})
+    missing = set(user_ids) - known.keys()
+    if missing:
+        known.update(presence.online_map(missing))
+
+
+class UserListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        users = list(data.all() if isinstance(data, BaseManager) else data)
+        prefetch_presence(self.context, [user.id for user in users])
+        return super().to_representation(users)
+
+
 class UserSerializer(serializers.ModelSerializer):
     is_online = serializers.SerializerMethodField()
     last_seen_display = serializers.SerializerMethodField()
@@ -25,36 +44,44 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ["id", "username", "avatar", "bio", "is_online", "last_seen", "last_seen_display"]
+        list_serializer_class = UserListSerializer
 
 
     def get_is_online(self, obj):
-        return bool(cache.get(f"user_online_{obj.id}"))
+        known = self.context.get("presence")
+        if known is not None and obj.id in known:
+            return known[obj.id]
+        return presence.is_online(obj.id)
     
 
     def get_last_seen_display(self, obj):
-        # 🟢 User is online
-        if obj.is_online:
-            return "Online"
-
-        if not obj.last_seen:
-            return "Offline"
-
-        now = timezone.now()
-        diff = now - obj.last_seen
-
-        seconds = diff.total_seconds()
-
-        if seconds < 60:
-            return "Last seen just now"
-        elif seconds < 3600:
-            minutes = int(seconds // 60)
-            return f"Last seen {minutes} min ago"
-        elif seconds < 86400:
-            hours = int(seconds // 3600)
-            return f"Last seen {hours} hour ago"
-        else:
-            days = int(seconds // 86400)
-            return f"Last seen {days} day ago"    
+        return describe_last_seen(obj.is_online, obj.last_seen)
+
+
+def describe_last_seen(is_online, last_seen):
+    # 🟢 User is online
+    if is_online:
+        return "Online"
+
+    if not last_seen:
+        return "Offline"
+
+    now = timezone.now()
+    diff = now - last_seen
+
+    seconds = diff.total_seconds()
+
+    if seconds < 60:
+        return "Last seen just now"
+    elif seconds < 3600:
+        minutes = int(seconds // 60)
+        return f"Last seen {minutes} min ago"
+    elif seconds < 86400:
+        hours = int(seconds // 3600)
+        return f"Last seen {hours} hour ago"
+    else:
+        days = int(seconds // 86400)
+        return f"Last seen {days} day ago"    
 
 
 class UpdateProfileSerializer(serializers.ModelSerializer):
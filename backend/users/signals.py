@@ -0,0 +1,33 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from core.usercache import invalidate_user
+from . import blocking
+from .models import User
+
+
+# Profile edits / deactivation must not be served from the WebSocket user cache
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    invalidate_user(instance.id)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    invalidate_user(instance.id)
+
+
+# Cached block lists are keyed by the blocker, whichever side changed
+@receiver(m2m_changed, sender=User.blocked_users.through)
+def blocks_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+
+    if not reverse:
+        blocking.invalidate(instance.id)
+    elif action == "pre_clear":
+        for blocker_id in instance.blocked_by.values_list("id", flat=True):
+            blocking.invalidate(blocker_id)
+    else:
+        for blocker_id in pk_set:
+            blocking.invalidate(blocker_id)
@@ -1,3 +1,268 @@
-from django.test import TestCase
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core import usercache
+
+from . import blocking, presence
+from .models import User
+
+# No Redis needed: presence and caches live in a local cache
+TEST_SETTINGS = {
+    "CACHES": {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    },
+}
+
+TIME_BUDGET = 1.0  # seconds per request on the large fixture
+
+
+@override_settings(**TEST_SETTINGS)
+class UserQueryBudgetTests(TestCase):
+    """
+    Same request against few and many matching users: the query count
+    must not change and must stay within budget.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.me = User.objects.create_user(username="searcher", password=None)
+
+        for n in range(3):
+            User.objects.create_user(username=f"few_{n}", password=None)
+        for n in range(60):
+            User.objects.create_user(username=f"many_{n:02d}", password=None)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+        # Some of them online, so presence is actually looked up
+        for user in User.objects.filter(username__in=["few_0", "many_00", "many_10"]):
+            presence.connect(user.id, f"test-{user.id}")
+
+    def measure(self, path, params):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = self.client.get(path, params)
+            elapsed = time.perf_counter() - started
+
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(queries), elapsed, response.json()
+
+    def test_user_search(self):
+        small, _, few = self.measure("/api/auth/search/", {"q": "few"})
+        large, elapsed, many = self.measure("/api/auth/search/", {"q": "many"})
+
+        self.assertEqual(len(few["results"]), 3)
+        self.assertEqual(len(many["results"]), 20)
+        self.assertEqual(small, large, "query count grows with data size")
+        self.assertLessEqual(large, 1)
+        self.assertLess(elapsed, TIME_BUDGET)
+
+    def test_online_status_batch(self):
+        few_ids = User.objects.filter(username__startswith="few").values_list("id", flat=True)
+        many_ids = User.objects.filter(username__startswith="many").values_list("id", flat=True)
+
+        small, _, _ = self.measure(
+            "/api/auth/online-status/", {"ids": ",".join(map(str, few_ids))}
+        )
+        large, elapsed, _ = self.measure(
+            "/api/auth/online-status/", {"ids": ",".join(map(str, many_ids))}
+        )
+
+        self.assertEqual(small, large, "query count grows with data size")
+        self.assertLessEqual(large, 1)
+        self.assertLess(elapsed, TIME_BUDGET)
+
+
+@override_settings(**TEST_SETTINGS)
+class PresenceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_tabs_are_counted_per_connection(self):
+        self.assertTrue(presence.connect(1, "tab-a"))
+        self.assertFalse(presence.connect(1, "tab-b"))
+        self.assertFalse(presence.connect(1, "tab-b"))  # idempotent
+
+        self.assertFalse(presence.disconnect(1, "tab-a"))
+        self.assertTrue(presence.is_online(1))
+        self.assertTrue(presence.disconnect(1, "tab-b"))
+        self.assertFalse(presence.is_online(1))
+
+    def test_crashed_connection_expires_while_other_tab_heartbeats(self):
+        started = time.time()
+        presence.connect(1, "crashed")
+        presence.connect(1, "alive")
+
+        later = started + presence.PRESENCE_TTL / 2
+        with mock.patch("users.presence.time.time", return_value=later):
+            presence.heartbeat(1, "alive")
+
+        much_later = started + presence.PRESENCE_TTL + 1
+        with mock.patch("users.presence.time.time", return_value=much_later):
+            # Only "alive" is left: its disconnect is the offline edge
+            self.assertTrue(presence.disconnect(1, "alive"))
+
+    def test_heartbeat_after_expiry_does_not_undercount(self):
+        presence.connect(1, "tab-a")
+        presence.connect(1, "tab-b")
+        cache.delete(presence.connections_key(1))  # evicted
+
+        presence.heartbeat(1, "tab-a")
+        presence.heartbeat(1, "tab-b")
+        self.assertFalse(presence.disconnect(1, "tab-a"))
+        self.assertTrue(presence.is_online(1))
+
+
+@override_settings(**TEST_SETTINGS)
+class LastSeenBufferTests(TestCase):
+    def test_failed_flush_is_requeued(self):
+        user = User.objects.create_user(username="seen", password=None)
+        buffer = presence.LastSeenBuffer()
+        buffer.pending[user.id] = (timezone.now(), True)
+
+        with mock.patch.object(User.objects, "bulk_update", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                buffer.flush()
+        self.assertIn(user.id, buffer.pending)
+
+        self.assertEqual(buffer.flush(), 1)
+        user.refresh_from_db()
+        self.assertTrue(user.is_online)
+        self.assertEqual(buffer.pending, {})
+
+
+@override_settings(**TEST_SETTINGS)
+class UserCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        usercache._local_users.clear()
+        self.user = User.objects.create_user(username="cached", password="s3cret-pass")
+
+    def test_password_hash_not_cached(self):
+        usercache.get_user(self.user.id)
+
+        cached = cache.get(usercache.shared_key(self.user.id))
+        self.assertNotIn("password", cached)
+        self.assertEqual(cached["username"], "cached")
+
+    def test_cached_user_save_keeps_password(self):
+        user = usercache.get_user(self.user.id)
+        user.bio = "hello"
+        user.save()
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.bio, "hello")
+        self.assertTrue(self.user.check_password("s3cret-pass"))
+
+    def test_last_seen_flush_invalidates(self):
+        usercache.get_user(self.user.id)
+
+        buffer = presence.LastSeenBuffer()
+        buffer.pending[self.user.id] = (timezone.now(), True)
+        buffer.flush()
+
+        self.assertIsNone(cache.get(usercache.shared_key(self.user.id)))
+        self.assertTrue(usercache.get_user(self.user.id).is_online)
+
+
+@override_settings(**TEST_SETTINGS)
+class UserSearchPaginationTests(TestCase):
+    def setUp(self):
+        self.me = User.objects.create_user(username="pager", password=None)
+        for username in ["bob_zzz", "Bob", "bobby", "bob", "boba", "BOB", "bo_b"]:
+            User.objects.create_user(username=username, password=None)
+
+    def page_through(self, limit, query="bo"):
+        client = APIClient()
+        client.force_authenticate(self.me)
+
+        names, after = [], None
+        while True:
+            params = {"q": query, "limit": limit}
+            if after:
+                params["after"] = after
+            response = client.get("/api/auth/search/", params)
+            self.assertEqual(response.status_code, 200, response.content)
+            names += [user["username"] for user in response.data["results"]]
+            after = response.data["after"]
+            if not after:
+                return names
+
+    def test_case_variants_not_skipped_across_pages(self):
+        for limit in (1, 2, 3):
+            names = self.page_through(limit)
+            self.assertEqual(
+                sorted(names),
+                sorted(["bob_zzz", "Bob", "bobby", "bob", "boba", "BOB", "bo_b"])
+            )
+            self.assertEqual(len(names), len(set(names)))
+
+    def test_exact_then_shorter_first(self):
+        for limit in (1, 2, 20):
+            self.assertEqual(
+                self.page_through(limit, query="bob"),
+                # Case variants of the exact match in signup order
+                ["Bob", "bob", "BOB", "boba", "bobby", "bob_zzz"]
+            )
+
+    def test_bad_cursor_rejected(self):
+        client = APIClient()
+        client.force_authenticate(self.me)
+        response = client.get("/api/auth/search/", {"q": "bo", "after": "bob:x"})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(**TEST_SETTINGS)
+class BlockCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username="alice", password=None)
+        self.bob = User.objects.create_user(username="bob", password=None)
+        self.carol = User.objects.create_user(username="carol", password=None)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_block_either_direction(self):
+        self.assertFalse(blocking.is_blocked(self.alice.id, self.bob.id))
+
+        self.client_for(self.bob).post(f"/api/auth/block/{self.alice.id}/")
+        self.assertTrue(blocking.is_blocked(self.alice.id, self.bob.id))
+        self.assertTrue(blocking.is_blocked(self.bob.id, self.alice.id))
+        self.assertTrue(blocking.any_blocked(self.alice.id, [self.carol.id, self.bob.id]))
+        self.assertFalse(blocking.any_blocked(self.alice.id, [self.carol.id]))
+
+    def test_cached_lists_skip_the_db(self):
+        blocking.blocked_map([self.alice.id, self.bob.id])
+
+        with CaptureQueriesContext(connection) as queries:
+            blocking.is_blocked(self.alice.id, self.bob.id)
+        self.assertEqual(len(queries), 0)
+
+    def test_unblock_invalidates(self):
+        self.client_for(self.alice).post(f"/api/auth/block/{self.bob.id}/")
+        self.assertTrue(blocking.is_blocked(self.bob.id, self.alice.id))
+
+        response = self.client_for(self.alice).post(f"/api/auth/unblock/{self.bob.id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(blocking.is_blocked(self.bob.id, self.alice.id))
+
+    def test_reverse_side_changes_invalidate(self):
+        # Edited from the blocked user's side of the relation
+        self.bob.blocked_by.add(self.alice)
+        self.assertTrue(blocking.is_blocked(self.alice.id, self.bob.id))
+
+        self.bob.blocked_by.clear()
+        self.assertFalse(blocking.is_blocked(self.alice.id, self.bob.id))
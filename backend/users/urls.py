@@ -2,7 +2,8 @@ from django.urls import path
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from .views import (
     RegisterView, LoginView, MeView,
-    UpdateProfileView, FollowUserView, UnfollowUserView, UserSearchView, MyProfileView, UserOnlineStatusView
+    UpdateProfileView, FollowUserView, UnfollowUserView, UserSearchView, MyProfileView, UserOnlineStatusView,
+    UserOnlineStatusBatchView, BlockUserView, UnblockUserView
 )
 
 urlpatterns = [
@@ -19,5 +20,8 @@ urlpatterns = [
     path("unfollow/<str:username>/", UnfollowUserView.as_view()),
     path("search/", UserSearchView.as_view(), name="user-search"),
     path("me/", MyProfileView.as_view(), name="my-profile"),
+    path("online-status/", UserOnlineStatusBatchView.as_view()),
     path("online-status/<int:user_id>/", UserOnlineStatusView.as_view()),
+    path("block/<int:user_id>/", BlockUserView.as_view()),
+    path("unblock/<int:user_id>/", UnblockUserView.as_view()),
 ]
\ No newline at end of file
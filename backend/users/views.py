@@ -5,8 +5,8 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from .models import User
-from django.core.cache import cache
-from django.db.models import Q
+from . import presence
+from .search import MAX_RESULTS, search_users
 from .serializers import RegisterSerializer, UserSerializer, UpdateProfileSerializer, PublicUserSerializer
 
 class RegisterView(generics.CreateAPIView):
@@ -83,16 +83,33 @@ class UnfollowUserView(APIView):
         return Response({"message": f"You unfollowed {username}"})
 
 
-class UserSearchView(generics.ListAPIView):
+class UserSearchView(generics.GenericAPIView):
+    """
+    Username autocomplete: ?q=<prefix>&limit=<n>&after=<cursor>
+    """
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-    def get_queryset(self):
-        query = self.request.query_params.get("q", "")
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get("limit", MAX_RESULTS))
+        except ValueError:
+            limit = MAX_RESULTS
 
-        return User.objects.filter(
-            Q(username_icontains=query)
-        ).exclude(id=self.request.user.id)
+        try:
+            users, next_after = search_users(
+                request.query_params.get("q", ""),
+                exclude_id=request.user.id,
+                limit=limit,
+                after=request.query_params.get("after")
+            )
+        except ValueError:
+            return Response({"error": "Invalid cursor"}, status=400)
+
+        return Response({
+            "results": self.get_serializer(users, many=True).data,
+            "after": next_after,
+        })
 
 
 class MyProfileView(APIView):
@@ -122,18 +139,56 @@ class UserOnlineStatusView(APIView):
         except User.DoesNotExist:
             return Response({"error": "User not found"}, status=404)
 
-        is_online = cache.get(f"user_online_{user.id}", False)
-
         return Response({
             "user_id": user.id,
             "username": user.username,
-            "is_online": bool(is_online)
+            "is_online": presence.is_online(user.id)
         })        
 
+class UserOnlineStatusBatchView(APIView):
+    """
+    Presence for many users at once: ?ids=1,2,3
+    """
+    permission_classes = [IsAuthenticated]
+    MAX_IDS = 200
+
+    def get(self, request):
+        raw = request.query_params.get("ids", "")
+
+        try:
+            user_ids = [int(part) for part in raw.split(",") if part.strip()]
+        except ValueError:
+            return Response({"error": "ids must be integers"}, status=400)
+
+        if len(user_ids) > self.MAX_IDS:
+            return Response(
+                {"error": f"At most {self.MAX_IDS} ids per request"},
+                status=400
+            )
+
+        online = presence.online_map(user_ids)
+        return Response([
+            {"user_id": user_id, "is_online": online[user_id]}
+            for user_id in dict.fromkeys(user_ids)
+        ])
+
+
 class BlockUserView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, user_id):
-        other = User.objects.get(id=user_id)
+        try:
+            other = User.objects.get(id=user_id)
+        except User.DoesNotExist:
+            return Response({"error": "User not found"}, status=404)
+
         request.user.blocked_users.add(other)
-        return Response({"status": "blocked"})        
\ No newline at end of file
+        return Response({"status": "blocked"})
+
+
+class UnblockUserView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, user_id):
+        request.user.blocked_users.remove(user_id)
+        return Response({"status": "unblocked"})        
\ No newline at end of file